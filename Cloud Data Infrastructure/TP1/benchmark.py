@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+Benchmark Data Lake vs Data Warehouse
+
+Pose les mêmes questions analytiques à quatre supports, sur des volumes de
+ventes générés :
+- CSV brut du Data Lake (lecture pandas) ;
+- copie Parquet du Data Lake (lecture colonnaire pyarrow) ;
+- table ventes SQLite sans index ;
+- table ventes SQLite avec index.
+
+Pour chaque question on mesure la latence (médiane de plusieurs exécutions)
+et les octets lus (compteur rchar de /proc/self/io, lorsqu'il est disponible).
+Nécessite pandas et pyarrow.
+"""
+
+import argparse
+import csv
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+TAILLES = [10_000, 100_000, 1_000_000]
+REPETITIONS = 3
+CLIENTS = [f"Client{i:04d}" for i in range(2000)]
+PRODUITS = {
+    'PC': 1200, 'Téléphone': 700, 'Écran': 300, 'Clavier': 50, 'Souris': 25,
+    'Tablette': 450, 'Imprimante': 200, 'Casque': 80, 'Webcam': 60, 'Disque': 120,
+}
+CLIENT_CIBLE = CLIENTS[42]
+MOIS_CIBLE = ('2024-06-01', '2024-06-30')
+
+
+# ============================================================================
+# Génération des données
+# ============================================================================
+
+def generer_csv(chemin, nb_lignes, graine=2024):
+    """Génère un fichier de ventes au format du Data Lake (ventes_2024.csv)"""
+    rng = random.Random(graine)
+    debut = date(2024, 1, 1)
+    produits = list(PRODUITS)
+
+    with open(chemin, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Date', 'Client', 'Produit', 'Quantite', 'PrixUnitaire'])
+        for _ in range(nb_lignes):
+            produit = rng.choice(produits)
+            writer.writerow([
+                (debut + timedelta(days=rng.randrange(366))).isoformat(),
+                rng.choice(CLIENTS),
+                produit,
+                rng.randint(1, 10),
+                PRODUITS[produit],
+            ])
+
+
+def creer_parquet(chemin_csv, chemin_parquet):
+    """Copie le CSV brut au format Parquet (une seule fois, hors mesure)"""
+    import pyarrow.csv as pv
+    import pyarrow.parquet as pq
+
+    table = pv.read_csv(chemin_csv)
+    pq.write_table(table, chemin_parquet, compression='snappy', row_group_size=128_000)
+
+
+def creer_sqlite(chemin_csv, chemin_db, avec_index):
+    """Charge le CSV dans une table ventes identique à celle d'etl_script.py"""
+    conn = sqlite3.connect(chemin_db)
+    conn.execute('''
+        CREATE TABLE ventes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT,
+            client TEXT,
+            produit TEXT,
+            quantite INTEGER,
+            prix_unitaire REAL,
+            total REAL
+        )
+    ''')
+    with open(chemin_csv, 'r', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        conn.executemany(
+            '''INSERT INTO ventes (date, client, produit, quantite, prix_unitaire, total)
+               VALUES (?, ?, ?, ?, ?, ?)''',
+            ((row['Date'], row['Client'], row['Produit'], int(row['Quantite']),
+              float(row['PrixUnitaire']), int(row['Quantite']) * float(row['PrixUnitaire']))
+             for row in reader)
+        )
+    if avec_index:
+        conn.execute('CREATE INDEX idx_ventes_date_id ON ventes(date, id)')
+        conn.execute('CREATE INDEX idx_ventes_client_date ON ventes(client, date)')
+        conn.execute('CREATE INDEX idx_ventes_produit_quantite ON ventes(produit, quantite)')
+        conn.execute('CREATE INDEX idx_ventes_date_total ON ventes(date, total)')
+    conn.commit()
+    conn.execute('ANALYZE')
+    conn.close()
+
+
+# ============================================================================
+# Questions analytiques (une implémentation par support)
+# ============================================================================
+
+def questions_csv(chemin):
+    """Questions posées au CSV brut (schema-on-read avec pandas)"""
+    import pandas as pd
+
+    def chiffre_affaires():
+        df = pd.read_csv(chemin, usecols=['Quantite', 'PrixUnitaire'])
+        return float((df['Quantite'] * df['PrixUnitaire']).sum())
+
+    def produit_plus_vendu():
+        df = pd.read_csv(chemin, usecols=['Produit', 'Quantite'])
+        return df.groupby('Produit')['Quantite'].sum().idxmax()
+
+    def ca_par_mois():
+        df = pd.read_csv(chemin, usecols=['Date', 'Quantite', 'PrixUnitaire'])
+        return (df['Quantite'] * df['PrixUnitaire']).groupby(df['Date'].str[:7]).sum().to_dict()
+
+    def ventes_client_mois():
+        df = pd.read_csv(chemin, usecols=['Date', 'Client', 'Quantite', 'PrixUnitaire'])
+        df = df[(df['Client'] == CLIENT_CIBLE) & df['Date'].between(*MOIS_CIBLE)]
+        return len(df)
+
+    return chiffre_affaires, produit_plus_vendu, ca_par_mois, ventes_client_mois
+
+
+def questions_parquet(chemin):
+    """Questions posées à la copie Parquet (lecture des seules colonnes utiles)"""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+
+    def chiffre_affaires():
+        t = pq.read_table(chemin, columns=['Quantite', 'PrixUnitaire'])
+        return pc.sum(pc.multiply(t['Quantite'], t['PrixUnitaire'])).as_py()
+
+    def produit_plus_vendu():
+        t = pq.read_table(chemin, columns=['Produit', 'Quantite'])
+        agg = t.group_by('Produit').aggregate([('Quantite', 'sum')]).sort_by([('Quantite_sum', 'descending')])
+        return agg['Produit'][0].as_py()
+
+    def ca_par_mois():
+        t = pq.read_table(chemin, columns=['Date', 'Quantite', 'PrixUnitaire'])
+        mois = pc.strftime(t['Date'], format='%Y-%m')
+        montants = pc.multiply(t['Quantite'], t['PrixUnitaire'])
+        agg = pa.table({'mois': mois, 'montant': montants}).group_by('mois').aggregate([('montant', 'sum')])
+        return dict(zip(agg['mois'].to_pylist(), agg['montant_sum'].to_pylist()))
+
+    def ventes_client_mois():
+        debut, fin = (date.fromisoformat(d) for d in MOIS_CIBLE)
+        t = pq.read_table(
+            chemin, columns=['Date', 'Client'],
+            filters=[('Client', '=', CLIENT_CIBLE), ('Date', '>=', debut), ('Date', '<=', fin)]
+        )
+        return t.num_rows
+
+    return chiffre_affaires, produit_plus_vendu, ca_par_mois, ventes_client_mois
+
+
+def questions_sqlite(chemin_db):
+    """Questions posées au Data Warehouse SQLite (SQL)"""
+
+    def executer(requete, params=()):
+        conn = sqlite3.connect(chemin_db)
+        try:
+            return conn.execute(requete, params).fetchall()
+        finally:
+            conn.close()
+
+    def chiffre_affaires():
+        return executer('SELECT SUM(total) FROM ventes')[0][0]
+
+    def produit_plus_vendu():
+        return executer('''
+            SELECT produit FROM ventes GROUP BY produit ORDER BY SUM(quantite) DESC LIMIT 1
+        ''')[0][0]
+
+    def ca_par_mois():
+        return dict(executer("SELECT substr(date, 1, 7), SUM(total) FROM ventes GROUP BY 1"))
+
+    def ventes_client_mois():
+        return executer(
+            'SELECT COUNT(*) FROM ventes WHERE client = ? AND date BETWEEN ? AND ?',
+            (CLIENT_CIBLE, *MOIS_CIBLE)
+        )[0][0]
+
+    return chiffre_affaires, produit_plus_vendu, ca_par_mois, ventes_client_mois
+
+
+QUESTIONS = [
+    "Chiffre d'affaires total",
+    "Produit le plus vendu",
+    "CA par mois",
+    "Ventes d'un client sur un mois",
+]
+
+
+# ============================================================================
+# Mesures
+# ============================================================================
+
+def octets_lus():
+    """Octets lus par le processus (rchar de /proc/self/io), None si indisponible"""
+    try:
+        with open('/proc/self/io', 'r') as f:
+            for ligne in f:
+                if ligne.startswith('rchar:'):
+                    return int(ligne.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def mesurer(fonction, repetitions=REPETITIONS):
+    """Retourne (latence médiane en ms, octets lus par exécution, résultat)"""
+    latences = []
+    octets = []
+    resultat = None
+    for _ in range(repetitions):
+        avant = octets_lus()
+        debut = time.perf_counter()
+        resultat = fonction()
+        latences.append((time.perf_counter() - debut) * 1000)
+        apres = octets_lus()
+        if avant is not None and apres is not None:
+            octets.append(apres - avant)
+    return statistics.median(latences), (statistics.median(octets) if octets else None), resultat
+
+
+def formater_octets(nb):
+    """Formate un nombre d'octets de façon lisible"""
+    if nb is None:
+        return 'n/d'
+    for unite in ['o', 'Ko', 'Mo', 'Go']:
+        if nb < 1024:
+            return f"{nb:.0f} {unite}" if unite == 'o' else f"{nb:.1f} {unite}"
+        nb /= 1024
+    return f"{nb:.1f} To"
+
+
+def lancer_benchmark(tailles=TAILLES, repetitions=REPETITIONS, dossier=None):
+    """
+    Génère les jeux de données et mesure chaque question sur chaque support
+
+    Returns:
+        Liste de dictionnaires (taille, question, support, latence_ms, octets, taille_fichier)
+    """
+    resultats = []
+    with tempfile.TemporaryDirectory(dir=dossier) as tmp:
+        tmp = Path(tmp)
+        for taille in tailles:
+            print(f"Préparation de {taille:,} ventes...")
+            chemin_csv = tmp / f'ventes_{taille}.csv'
+            chemin_parquet = tmp / f'ventes_{taille}.parquet'
+            chemin_db = tmp / f'ventes_{taille}.db'
+            chemin_db_index = tmp / f'ventes_{taille}_index.db'
+
+            generer_csv(chemin_csv, taille)
+            creer_parquet(chemin_csv, chemin_parquet)
+            creer_sqlite(chemin_csv, chemin_db, avec_index=False)
+            creer_sqlite(chemin_csv, chemin_db_index, avec_index=True)
+
+            supports = [
+                ('CSV (pandas)', chemin_csv, questions_csv(chemin_csv)),
+                ('Parquet (pyarrow)', chemin_parquet, questions_parquet(chemin_parquet)),
+                ('SQLite sans index', chemin_db, questions_sqlite(chemin_db)),
+                ('SQLite avec index', chemin_db_index, questions_sqlite(chemin_db_index)),
+            ]
+
+            for nom_support, chemin, fonctions in supports:
+                for question, fonction in zip(QUESTIONS, fonctions):
+                    latence, octets, _ = mesurer(fonction, repetitions)
+                    resultats.append({
+                        'taille': taille,
+                        'question': question,
+                        'support': nom_support,
+                        'latence_ms': latence,
+                        'octets': octets,
+                        'taille_fichier': chemin.stat().st_size,
+                    })
+    return resultats
+
+
+def tableau_markdown(resultats):
+    """Met les résultats en forme dans un tableau Markdown"""
+    lignes = [
+        "| Ventes | Question | Support | Latence (ms) | Octets lus | Taille support |",
+        "|-------:|----------|---------|-------------:|-----------:|---------------:|",
+    ]
+    for r in resultats:
+        lignes.append(
+            f"| {r['taille']:,} | {r['question']} | {r['support']} | {r['latence_ms']:.1f} "
+            f"| {formater_octets(r['octets'])} | {formater_octets(r['taille_fichier'])} |"
+        )
+    return "\n".join(lignes)
+
+
+def main():
+    """Fonction principale du benchmark"""
+    parser = argparse.ArgumentParser(description="Benchmark Data Lake vs Data Warehouse")
+    parser.add_argument('--tailles', type=int, nargs='+', default=TAILLES,
+                        help="Nombres de ventes à générer (défaut : %(default)s)")
+    parser.add_argument('--repetitions', type=int, default=REPETITIONS)
+    parser.add_argument('--sortie', default='data_lake/analytics/benchmark.md',
+                        help="Fichier Markdown de résultats")
+    args = parser.parse_args()
+
+    print("=" * 80)
+    print("BENCHMARK - Data Lake vs Data Warehouse")
+    print("=" * 80)
+
+    resultats = lancer_benchmark(args.tailles, args.repetitions)
+    tableau = tableau_markdown(resultats)
+
+    print()
+    print(tableau)
+
+    sortie = Path(args.sortie)
+    sortie.parent.mkdir(parents=True, exist_ok=True)
+    sortie.write_text("# Benchmark Data Lake vs Data Warehouse\n\n" + tableau + "\n", encoding='utf-8')
+    print(f"\nRésultats enregistrés dans {sortie}")
+
+
+if __name__ == '__main__':
+    main()
@@ -8,6 +8,8 @@ import csv
 import os
 from pathlib import Path
 
+from lecture_ventes import creer_index_date, iter_ventes
+
 def create_database():
     """Crée la base de données et la table ventes"""
     conn = sqlite3.connect('entreprise_dw.db')
@@ -26,6 +28,9 @@ def create_database():
         )
     ''')
     
+    # Index utilisé par la pagination par date (lecture_ventes.py)
+    creer_index_date(conn)
+    
     conn.commit()
     conn.close()
     print("Base de données et table créées avec succès.")
@@ -61,20 +66,16 @@ def load_data_from_csv():
     conn.close()
     print(f"Données chargées avec succès depuis {csv_path}")
 
-def display_table():
-    """Affiche le contenu de la table ventes"""
+def display_table(taille_lot=1000):
+    """Affiche le contenu de la table ventes (lecture par lots, mémoire constante)"""
     conn = sqlite3.connect('entreprise_dw.db')
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT * FROM ventes')
-    rows = cursor.fetchall()
     
     print("\nContenu de la table ventes :")
     print("-" * 80)
     print(f"{'ID':<5} {'Date':<12} {'Client':<10} {'Produit':<15} {'Quantité':<10} {'Prix Unitaire':<15} {'Total':<10}")
     print("-" * 80)
     
-    for row in rows:
+    for row in iter_ventes(conn, taille_lot):
         print(f"{row[0]:<5} {row[1]:<12} {row[2]:<10} {row[3]:<15} {row[4]:<10} {row[5]:<15.2f} {row[6]:<10.2f}")
     
     conn.close()
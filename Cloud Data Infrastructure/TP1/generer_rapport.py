@@ -6,52 +6,18 @@ Script pour générer un rapport complet du TP
 import sqlite3
 from datetime import datetime
 
+from lecture_ventes import creer_index_date, iter_ventes_par_date
+from statistiques import get_statistiques
+
 def get_database_stats():
-    """Récupère les statistiques de la base de données"""
-    conn = sqlite3.connect('entreprise_dw.db')
-    cursor = conn.cursor()
-    
-    # Nombre total de ventes
-    cursor.execute("SELECT COUNT(*) FROM ventes")
-    total_ventes = cursor.fetchone()[0]
-    
-    # Montant total des ventes
-    cursor.execute("SELECT SUM(total) FROM ventes")
-    montant_total = cursor.fetchone()[0]
-    
-    # Montant moyen par vente
-    cursor.execute("SELECT AVG(total) FROM ventes")
-    montant_moyen = cursor.fetchone()[0]
-    
-    # Produit le plus vendu (en quantité)
-    cursor.execute("""
-        SELECT produit, SUM(quantite) as total_quantite
-        FROM ventes
-        GROUP BY produit
-        ORDER BY total_quantite DESC
-        LIMIT 1
-    """)
-    produit_plus_vendu = cursor.fetchone()
-    
-    # Client ayant dépensé le plus
-    cursor.execute("""
-        SELECT client, SUM(total) as total_depense
-        FROM ventes
-        GROUP BY client
-        ORDER BY total_depense DESC
-        LIMIT 1
-    """)
-    client_plus_depensier = cursor.fetchone()
-    
-    conn.close()
-    
-    return {
-        'total_ventes': total_ventes,
-        'montant_total': montant_total,
-        'montant_moyen': montant_moyen,
-        'produit_plus_vendu': produit_plus_vendu,
-        'client_plus_depensier': client_plus_depensier
-    }
+    """
+    Récupère les statistiques de la base de données
+
+    Toutes les statistiques sont calculées en un seul parcours de la table
+    (ou lues depuis les tables de résumé si elles sont installées) : voir
+    statistiques.py.
+    """
+    return get_statistiques('entreprise_dw.db')
 
 def generate_report():
     """Génère un rapport complet"""
@@ -77,15 +43,15 @@ def generate_report():
     print("DÉTAIL DES VENTES")
     print("-" * 80)
     
+    # Pagination par clé sur (date, id) : seule une page est en mémoire
     conn = sqlite3.connect('entreprise_dw.db')
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM ventes ORDER BY date")
-    rows = cursor.fetchall()
+    # Bases créées avant l'index : sans lui, chaque page trie toute la table
+    creer_index_date(conn)
     
     print(f"{'ID':<5} {'Date':<12} {'Client':<10} {'Produit':<15} {'Qté':<5} {'Prix U.':<12} {'Total':<10}")
     print("-" * 80)
     
-    for row in rows:
+    for row in iter_ventes_par_date(conn):
         print(f"{row[0]:<5} {row[1]:<12} {row[2]:<10} {row[3]:<15} {row[4]:<5} {row[5]:<12.2f} {row[6]:<10.2f}")
     
     conn.close()
@@ -105,6 +71,8 @@ TP1/
 ├── etl_script.py                 # Script ETL
 ├── analyse_comparative.md        # Analyse détaillée
 ├── verification.py               # Script de vérification
+├── lecture_ventes.py             # Lecture en flux et export CSV/Parquet
+├── statistiques.py               # Statistiques en un seul parcours
 ├── generer_rapport.py            # Ce script
 └── README.md                     # Documentation
     """)
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Lecture en flux de la table ventes du Data Warehouse
+
+La mémoire utilisée reste constante quelle que soit la taille de la table :
+les lignes sont lues par lots (fetchmany) ou par pages (pagination par clé
+sur l'index (date, id)), puis affichées ou exportées au fil de l'eau.
+"""
+
+import argparse
+import csv
+import sqlite3
+from pathlib import Path
+
+DB_PATH = 'entreprise_dw.db'
+TAILLE_LOT = 1000
+COLONNES = ['id', 'date', 'client', 'produit', 'quantite', 'prix_unitaire', 'total']
+
+
+def creer_index_date(conn):
+    """
+    Crée l'index (date, id) utilisé par la pagination par clé
+
+    À appeler une fois à l'ouverture de la base (ETL, rapport, export), pas
+    dans les itérateurs de lecture : sans cet index, chaque page trie toute
+    la table.
+    """
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_ventes_date_id ON ventes(date, id)')
+    conn.commit()
+
+
+def iter_ventes(conn, taille_lot=TAILLE_LOT):
+    """
+    Parcourt la table ventes sans ordre imposé, par lots de taille_lot lignes
+
+    Seul le lot courant est en mémoire (fetchmany au lieu de fetchall).
+    """
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT {', '.join(COLONNES)} FROM ventes")
+    try:
+        while True:
+            rows = cursor.fetchmany(taille_lot)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        cursor.close()
+
+
+def iter_pages_par_date(conn, taille_page=TAILLE_LOT, apres=None):
+    """
+    Parcourt la table ventes triée par date, page par page
+
+    Pagination par clé (keyset) : chaque page reprend après le couple
+    (date, id) de la dernière ligne lue, ce qui reste en O(taille_page)
+    grâce à l'index idx_ventes_date_id (voir creer_index_date), contrairement
+    à OFFSET. La lecture n'écrit rien dans la base.
+
+    Args:
+        conn: Connexion SQLite
+        taille_page: Nombre de lignes par page
+        apres: Couple (date, id) à partir duquel reprendre (exclu)
+
+    Yields:
+        Listes de lignes (une liste par page)
+    """
+    requete = f"""
+        SELECT {', '.join(COLONNES)}
+        FROM ventes
+        WHERE (date, id) > (?, ?)
+        ORDER BY date, id
+        LIMIT ?
+    """
+    date, id_ = apres if apres is not None else ('', 0)
+
+    while True:
+        page = conn.execute(requete, (date, id_, taille_page)).fetchall()
+        if not page:
+            break
+        yield page
+        if len(page) < taille_page:
+            break
+        id_, date = page[-1][0], page[-1][1]
+
+
+def iter_ventes_par_date(conn, taille_page=TAILLE_LOT):
+    """Parcourt la table ventes triée par date, ligne par ligne"""
+    for page in iter_pages_par_date(conn, taille_page):
+        yield from page
+
+
+def exporter_csv(conn, chemin, taille_lot=TAILLE_LOT):
+    """Exporte la table ventes (triée par date) vers un fichier CSV"""
+    nb_lignes = 0
+    with open(chemin, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(COLONNES)
+        for page in iter_pages_par_date(conn, taille_lot):
+            writer.writerows(page)
+            nb_lignes += len(page)
+    return nb_lignes
+
+
+def exporter_parquet(conn, chemin, taille_lot=TAILLE_LOT):
+    """
+    Exporte la table ventes (triée par date) vers un fichier Parquet
+
+    Chaque page devient un row group : le fichier n'est jamais matérialisé
+    entièrement en mémoire. Nécessite pyarrow.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError("L'export Parquet nécessite pyarrow (pip install pyarrow)") from e
+
+    schema = pa.schema([
+        ('id', pa.int64()),
+        ('date', pa.string()),
+        ('client', pa.string()),
+        ('produit', pa.string()),
+        ('quantite', pa.int64()),
+        ('prix_unitaire', pa.float64()),
+        ('total', pa.float64()),
+    ])
+
+    nb_lignes = 0
+    with pq.ParquetWriter(chemin, schema, compression='snappy') as writer:
+        for page in iter_pages_par_date(conn, taille_lot):
+            colonnes = list(zip(*page))
+            batch = pa.RecordBatch.from_arrays(
+                [pa.array(valeurs, type=champ.type) for valeurs, champ in zip(colonnes, schema)],
+                schema=schema
+            )
+            writer.write_batch(batch)
+            nb_lignes += len(page)
+    return nb_lignes
+
+
+def exporter_ventes(chemin, format='csv', taille_lot=TAILLE_LOT, db_path=DB_PATH):
+    """
+    Exporte la table ventes vers un fichier CSV ou Parquet
+
+    Args:
+        chemin: Fichier de sortie
+        format: 'csv' ou 'parquet'
+        taille_lot: Nombre de lignes lues par page
+        db_path: Chemin de la base SQLite
+
+    Returns:
+        Nombre de lignes exportées
+    """
+    exporteurs = {'csv': exporter_csv, 'parquet': exporter_parquet}
+    if format not in exporteurs:
+        raise ValueError(f"Format d'export inconnu : {format} (attendu : csv ou parquet)")
+
+    Path(chemin).parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    try:
+        creer_index_date(conn)   # une fois, pour les bases créées avant l'index
+        return exporteurs[format](conn, chemin, taille_lot)
+    finally:
+        conn.close()
+
+
+def main():
+    """Fonction principale : export de la table ventes"""
+    parser = argparse.ArgumentParser(description="Export en flux de la table ventes")
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv')
+    parser.add_argument('--sortie', help="Fichier de sortie (défaut : data_lake/analytics/ventes.<format>)")
+    parser.add_argument('--taille-lot', type=int, default=TAILLE_LOT)
+    args = parser.parse_args()
+
+    sortie = args.sortie or f'data_lake/analytics/ventes.{args.format}'
+    nb_lignes = exporter_ventes(sortie, args.format, args.taille_lot)
+    print(f"{nb_lignes} ventes exportées vers {sortie}")
+
+
+if __name__ == '__main__':
+    main()
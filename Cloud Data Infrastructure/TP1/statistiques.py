@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Statistiques agrégées de la table ventes
+
+Deux stratégies, toutes deux indépendantes du nombre d'indicateurs :
+- une requête unique qui parcourt ventes une seule fois (GROUP BY produit,
+  client) puis dérive tous les indicateurs par fonctions de fenêtrage sur
+  ce cube réduit ;
+- des tables de résumé maintenues par triggers à chaque écriture, lues en
+  temps constant.
+"""
+
+import sqlite3
+
+DB_PATH = 'entreprise_dw.db'
+
+# Un seul parcours de ventes : le cube (produit, client) est ensuite
+# agrégé par fenêtres, sa taille ne dépend pas du nombre de ventes.
+REQUETE_STATISTIQUES = """
+    WITH cube AS (
+        SELECT produit, client,
+               COUNT(*) AS nb_ventes,
+               SUM(total) AS montant,
+               SUM(quantite) AS quantite
+        FROM ventes
+        GROUP BY produit, client
+    ),
+    fenetres AS (
+        SELECT produit, client,
+               SUM(nb_ventes) OVER () AS total_ventes,
+               SUM(montant) OVER () AS montant_total,
+               SUM(quantite) OVER (PARTITION BY produit) AS quantite_produit,
+               SUM(montant) OVER (PARTITION BY client) AS depense_client
+        FROM cube
+    )
+    SELECT total_ventes,
+           montant_total,
+           montant_total / total_ventes AS montant_moyen,
+           FIRST_VALUE(produit) OVER (ORDER BY quantite_produit DESC, produit),
+           MAX(quantite_produit) OVER (),
+           FIRST_VALUE(client) OVER (ORDER BY depense_client DESC, client),
+           MAX(depense_client) OVER ()
+    FROM fenetres
+    LIMIT 1
+"""
+
+SCHEMA_RESUME = """
+    CREATE TABLE IF NOT EXISTS ventes_resume (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        nb_ventes INTEGER NOT NULL DEFAULT 0,
+        montant_total REAL NOT NULL DEFAULT 0
+    );
+    CREATE TABLE IF NOT EXISTS ventes_par_produit (
+        produit TEXT PRIMARY KEY,
+        quantite INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE TABLE IF NOT EXISTS ventes_par_client (
+        client TEXT PRIMARY KEY,
+        montant REAL NOT NULL DEFAULT 0
+    );
+    CREATE INDEX IF NOT EXISTS idx_resume_produit_quantite ON ventes_par_produit(quantite);
+    CREATE INDEX IF NOT EXISTS idx_resume_client_montant ON ventes_par_client(montant);
+
+    CREATE TRIGGER IF NOT EXISTS trg_ventes_resume_insert AFTER INSERT ON ventes
+    BEGIN
+        UPDATE ventes_resume
+        SET nb_ventes = nb_ventes + 1, montant_total = montant_total + NEW.total
+        WHERE id = 1;
+        INSERT INTO ventes_par_produit (produit, quantite) VALUES (NEW.produit, NEW.quantite)
+        ON CONFLICT(produit) DO UPDATE SET quantite = quantite + excluded.quantite;
+        INSERT INTO ventes_par_client (client, montant) VALUES (NEW.client, NEW.total)
+        ON CONFLICT(client) DO UPDATE SET montant = montant + excluded.montant;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_ventes_resume_delete AFTER DELETE ON ventes
+    BEGIN
+        UPDATE ventes_resume
+        SET nb_ventes = nb_ventes - 1, montant_total = montant_total - OLD.total
+        WHERE id = 1;
+        UPDATE ventes_par_produit SET quantite = quantite - OLD.quantite WHERE produit = OLD.produit;
+        UPDATE ventes_par_client SET montant = montant - OLD.total WHERE client = OLD.client;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_ventes_resume_update AFTER UPDATE ON ventes
+    BEGIN
+        UPDATE ventes_resume
+        SET montant_total = montant_total - OLD.total + NEW.total
+        WHERE id = 1;
+        UPDATE ventes_par_produit SET quantite = quantite - OLD.quantite WHERE produit = OLD.produit;
+        INSERT INTO ventes_par_produit (produit, quantite) VALUES (NEW.produit, NEW.quantite)
+        ON CONFLICT(produit) DO UPDATE SET quantite = quantite + excluded.quantite;
+        UPDATE ventes_par_client SET montant = montant - OLD.total WHERE client = OLD.client;
+        INSERT INTO ventes_par_client (client, montant) VALUES (NEW.client, NEW.total)
+        ON CONFLICT(client) DO UPDATE SET montant = montant + excluded.montant;
+    END;
+"""
+
+
+def _formater(ligne):
+    """Met une ligne de statistiques au format attendu par generer_rapport"""
+    total_ventes, montant_total, montant_moyen, produit, quantite, client, depense = ligne
+    return {
+        'total_ventes': total_ventes,
+        'montant_total': montant_total,
+        'montant_moyen': montant_moyen,
+        'produit_plus_vendu': (produit, quantite) if produit is not None else None,
+        'client_plus_depensier': (client, depense) if client is not None else None,
+    }
+
+
+def calculer_statistiques(conn):
+    """
+    Calcule toutes les statistiques en un seul parcours de la table ventes
+
+    Returns:
+        Dictionnaire total_ventes, montant_total, montant_moyen,
+        produit_plus_vendu (produit, quantité) et client_plus_depensier
+        (client, montant)
+    """
+    ligne = conn.execute(REQUETE_STATISTIQUES).fetchone()
+    if ligne is None:
+        return _formater((0, None, None, None, None, None, None))
+    return _formater(ligne)
+
+
+def resume_installe(conn):
+    """Indique si les tables de résumé maintenues par triggers existent"""
+    ligne = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'trg_ventes_resume_insert'"
+    ).fetchone()
+    return ligne is not None
+
+
+def installer_resume(conn):
+    """
+    Crée les tables de résumé et leurs triggers, puis les initialise
+
+    Les tables sont reconstruites depuis ventes dans la même transaction :
+    l'opération est idempotente et peut être relancée pour resynchroniser.
+    """
+    conn.executescript(SCHEMA_RESUME)
+    with conn:
+        conn.execute("DELETE FROM ventes_resume")
+        conn.execute("DELETE FROM ventes_par_produit")
+        conn.execute("DELETE FROM ventes_par_client")
+        conn.execute("""
+            INSERT INTO ventes_resume (id, nb_ventes, montant_total)
+            SELECT 1, COUNT(*), COALESCE(SUM(total), 0) FROM ventes
+        """)
+        conn.execute("""
+            INSERT INTO ventes_par_produit (produit, quantite)
+            SELECT produit, SUM(quantite) FROM ventes GROUP BY produit
+        """)
+        conn.execute("""
+            INSERT INTO ventes_par_client (client, montant)
+            SELECT client, SUM(total) FROM ventes GROUP BY client
+        """)
+
+
+def lire_resume(conn):
+    """Lit les statistiques depuis les tables de résumé (temps constant)"""
+    ligne = conn.execute("""
+        SELECT r.nb_ventes,
+               CASE WHEN r.nb_ventes > 0 THEN r.montant_total END,
+               CASE WHEN r.nb_ventes > 0 THEN r.montant_total / r.nb_ventes END,
+               p.produit, p.quantite,
+               c.client, c.montant
+        FROM ventes_resume r
+        LEFT JOIN (SELECT produit, quantite FROM ventes_par_produit
+                   WHERE quantite > 0 ORDER BY quantite DESC, produit LIMIT 1) p
+        LEFT JOIN (SELECT client, montant FROM ventes_par_client
+                   WHERE montant > 0 ORDER BY montant DESC, client LIMIT 1) c
+        WHERE r.id = 1
+    """).fetchone()
+    return _formater(ligne)
+
+
+def get_statistiques(db_path=DB_PATH):
+    """
+    Retourne les statistiques des ventes
+
+    Utilise les tables de résumé si elles sont installées, sinon la requête
+    à parcours unique.
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        if resume_installe(conn):
+            return lire_resume(conn)
+        return calculer_statistiques(conn)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    conn = sqlite3.connect(DB_PATH)
+    installer_resume(conn)
+    conn.close()
+    print("Tables de résumé installées :", get_statistiques())
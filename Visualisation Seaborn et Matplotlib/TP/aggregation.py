@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+📈 Nice Traffic Watch - Incremental Delay Aggregation
+======================================================
+Running per-(route, hour, transport_type) delay statistics, updated by the
+collector at every poll and persisted as a small JSON snapshot.
+
+The dashboard used to rebuild these aggregates from the full CSV history at
+startup. Here every cell keeps:
+- count, mean and M2 (Welford's online algorithm: std without the raw data)
+- a histogram sketch of the delays (10 s bins) for the median
+
+Cells are mergeable, so snapshots from several collectors (or a backfill
+from an existing CSV) can be combined.
+
+Snapshot (data/delay_aggregates.json):
+    {"version": 1, "updated_at": "...", "observations": 123456,
+     "source": {"offset": 98765432, "digest": "3f2a..."},
+     "columns": ["route_id", "hour", "transport_type", "count", "mean", "m2", "median", "histogram"],
+     "cells": [["09", 7, "Bus", 812, 1.93, 2210.4, 1.5, {"6": 40, "7": 52, ...}], ...]}
+
+Delays are in minutes, with the same cleaning rules as the dashboard
+(|delay| <= 60 min, GPS inside the Nice area, Bus/Tram only).
+
+"source" says which part of the collector CSV the snapshot covers: the
+first `offset` bytes, whose last TOKEN_BYTES bytes hash to `digest`. The
+dashboard checks it against the CSV before trusting the snapshot.
+
+Usage (backfill from an existing CSV):
+    python aggregation.py rebuild data/transit_delays.csv
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+SNAPSHOT_VERSION = 1
+BIN_SECONDS = 10                 # histogram sketch resolution
+MAX_ABS_DELAY_MINUTES = 60
+LATITUDE_RANGE = (43.6, 43.8)    # Nice area, as in the dashboard cleaning
+LONGITUDE_RANGE = (7.0, 7.5)
+TRANSPORT_TYPES = {0: "Tram", 3: "Bus"}
+TOKEN_BYTES = 4096               # tail of the CSV hashed into the source token
+COLUMNS = ["route_id", "hour", "transport_type", "count", "mean", "m2", "median", "histogram"]
+
+CellKey = Tuple[str, int, str]
+
+
+class RunningStats:
+    """Welford mean/variance plus a fixed-width histogram sketch."""
+
+    __slots__ = ("count", "mean", "m2", "histogram")
+
+    def __init__(self, count: int = 0, mean: float = 0.0, m2: float = 0.0,
+                 histogram: Optional[Dict[int, int]] = None):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+        self.histogram = histogram if histogram is not None else {}
+
+    def add(self, delay_seconds: float):
+        value = delay_seconds / 60
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        b = int(delay_seconds // BIN_SECONDS)
+        self.histogram[b] = self.histogram.get(b, 0) + 1
+
+    def merge(self, other: "RunningStats"):
+        """Chan et al. parallel combination of two cells."""
+        if other.count == 0:
+            return
+        total = self.count + other.count
+        delta = other.mean - self.mean
+        self.m2 += other.m2 + delta * delta * self.count * other.count / total
+        self.mean += delta * other.count / total
+        self.count = total
+        for b, n in other.histogram.items():
+            self.histogram[b] = self.histogram.get(b, 0) + n
+
+    @property
+    def std(self) -> float:
+        """Sample standard deviation (ddof=1, like pandas), NaN below 2 values."""
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else float("nan")
+
+    def _order_statistic(self, bins: List[int], cumulative: List[int], k: int) -> float:
+        """Estimated k-th smallest delay in seconds (values spread evenly inside a bin)."""
+        i = next(i for i, c in enumerate(cumulative) if c > k)
+        before = cumulative[i - 1] if i else 0
+        n = cumulative[i] - before
+        return (bins[i] + (k - before + 0.5) / n) * BIN_SECONDS
+
+    def quantile(self, q: float) -> float:
+        """
+        Approximate quantile in minutes, interpolated between order
+        statistics like pandas/numpy (error bounded by the bin width).
+        """
+        if self.count == 0:
+            return float("nan")
+        bins = sorted(self.histogram)
+        cumulative, total = [], 0
+        for b in bins:
+            total += self.histogram[b]
+            cumulative.append(total)
+        position = q * (self.count - 1)
+        lower = int(position)
+        value = self._order_statistic(bins, cumulative, lower)
+        if position > lower:
+            upper = self._order_statistic(bins, cumulative, lower + 1)
+            value += (position - lower) * (upper - value)
+        return value / 60
+
+    @property
+    def median(self) -> float:
+        return self.quantile(0.5)
+
+
+def _cell_key(obs: Dict) -> Optional[CellKey]:
+    """Aggregation key of a collector observation, None if it is filtered out."""
+    try:
+        delay = float(obs["delay_seconds"])
+        latitude, longitude = float(obs["latitude"]), float(obs["longitude"])
+        transport_type = TRANSPORT_TYPES.get(int(obs["route_type"]))
+    except (KeyError, TypeError, ValueError):
+        return None
+    if transport_type is None or not obs.get("route_id") or not obs.get("vehicle_id"):
+        return None
+    if abs(delay) > MAX_ABS_DELAY_MINUTES * 60:
+        return None
+    if not (LATITUDE_RANGE[0] <= latitude <= LATITUDE_RANGE[1]
+            and LONGITUDE_RANGE[0] <= longitude <= LONGITUDE_RANGE[1]):
+        return None
+    timestamp = obs["timestamp"]
+    hour = timestamp.hour if isinstance(timestamp, datetime) else datetime.fromisoformat(timestamp).hour
+    return str(obs["route_id"]), hour, transport_type
+
+
+def source_token(csv_file: Path) -> Dict:
+    """Size of the collector CSV and digest of its last bytes (what the snapshot covers)."""
+    with open(csv_file, 'rb') as f:
+        offset = f.seek(0, os.SEEK_END)
+        f.seek(max(0, offset - TOKEN_BYTES))
+        tail = f.read(offset - f.tell())
+    return {"offset": offset, "digest": hashlib.blake2b(tail, digest_size=8).hexdigest()}
+
+
+class DelayAggregator:
+    """Per-(route_id, hour, transport_type) running delay statistics."""
+
+    def __init__(self):
+        self.cells: Dict[CellKey, RunningStats] = {}
+        self.observations = 0
+        self.source: Optional[Dict] = None   # source_token() of the CSV these cells cover
+
+    def update(self, observations: Iterable[Dict]) -> int:
+        """Fold one poll of collector observations in. Returns the number kept."""
+        kept = 0
+        for obs in observations:
+            key = _cell_key(obs)
+            if key is None:
+                continue
+            stats = self.cells.get(key)
+            if stats is None:
+                stats = self.cells[key] = RunningStats()
+            stats.add(float(obs["delay_seconds"]))
+            kept += 1
+        self.observations += kept
+        return kept
+
+    def merge(self, other: "DelayAggregator"):
+        for key, stats in other.cells.items():
+            self.cells.setdefault(key, RunningStats()).merge(stats)
+        self.observations += other.observations
+
+    # ------------------------------------------------------------------
+    # Snapshot
+    # ------------------------------------------------------------------
+
+    def to_dict(self) -> Dict:
+        cells = [
+            [route_id, hour, transport_type, s.count, s.mean, s.m2, s.median,
+             {str(b): n for b, n in sorted(s.histogram.items())}]
+            for (route_id, hour, transport_type), s in sorted(self.cells.items())
+        ]
+        return {
+            "version": SNAPSHOT_VERSION,
+            "updated_at": datetime.now().isoformat(timespec="seconds"),
+            "observations": self.observations,
+            "source": self.source,
+            "columns": COLUMNS,
+            "cells": cells,
+        }
+
+    def save(self, path: Path):
+        """Write the snapshot atomically (readers never see a partial file)."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, separators=(",", ":"))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "DelayAggregator":
+        with open(path, 'r', encoding='utf-8') as f:
+            snapshot = json.load(f)
+        if snapshot.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported aggregate snapshot version: {snapshot.get('version')}")
+        aggregator = cls()
+        aggregator.observations = snapshot["observations"]
+        aggregator.source = snapshot.get("source")
+        for route_id, hour, transport_type, count, mean, m2, _median, histogram in snapshot["cells"]:
+            aggregator.cells[(route_id, hour, transport_type)] = RunningStats(
+                count, mean, m2, {int(b): n for b, n in histogram.items()})
+        return aggregator
+
+    @classmethod
+    def open(cls, path: Path) -> "DelayAggregator":
+        """Resume from an existing snapshot, or start empty."""
+        return cls.load(path) if Path(path).exists() else cls()
+
+
+def rebuild_from_csv(csv_file: Path, chunksize: int = 200_000) -> DelayAggregator:
+    """Backfill an aggregator from an existing collector CSV (read in chunks)."""
+    import pandas as pd
+
+    aggregator = DelayAggregator()
+    token = source_token(csv_file)
+    columns = ["timestamp", "route_id", "route_type", "vehicle_id", "delay_seconds", "latitude", "longitude"]
+    for chunk in pd.read_csv(csv_file, usecols=columns, dtype={"route_id": str, "vehicle_id": str},
+                             keep_default_na=False, chunksize=chunksize):
+        aggregator.update(chunk.to_dict("records"))
+    # A CSV still being written is only partly covered: no token, the dashboard recomputes
+    if source_token(csv_file) == token:
+        aggregator.source = token
+    return aggregator
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Delay aggregate snapshots")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rebuild = sub.add_parser("rebuild", help="Backfill the snapshot from a collector CSV")
+    rebuild.add_argument("csv_file", type=Path)
+    rebuild.add_argument("--output", type=Path, default=Path("data") / "delay_aggregates.json")
+    args = parser.parse_args(argv)
+
+    aggregator = rebuild_from_csv(args.csv_file)
+    aggregator.save(args.output)
+    size_kb = args.output.stat().st_size / 1024
+    print(f"✅ {aggregator.observations:,} observations -> {len(aggregator.cells):,} cells "
+          f"({size_kb:.0f} KB) in {args.output}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+⚡ Nice Traffic Watch - Async GTFS-RT Fetcher
+=============================================
+Concurrent, conditional fetching of GTFS-RT feeds with asyncio + aiohttp.
+
+Compared to the synchronous requests.get() path:
+- One persistent keep-alive session: no new TCP/TLS handshake every poll
+- Trip updates and vehicle positions are fetched concurrently
+- Conditional requests (ETag / If-Modified-Since): unchanged feeds come
+  back as 304 Not Modified and are not downloaded nor parsed again
+- The poll loop follows the feed header timestamp: the next poll is aimed
+  at the next expected feed publication instead of a blind sleep
+
+Used by the --async mode of data_collector.py and data_collector_v2.py.
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence
+
+import aiohttp
+from google.transit import gtfs_realtime_pb2
+
+from feed_decoder import parse_feed, payload_digest
+
+
+DEFAULT_TIMEOUT = 10          # seconds per request
+MIN_POLL_INTERVAL = 5         # seconds between polls while a feed is unchanged
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class FeedResult:
+    """Outcome of one conditional fetch."""
+    url: str
+    feed: Optional[gtfs_realtime_pb2.FeedMessage]
+    changed: bool
+    status: Optional[int] = None
+    digest: Optional[bytes] = None   # payload_digest() of the raw payload
+
+    @property
+    def header_timestamp(self) -> Optional[int]:
+        if self.feed is None or not self.feed.header.timestamp:
+            return None
+        return int(self.feed.header.timestamp)
+
+
+@dataclass
+class _Validators:
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    feed: Optional[gtfs_realtime_pb2.FeedMessage] = None
+    header_timestamp: Optional[int] = None
+    digest: Optional[bytes] = None
+
+
+class AsyncFeedFetcher:
+    """Keep-alive HTTP session fetching GTFS-RT feeds with conditional GETs."""
+
+    def __init__(self, timeout: int = DEFAULT_TIMEOUT, limit_per_host: int = 4):
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.limit_per_host = limit_per_host
+        self.session: Optional[aiohttp.ClientSession] = None
+        self._validators: Dict[str, _Validators] = {}
+        self.stats = {"requests": 0, "not_modified": 0, "errors": 0, "bytes": 0}
+
+    async def __aenter__(self) -> "AsyncFeedFetcher":
+        connector = aiohttp.TCPConnector(limit_per_host=self.limit_per_host, keepalive_timeout=120)
+        self.session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def fetch(self, url: str) -> FeedResult:
+        """
+        Fetch and parse a feed, skipping the download if it has not changed.
+
+        Returns:
+            FeedResult with changed=False (and the last parsed feed) on 304 or
+            when the header timestamp did not move; feed=None on error.
+        """
+        state = self._validators.setdefault(url, _Validators())
+        headers = {}
+        if state.etag:
+            headers["If-None-Match"] = state.etag
+        if state.last_modified:
+            headers["If-Modified-Since"] = state.last_modified
+
+        self.stats["requests"] += 1
+        try:
+            async with self.session.get(url, headers=headers) as response:
+                if response.status == 304:
+                    self.stats["not_modified"] += 1
+                    return FeedResult(url, state.feed, changed=False, status=304, digest=state.digest)
+
+                response.raise_for_status()
+                payload = await response.read()
+                self.stats["bytes"] += len(payload)
+                etag = response.headers.get("ETag")
+                last_modified = response.headers.get("Last-Modified")
+                status = response.status
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.stats["errors"] += 1
+            logger.error(f"Failed to fetch {url}: {e}")
+            return FeedResult(url, None, changed=False)
+
+        try:
+            feed = parse_feed(payload)
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.error(f"Failed to parse feed from {url}: {e}")
+            return FeedResult(url, None, changed=False, status=status)
+
+        # Servers without validators: fall back on the feed header timestamp
+        header_ts = int(feed.header.timestamp) if feed.header.timestamp else None
+        changed = header_ts is None or header_ts != state.header_timestamp
+        # Validators only for a version that parsed: a truncated payload is downloaded again
+        state.etag = etag
+        state.last_modified = last_modified
+        state.feed = feed
+        state.header_timestamp = header_ts
+        state.digest = payload_digest(payload)
+        return FeedResult(url, feed, changed=changed, status=status, digest=state.digest)
+
+    async def fetch_all(self, urls: Sequence[str]) -> List[FeedResult]:
+        """Fetch several feeds concurrently over the shared session."""
+        return list(await asyncio.gather(*(self.fetch(url) for url in urls)))
+
+
+def next_poll_delay(results: Sequence[FeedResult], interval: float,
+                    min_interval: float = MIN_POLL_INTERVAL, now: Optional[float] = None) -> float:
+    """
+    Seconds to wait before the next poll.
+
+    The next feed version is expected `interval` seconds after the newest
+    header timestamp. If that moment is already past (feed late or
+    unchanged), poll again after min_interval.
+    """
+    now = time.time() if now is None else now
+    stamps = [r.header_timestamp for r in results if r.header_timestamp is not None]
+    if not stamps:
+        return interval if all(r.changed for r in results) else min_interval
+    return max(min_interval, min(interval, max(stamps) + interval - now))
+
+
+async def poll_feeds(fetcher: AsyncFeedFetcher, urls: Sequence[str],
+                     handle: Callable[[List[FeedResult]], Awaitable[None]],
+                     interval: float, end_time: Optional[float] = None,
+                     min_interval: float = MIN_POLL_INTERVAL,
+                     stop_event: Optional[asyncio.Event] = None):
+    """
+    Poll `urls` concurrently until end_time (or stop_event) and hand every
+    round where at least one feed changed to `handle`.
+    """
+    stop_event = stop_event or asyncio.Event()
+
+    while not stop_event.is_set():
+        if end_time and time.time() >= end_time:
+            logger.info("⏰ Time limit reached, stopping collector")
+            break
+
+        results = await fetcher.fetch_all(urls)
+
+        if all(r.feed is not None for r in results) and any(r.changed for r in results):
+            await handle(results)
+        elif any(r.feed is None for r in results):
+            logger.warning("⚠️  Failed to fetch one or both feeds, skipping this round")
+        else:
+            logger.info("⏸️  Feeds unchanged since last poll")
+
+        delay = next_poll_delay(results, interval, min_interval)
+        logger.info(f"💤 Next poll in {delay:.1f}s")
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
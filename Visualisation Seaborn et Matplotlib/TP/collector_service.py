@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+🌍 Nice Traffic Watch - Multi-Agency Collector Service
+=======================================================
+Polls any number of GTFS-RT networks from a single asyncio event loop.
+
+Each feed source (agency, trip-updates URL, vehicle-positions URL and an
+optional static GTFS directory) gets its own polling task:
+- Sources with a static GTFS directory get real delays (data_collector_v2
+  logic), the others get delay-enriched vehicle positions (data_collector)
+- Per-source rate limit: never poll a source more often than min_interval
+- Jittered exponential backoff on consecutive errors, so a failing network
+  does not hammer its endpoint nor slow down the others
+- All sources share one keep-alive HTTP session (async_fetcher.py) and a
+  global cap on concurrent requests
+- Output is partitioned per agency and per day:
+  data/agencies/<agency>/date=YYYY-MM-DD/observations.csv
+  or, with --storage parquet, per agency, day and hour:
+  data/agencies/<agency>/date=YYYY-MM-DD/hour=HH/part-*.parquet
+  plus, for sources with a static GTFS, running delay aggregates in
+  data/agencies/<agency>/delay_aggregates.json
+
+Usage:
+    python collector_service.py sources.json [--duration-hours 1] [--storage parquet]
+
+sources.json:
+    {"sources": [
+        {"agency": "lignes-d-azur",
+         "trip_updates_url": "https://ara-api.enroute.mobi/rla/gtfs/trip-updates",
+         "vehicle_positions_url": "https://ara-api.enroute.mobi/rla/gtfs/vehicle-positions",
+         "gtfs_dir": "data/gtfs",
+         "interval": 60}
+    ]}
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import re
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from async_fetcher import AsyncFeedFetcher, MIN_POLL_INTERVAL, next_poll_delay
+from aggregation import DelayAggregator
+from delay_batch import calculate_delays_batch
+from observation_store import make_store
+import data_collector
+import data_collector_v2
+
+
+# ============================================================================
+# Configuration
+# ============================================================================
+
+OUTPUT_DIR = Path("data") / "agencies"
+LOG_FILE = Path("data") / "collector_service.log"
+DEFAULT_INTERVAL = 60          # seconds between expected feed versions
+MAX_BACKOFF = 600              # seconds
+MAX_CONCURRENT_REQUESTS = 16   # across all sources
+AGENCY_NAME = re.compile(r"[A-Za-z0-9][A-Za-z0-9._-]*")   # one directory name, no path separators
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class FeedSource:
+    """One GTFS-RT network to monitor."""
+    agency: str
+    trip_updates_url: str
+    vehicle_positions_url: str
+    gtfs_dir: Optional[Path] = None
+    routes: Optional[List[str]] = None  # route_id subset, None = whole network
+    interval: float = DEFAULT_INTERVAL
+    min_interval: float = MIN_POLL_INTERVAL
+
+    def __post_init__(self):
+        # The agency names its output directory: "../x" or "/x" would write outside of it
+        if not AGENCY_NAME.fullmatch(self.agency):
+            raise ValueError(f"Invalid agency name {self.agency!r}: use letters, digits, '.', '_' or '-'")
+
+    @classmethod
+    def from_dict(cls, raw: Dict) -> "FeedSource":
+        return cls(
+            agency=raw["agency"],
+            trip_updates_url=raw["trip_updates_url"],
+            vehicle_positions_url=raw["vehicle_positions_url"],
+            gtfs_dir=Path(raw["gtfs_dir"]) if raw.get("gtfs_dir") else None,
+            routes=raw.get("routes"),
+            interval=float(raw.get("interval", DEFAULT_INTERVAL)),
+            min_interval=float(raw.get("min_interval", MIN_POLL_INTERVAL)),
+        )
+
+
+def load_sources(config_file: Path) -> List[FeedSource]:
+    """Read the list of feed sources from a JSON file."""
+    with open(config_file, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    sources = [FeedSource.from_dict(raw) for raw in config["sources"]]
+    agencies = [s.agency for s in sources]
+    if len(set(agencies)) != len(agencies):
+        raise ValueError("Agency names must be unique (they name the output partitions)")
+    return sources
+
+
+def backoff_delay(error_count: int, interval: float, rng: random.Random = random) -> float:
+    """
+    Exponential backoff with equal jitter, capped at MAX_BACKOFF.
+
+    The delay is drawn in [ceiling / 2, ceiling]: sources failing together are
+    spread out, but never retried right away (full jitter could draw ~0).
+    """
+    ceiling = min(MAX_BACKOFF, interval * (2 ** (error_count - 1)))
+    return rng.uniform(ceiling / 2, ceiling)
+
+
+# ============================================================================
+# Per-source collection
+# ============================================================================
+
+class SourceCollector:
+    """Polling task state for one feed source."""
+
+    def __init__(self, source: FeedSource, output_dir: Path = OUTPUT_DIR, storage: str = "csv"):
+        self.source = source
+        self.output_dir = output_dir / source.agency
+        self.storage = storage
+        self.schedule: Optional[data_collector_v2.GTFSSchedule] = None
+        self.headers = data_collector.CSV_HEADERS
+        self.store = None
+        self.vehicle_states = data_collector.VehicleStateCache()
+        self.aggregator: Optional[DelayAggregator] = None
+        self.collection_count = 0
+        self.observation_count = 0
+        self.error_count = 0
+        self._last_poll = 0.0
+
+    def load(self):
+        """Load the static schedule if the source has one."""
+        if self.source.gtfs_dir is not None:
+            self.schedule = data_collector_v2.GTFSSchedule(self.source.gtfs_dir, self.source.routes)
+            self.schedule.load()
+            self.headers = data_collector_v2.CSV_HEADERS
+            self.aggregator = DelayAggregator.open(self.aggregates_file)
+        self.store = make_store(self.storage, self.headers, self.output_dir / "observations.csv",
+                                self.output_dir, daily_csv=True)
+
+    @property
+    def aggregates_file(self) -> Path:
+        return self.output_dir / "delay_aggregates.json"
+
+    def compute(self, trip_feed, vehicle_feed, digests=None) -> List[Dict]:
+        if self.schedule is not None:
+            return calculate_delays_batch(trip_feed, vehicle_feed, self.schedule)
+        return data_collector.merge_observations(trip_feed, vehicle_feed, self.vehicle_states,
+                                                 digests=digests)
+
+    def save(self, observations: List[Dict]):
+        if observations:
+            self.store.append(observations)   # raises if not written: aggregates left untouched
+        # Only once stored: a failed write is emitted again by the next poll
+        self.vehicle_states.commit()
+        if observations and self.aggregator is not None:
+            self.aggregator.update(observations)
+            self.aggregator.save(self.aggregates_file)
+
+    async def run(self, fetcher: AsyncFeedFetcher, semaphore: asyncio.Semaphore,
+                  end_time: Optional[float], stop_event: asyncio.Event):
+        source = self.source
+        urls = [source.trip_updates_url, source.vehicle_positions_url]
+
+        async def sleep(delay: float):
+            if end_time:
+                delay = min(delay, end_time - time.time())
+            await self._sleep(delay, stop_event)
+
+        # Spread the first polls so dozens of sources do not fire at once
+        await sleep(random.uniform(0, min(source.interval, 10)))
+
+        while not stop_event.is_set():
+            if end_time and time.time() >= end_time:
+                break
+
+            # Rate limit: at most one poll every min_interval seconds
+            wait = self._last_poll + source.min_interval - time.monotonic()
+            if wait > 0:
+                await sleep(wait)
+            self._last_poll = time.monotonic()
+
+            async with semaphore:
+                results = await fetcher.fetch_all(urls)
+
+            if any(r.feed is None for r in results):
+                self.error_count += 1
+                delay = backoff_delay(self.error_count, source.interval)
+                logger.warning(f"[{source.agency}] ⚠️  Fetch failed ({self.error_count} in a row), "
+                               f"backing off {delay:.0f}s")
+                await sleep(delay)
+                continue
+
+            self.error_count = 0
+            if any(r.changed for r in results):
+                try:
+                    # Delay matching and file writes run off the event loop (other sources keep polling)
+                    observations = await asyncio.to_thread(self.compute, results[0].feed, results[1].feed,
+                                                           (results[0].digest, results[1].digest))
+                    await asyncio.to_thread(self.save, observations)
+                    self.collection_count += 1
+                    self.observation_count += len(observations)
+                    logger.info(f"[{source.agency}] 💾 {len(observations)} observations")
+                except Exception as e:
+                    logger.error(f"[{source.agency}] ❌ Collection failed: {e}")
+
+            await sleep(next_poll_delay(results, source.interval, source.min_interval))
+
+    @staticmethod
+    async def _sleep(delay: float, stop_event: asyncio.Event):
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=max(0.0, delay))
+        except asyncio.TimeoutError:
+            pass
+
+
+# ============================================================================
+# Service
+# ============================================================================
+
+async def run_service(sources: List[FeedSource], duration_hours: Optional[float] = None,
+                      output_dir: Path = OUTPUT_DIR, stop_event: Optional[asyncio.Event] = None,
+                      storage: str = "csv"):
+    """Poll every source concurrently from the current event loop."""
+    stop_event = stop_event or asyncio.Event()
+    end_time = time.time() + duration_hours * 3600 if duration_hours else None
+
+    collectors = [SourceCollector(source, output_dir, storage) for source in sources]
+    for collector in collectors:
+        collector.load()
+
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+    try:
+        async with AsyncFeedFetcher(limit_per_host=4) as fetcher:
+            await asyncio.gather(*(c.run(fetcher, semaphore, end_time, stop_event) for c in collectors))
+    finally:
+        for collector in collectors:
+            if collector.store is not None:
+                collector.store.close()
+
+    for collector in collectors:
+        logger.info(f"📊 {collector.source.agency}: {collector.collection_count} collections, "
+                    f"{collector.observation_count} observations")
+    return collectors
+
+
+def setup_logging():
+    """Configure logging to both file and console."""
+    LOG_FILE.parent.mkdir(parents=True, exist_ok=True)
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s | %(levelname)8s | %(message)s',
+        datefmt='%H:%M:%S',
+        handlers=[
+            logging.FileHandler(LOG_FILE),
+            logging.StreamHandler()
+        ]
+    )
+    return logging.getLogger(__name__)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Multi-agency GTFS-RT collector service")
+    parser.add_argument("config", type=Path, help="JSON file listing the feed sources")
+    parser.add_argument("--duration-hours", type=float, default=None)
+    parser.add_argument("--output-dir", type=Path, default=OUTPUT_DIR)
+    parser.add_argument("--storage", choices=["csv", "parquet"], default="csv")
+    args = parser.parse_args()
+
+    logger = setup_logging()
+    sources = load_sources(args.config)
+    logger.info(f"🌍 Monitoring {len(sources)} networks: {', '.join(s.agency for s in sources)}")
+
+    try:
+        asyncio.run(run_service(sources, args.duration_hours, args.output_dir, storage=args.storage))
+    except KeyboardInterrupt:
+        logger.info("⛔ Service stopped by user")
@@ -13,20 +13,37 @@ Architecture:
 - Saves to CSV with proper timestamp formatting
 - Handles errors gracefully with exponential backoff
 - Logs all activity for transparency
+- Optional --async mode: both feeds fetched concurrently over a keep-alive
+  session with conditional requests (see async_fetcher.py)
+- Optional --storage parquet: buffered, date/hour-partitioned Parquet files
+  instead of the append-only CSV (see observation_store.py)
+- Deduplication: identical polls are skipped, and a vehicle is only written
+  again when its position, delay or report timestamp changed
+- Optional --snap-stops: every position is snapped to its nearest GTFS stop
+  (see spatial_index.py)
+- Writes go through a bounded write-behind queue (see write_behind.py): a
+  slow disk no longer delays the next poll; SIGTERM drains it like Ctrl+C
 
 Author: Data Analyst Consultant
 Date: 2026-01-08
 """
 
-import csv
+import argparse
+import asyncio
+import threading
 import time
 import logging
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 import requests
 from google.transit import gtfs_realtime_pb2
 
+from feed_decoder import backend as protobuf_backend, parse_feed, payload_digest
+from observation_store import make_store
+from spatial_index import StopIndex
+from write_behind import WriteBehindQueue, install_sigterm_handler
+
 
 # ============================================================================
 # Configuration
@@ -37,7 +54,13 @@ VEHICLE_POSITIONS_URL = "https://ara-api.enroute.mobi/rla/gtfs/vehicle-positions
 COLLECTION_INTERVAL = 60  # seconds (1 minute)
 DATA_DIR = Path("data")
 CSV_FILE = DATA_DIR / "transit_observations.csv"
+PARQUET_DIR = DATA_DIR / "observations"
+STORAGE = "csv"  # "csv" or "parquet" (--storage)
 LOG_FILE = DATA_DIR / "collector.log"
+GTFS_DIR = DATA_DIR / "gtfs"
+SNAP_MAX_DISTANCE_M = 150  # farther than this from any stop: no stop_id
+
+logger = logging.getLogger(__name__)
 
 CSV_HEADERS = [
     "timestamp",           # ISO 8601 datetime of observation
@@ -49,6 +72,11 @@ CSV_HEADERS = [
     "longitude",          # GPS longitude
 ]
 
+STOP_HEADERS = [
+    "stop_id",            # Nearest GTFS stop ("" if farther than SNAP_MAX_DISTANCE_M)
+    "stop_distance_m",    # Distance to that stop in metres
+]
+
 
 # ============================================================================
 # Logging Setup
@@ -83,21 +111,29 @@ def fetch_gtfs_rt(url: str, timeout: int = 10) -> Optional[gtfs_realtime_pb2.Fee
         timeout: Request timeout in seconds
 
     Returns:
-        Parsed FeedMessage or None if fetch fails
+        Parsed FeedMessage (collector fields only, see feed_decoder.py) or None if fetch fails
+    """
+    return fetch_feed(url, timeout)[0]
+
+
+def fetch_feed(url: str, timeout: int = 10) -> Tuple[Optional[gtfs_realtime_pb2.FeedMessage], Optional[bytes]]:
+    """
+    Like fetch_gtfs_rt, plus the payload_digest() of the raw response.
+
+    Returns:
+        (feed, digest), (None, None) if the fetch or the parse fails
     """
     try:
         response = requests.get(url, timeout=timeout)
         response.raise_for_status()
 
-        feed = gtfs_realtime_pb2.FeedMessage()
-        feed.ParseFromString(response.content)
-        return feed
+        return parse_feed(response.content), payload_digest(response.content)
     except requests.exceptions.RequestException as e:
         logger.error(f"Failed to fetch {url}: {e}")
-        return None
+        return None, None
     except Exception as e:
         logger.error(f"Failed to parse feed from {url}: {e}")
-        return None
+        return None, None
 
 
 def extract_trip_delays(feed: gtfs_realtime_pb2.FeedMessage) -> Dict[str, int]:
@@ -155,15 +191,103 @@ def extract_vehicle_positions(feed: gtfs_realtime_pb2.FeedMessage) -> List[Dict]
             "vehicle_id": vehicle.vehicle.id if vehicle.HasField("vehicle") else "",
             "latitude": vehicle.position.latitude,
             "longitude": vehicle.position.longitude,
+            "reported_at": vehicle.timestamp,  # 0 when the feed does not give it
         })
 
     return vehicles
 
 
+# ============================================================================
+# Deduplication
+# ============================================================================
+
+class VehicleStateCache:
+    """
+    Last written state of every vehicle, to drop repeated observations.
+
+    The feed is polled every minute, but most vehicles have not moved nor
+    changed delay since the previous poll (or the feed itself has not been
+    republished). A vehicle is keyed by (vehicle_id, trip_id) and emitted
+    again only when its position, delay or own report timestamp changes.
+
+    The states of a poll are only pending until commit() is called, once its
+    batch has been handed to storage: a dropped batch is emitted again by
+    the next poll instead of being lost for stationary vehicles. forget()
+    (called when a save fails, possibly from the writer thread) makes the
+    next poll emit every vehicle again.
+    """
+
+    def __init__(self):
+        self._states: Dict[Tuple[str, str], Tuple] = {}
+        self._last_digest: Optional[Tuple[bytes, bytes]] = None
+        self._poll_digest: Optional[Tuple[bytes, bytes]] = None
+        self._pending: Optional[Tuple] = None   # (digest, states, epoch) of the last poll
+        self._epoch = 0                         # bumped by forget()
+        self._lock = threading.Lock()
+        self.stats = {"polls": 0, "skipped_polls": 0, "seen": 0, "emitted": 0}
+
+    def is_new_poll(self, trip_digest: bytes, vehicle_digest: bytes) -> bool:
+        """False if both raw payloads (payload_digest) are identical to the last committed poll."""
+        self.stats["polls"] += 1
+        self._pending = None
+        self._poll_digest = (trip_digest, vehicle_digest)
+        if self._poll_digest == self._last_digest:
+            self._poll_digest = None
+            self.stats["skipped_polls"] += 1
+            return False
+        return True
+
+    def changed(self, vehicles: List[Dict], delays: Dict[str, int]) -> List[Dict]:
+        """
+        Vehicles whose state differs from the last one committed.
+
+        Vehicles absent from this poll are forgotten (on commit), so the cache
+        only holds the vehicles currently in service.
+        """
+        with self._lock:
+            committed, epoch = self._states, self._epoch
+        states = {}
+        changed = []
+        for vehicle in vehicles:
+            key = (vehicle["vehicle_id"], vehicle["trip_id"])
+            state = (vehicle["latitude"], vehicle["longitude"],
+                     delays.get(vehicle["trip_id"], 0), vehicle["reported_at"])
+            if committed.get(key) != state:
+                changed.append(vehicle)
+            states[key] = state
+        self._pending = (self._poll_digest, states, epoch)
+        self._poll_digest = None
+        self.stats["seen"] += len(vehicles)
+        self.stats["emitted"] += len(changed)
+        return changed
+
+    def commit(self):
+        """The last poll's batch is queued or written: remember its states."""
+        if self._pending is None:
+            return
+        digest, states, epoch = self._pending
+        self._pending = None
+        with self._lock:
+            if epoch == self._epoch:   # no failed save since this poll was compared
+                self._states = states
+                self._last_digest = digest
+
+    def forget(self):
+        """Drop every state: the next poll emits all the vehicles in service."""
+        with self._lock:
+            self._epoch += 1
+            self._states = {}
+            self._last_digest = None
+
+
 # ============================================================================
 # Data Collection & Storage
 # ============================================================================
 
+_vehicle_states: Optional[VehicleStateCache] = VehicleStateCache()  # None with --keep-duplicates
+_stop_index: Optional[StopIndex] = None  # Set with --snap-stops
+
+
 def collect_observations() -> List[Dict]:
     """
     Collect one round of observations by fetching and merging both feeds.
@@ -174,19 +298,51 @@ def collect_observations() -> List[Dict]:
     logger.info("🔄 Fetching GTFS-RT feeds...")
 
     # Fetch both feeds
-    trip_feed = fetch_gtfs_rt(TRIP_UPDATES_URL)
-    vehicle_feed = fetch_gtfs_rt(VEHICLE_POSITIONS_URL)
+    trip_feed, trip_digest = fetch_feed(TRIP_UPDATES_URL)
+    vehicle_feed, vehicle_digest = fetch_feed(VEHICLE_POSITIONS_URL)
 
     if not trip_feed or not vehicle_feed:
         logger.warning("⚠️  Failed to fetch one or both feeds, skipping this round")
         return []
 
+    return merge_observations(trip_feed, vehicle_feed, _vehicle_states, _stop_index,
+                              (trip_digest, vehicle_digest))
+
+
+def merge_observations(trip_feed: gtfs_realtime_pb2.FeedMessage,
+                       vehicle_feed: gtfs_realtime_pb2.FeedMessage,
+                       state_cache: Optional[VehicleStateCache] = None,
+                       stop_index: Optional[StopIndex] = None,
+                       digests: Optional[Tuple[bytes, bytes]] = None) -> List[Dict]:
+    """
+    Merge trip delays into vehicle positions (one observation per vehicle).
+
+    Args:
+        state_cache: If given, only the vehicles whose state changed are
+                     returned; call state_cache.commit() once they are stored.
+        stop_index: If given, every observation gets the nearest stop_id and
+                    its distance (whole poll snapped in one batch).
+        digests: payload_digest() of both raw payloads; with state_cache,
+                 a poll identical to the last committed one yields nothing.
+
+    Returns:
+        List of observation dictionaries ready for CSV writing
+    """
+    if state_cache is not None and digests is not None and not state_cache.is_new_poll(*digests):
+        logger.info("⏸️  Feeds identical to the previous poll, nothing new")
+        return []
+
     # Extract data
     delays = extract_trip_delays(trip_feed)
     vehicles = extract_vehicle_positions(vehicle_feed)
 
     logger.info(f"📊 Found {len(delays)} trips with delay info, {len(vehicles)} vehicles with positions")
 
+    if state_cache is not None:
+        total = len(vehicles)
+        vehicles = state_cache.changed(vehicles, delays)
+        logger.info(f"🧹 {total - len(vehicles)} unchanged vehicles skipped")
+
     # Merge: add delay information to each vehicle observation
     timestamp = datetime.now().isoformat()
     observations = []
@@ -205,36 +361,46 @@ def collect_observations() -> List[Dict]:
             "longitude": vehicle["longitude"],
         })
 
+    if stop_index is not None and observations:
+        stop_ids, distances = stop_index.snap([obs["latitude"] for obs in observations],
+                                              [obs["longitude"] for obs in observations],
+                                              SNAP_MAX_DISTANCE_M)
+        for obs, stop_id, distance in zip(observations, stop_ids, distances.tolist()):
+            obs["stop_id"] = stop_id
+            obs["stop_distance_m"] = round(distance, 1)
+
     logger.info(f"✅ Collected {len(observations)} enriched observations")
     return observations
 
 
+_store = None
+
+
 def save_observations(observations: List[Dict]):
     """
     Append observations to CSV file (creates file with headers if needed).
+
+    With --storage parquet, observations are buffered instead and flushed
+    as partitioned Parquet files (see observation_store.py).
     """
     if not observations:
         return
 
-    # Create data directory if needed
-    DATA_DIR.mkdir(exist_ok=True)
-
-    # Check if file exists to determine if we need to write headers
-    file_exists = CSV_FILE.exists()
-
+    global _store
     try:
-        with open(CSV_FILE, 'a', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=CSV_HEADERS)
-
-            if not file_exists:
-                writer.writeheader()
-                logger.info(f"📝 Created new CSV file: {CSV_FILE}")
-
-            writer.writerows(observations)
-            logger.info(f"💾 Saved {len(observations)} observations to {CSV_FILE}")
-
+        if _store is None:
+            _store = make_store(STORAGE, CSV_HEADERS, CSV_FILE, PARQUET_DIR)
+        _store.append(observations)
     except Exception as e:
         logger.error(f"❌ Failed to save observations: {e}")
+        if _vehicle_states is not None:
+            _vehicle_states.forget()   # unchanged vehicles would never be written again
+
+
+def close_storage():
+    """Flush the observations still buffered for Parquet."""
+    if _store is not None:
+        _store.close()
 
 
 # ============================================================================
@@ -253,7 +419,8 @@ def run_collector(duration_hours: Optional[float] = None):
     logger.info("🚍 Nice Traffic Watch - Data Collector Started")
     logger.info("=" * 70)
     logger.info(f"📂 Data directory: {DATA_DIR.absolute()}")
-    logger.info(f"📄 CSV file: {CSV_FILE.absolute()}")
+    logger.info(f"📄 Output: {CSV_FILE.absolute() if STORAGE == 'csv' else PARQUET_DIR.absolute()}")
+    logger.info(f"🧬 Protobuf backend: {protobuf_backend()}")
     logger.info(f"⏱️  Collection interval: {COLLECTION_INTERVAL} seconds")
 
     if duration_hours:
@@ -267,6 +434,8 @@ def run_collector(duration_hours: Optional[float] = None):
 
     collection_count = 0
     error_count = 0
+    # Disk I/O off the poll loop; the store is closed by the writer thread, after its last save
+    writer = WriteBehindQueue(save_observations, on_close=close_storage)
 
     try:
         while True:
@@ -280,7 +449,8 @@ def run_collector(duration_hours: Optional[float] = None):
             # Collect and save data
             try:
                 observations = collect_observations()
-                save_observations(observations)
+                if writer.put(observations) and _vehicle_states is not None:
+                    _vehicle_states.commit()
                 collection_count += 1
                 error_count = 0  # Reset error count on success
             except Exception as e:
@@ -307,24 +477,114 @@ def run_collector(duration_hours: Optional[float] = None):
         logger.info("⛔ Collector stopped by user (Ctrl+C)")
 
     finally:
+        writer.close()
         logger.info("=" * 70)
         logger.info(f"📊 Final Stats:")
         logger.info(f"   - Total collections: {collection_count}")
-        logger.info(f"   - CSV file: {CSV_FILE.absolute()}")
-        if CSV_FILE.exists():
+        if _vehicle_states is not None:
+            stats = _vehicle_states.stats
+            logger.info(f"   - Observations written: {stats['emitted']}/{stats['seen']} "
+                        f"({stats['skipped_polls']} identical polls skipped)")
+        if STORAGE == "parquet":
+            logger.info(f"   - Parquet directory: {PARQUET_DIR.absolute()}")
+        else:
+            logger.info(f"   - CSV file: {CSV_FILE.absolute()}")
+        if STORAGE == "csv" and CSV_FILE.exists():
             size_mb = CSV_FILE.stat().st_size / 1024 / 1024
             logger.info(f"   - File size: {size_mb:.2f} MB")
         logger.info("=" * 70)
         logger.info("👋 Goodbye!")
 
 
+def run_collector_async(duration_hours: Optional[float] = None):
+    """
+    Run the collector on asyncio: both feeds are fetched concurrently over a
+    persistent keep-alive session, unchanged feeds (304 / same header
+    timestamp) are skipped, and polls follow the feed header timestamp.
+
+    Args:
+        duration_hours: If specified, run for this many hours then stop.
+                       If None, run indefinitely.
+    """
+    from async_fetcher import AsyncFeedFetcher, poll_feeds
+
+    logger.info("=" * 70)
+    logger.info("🚍 Nice Traffic Watch - Data Collector Started (async mode)")
+    logger.info("=" * 70)
+    logger.info(f"📄 Output: {CSV_FILE.absolute() if STORAGE == 'csv' else PARQUET_DIR.absolute()}")
+    logger.info(f"🧬 Protobuf backend: {protobuf_backend()}")
+    logger.info(f"🌐 Feeds: {TRIP_UPDATES_URL} | {VEHICLE_POSITIONS_URL}")
+    end_time = time.time() + duration_hours * 3600 if duration_hours else None
+    collection_count = 0
+    writer = WriteBehindQueue(save_observations, on_close=close_storage)
+
+    async def handle(results):
+        nonlocal collection_count
+        trip_result, vehicle_result = results
+        observations = merge_observations(trip_result.feed, vehicle_result.feed, _vehicle_states, _stop_index,
+                                          (trip_result.digest, vehicle_result.digest))
+        # Keep the event loop free for the next fetch while writing
+        if await asyncio.to_thread(writer.put, observations) and _vehicle_states is not None:  # only waits if full
+            _vehicle_states.commit()
+        collection_count += 1
+
+    async def collect():
+        async with AsyncFeedFetcher() as fetcher:
+            await poll_feeds(fetcher, [TRIP_UPDATES_URL, VEHICLE_POSITIONS_URL], handle,
+                             interval=COLLECTION_INTERVAL, end_time=end_time)
+            logger.info(f"   - HTTP requests: {fetcher.stats['requests']} "
+                        f"({fetcher.stats['not_modified']} not modified)")
+
+    try:
+        asyncio.run(collect())
+    except KeyboardInterrupt:
+        logger.info("⛔ Collector stopped by user (Ctrl+C)")
+    finally:
+        writer.close()
+        logger.info(f"📊 Total collections: {collection_count}")
+
+
 # ============================================================================
 # Entry Point
 # ============================================================================
 
 if __name__ == "__main__":
-    logger = setup_logging()
-
+    parser = argparse.ArgumentParser(description="Nice Traffic Watch - GTFS-RT data collector")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="Concurrent keep-alive fetching with conditional requests (requires aiohttp)")
+    parser.add_argument("--feed-base-url",
+                        help="Fetch <base>/trip-updates and <base>/vehicle-positions instead "
+                             "(e.g. a local feed_server.py)")
     # Run for 8 hours (full work day) or indefinitely if you want
     # For testing, you can set a shorter duration like 0.1 hours (6 minutes)
-    run_collector(duration_hours=None)  # Run indefinitely
+    parser.add_argument("--duration-hours", type=float, default=None,
+                        help="Stop after this many hours (default: run indefinitely)")
+    parser.add_argument("--storage", choices=["csv", "parquet"], default="csv",
+                        help="Append to one CSV file, or write partitioned Parquet files (requires pyarrow)")
+    parser.add_argument("--keep-duplicates", action="store_true",
+                        help="Write every vehicle on every poll, even when nothing changed")
+    parser.add_argument("--snap-stops", action="store_true",
+                        help="Add the nearest GTFS stop of every vehicle (needs data/gtfs/stops.txt)")
+    args = parser.parse_args()
+
+    logger = setup_logging()
+    install_sigterm_handler()
+    STORAGE = args.storage
+    if args.keep_duplicates:
+        _vehicle_states = None
+    if args.snap_stops:
+        _stop_index = StopIndex.from_gtfs(GTFS_DIR)
+        logger.info(f"🗺️  {len(_stop_index):,} stops indexed for snapping")
+        # Separate file: never mix two schemas in one CSV
+        CSV_FILE = DATA_DIR / "transit_observations_stops.csv"
+        PARQUET_DIR = DATA_DIR / "observations_stops"
+        CSV_HEADERS = CSV_HEADERS + STOP_HEADERS
+
+    if args.feed_base_url:
+        TRIP_UPDATES_URL = f"{args.feed_base_url.rstrip('/')}/trip-updates"
+        VEHICLE_POSITIONS_URL = f"{args.feed_base_url.rstrip('/')}/vehicle-positions"
+
+    if args.use_async:
+        run_collector_async(duration_hours=args.duration_hours)
+    else:
+        run_collector(duration_hours=args.duration_hours)
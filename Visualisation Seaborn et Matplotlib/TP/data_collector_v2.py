@@ -6,25 +6,48 @@ Elegant collector that calculates real delays by comparing
 real-time arrivals with scheduled times from static GTFS.
 
 This version:
-- Loads static GTFS schedules into memory for fast lookups
+- Loads static GTFS schedules for fast lookups (stop_times are compiled once
+  to memory-mapped NumPy arrays, see schedule_store.py)
 - Calculates actual delays (not just positions)
 - Enriches data with route type (bus vs tram)
 - Handles missing data gracefully
+- Delays computed per feed in one vectorised batch (see delay_batch.py)
+- Running per-(route, hour, transport type) delay statistics, saved after
+  every poll to data/delay_aggregates.json for the dashboard (aggregation.py)
+- Service-day aware: only trips running that day (calendar.txt +
+  calendar_dates.txt, see service_calendar.py) are matched, and times past
+  24:00 are resolved against the previous day's service
+- Optional --async mode: concurrent keep-alive fetching with conditional
+  requests (see async_fetcher.py)
+- Optional --storage parquet: buffered, date/hour-partitioned Parquet files
+  instead of the append-only CSV (see observation_store.py)
+- Writes go through a bounded write-behind queue (see write_behind.py): a
+  slow disk no longer delays the next poll; SIGTERM drains it like Ctrl+C
 
 Author: Data Analyst Consultant
 Date: 2026-01-08
 """
 
-import csv
+import argparse
+import asyncio
 import time
 import logging
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
-from collections import defaultdict
+from typing import Dict, List, Optional
+import numpy as np
 import requests
 from google.transit import gtfs_realtime_pb2
 
+from aggregation import DelayAggregator, source_token
+from delay_batch import calculate_delays_batch, service_day_midnight
+from feed_decoder import backend as protobuf_backend, parse_feed
+from gtfs_loader import load_routes, load_trips
+from observation_store import make_store
+from schedule_store import CompiledSchedule, format_gtfs_time
+from service_calendar import ServiceCalendar
+from write_behind import WriteBehindQueue, install_sigterm_handler
+
 
 # ============================================================================
 # Configuration
@@ -36,8 +59,14 @@ COLLECTION_INTERVAL = 60  # seconds
 DATA_DIR = Path("data")
 GTFS_DIR = DATA_DIR / "gtfs"
 CSV_FILE = DATA_DIR / "transit_delays.csv"
+PARQUET_DIR = DATA_DIR / "delays"
+AGGREGATES_FILE = DATA_DIR / "delay_aggregates.json"
+STORAGE = "csv"  # "csv" or "parquet" (--storage)
+ROUTE_IDS: Optional[List[str]] = None  # monitored route_ids, None = all (--routes)
 LOG_FILE = DATA_DIR / "collector_v2.log"
 
+logger = logging.getLogger(__name__)
+
 CSV_HEADERS = [
     "timestamp",          # ISO 8601 datetime of observation
     "trip_id",            # Unique trip identifier
@@ -60,84 +89,123 @@ CSV_HEADERS = [
 class GTFSSchedule:
     """Efficient in-memory GTFS schedule for delay calculation."""
 
-    def __init__(self, gtfs_dir: Path):
+    def __init__(self, gtfs_dir: Path, route_ids: Optional[List[str]] = None):
         self.gtfs_dir = gtfs_dir
-        self.routes = {}  # route_id -> route_info
-        self.trips = {}   # trip_id -> trip_info
-        self.stop_times = defaultdict(list)  # trip_id -> [(stop_sequence, stop_id, arrival_time), ...]
+        self.route_ids = set(route_ids) if route_ids else None  # None = whole network
+        self.routes = {}         # route_id -> route_info
+        self.trip_routes = {}    # trip_id -> route_id
+        self.trip_services = {}  # trip_id -> service_id
+        self.stop_times: Optional[CompiledSchedule] = None  # memory-mapped stop_times.txt
+        self.calendar: Optional[ServiceCalendar] = None
+        self._trip_service: Optional[np.ndarray] = None  # compiled trip -> service index (-1 unknown)
+        self._active_trips: Dict[date, np.ndarray] = {}  # service day -> bool[n_trips]
 
     def load(self):
         """Load GTFS tables into memory."""
         logger.info("📚 Loading static GTFS schedules...")
 
-        # Load routes (to get route_type: bus vs tram)
-        routes_file = self.gtfs_dir / "routes.txt"
-        with open(routes_file, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                self.routes[row['route_id']] = {
-                    'route_short_name': row.get('route_short_name', row['route_id']),
-                    'route_type': int(row['route_type']),
-                }
+        # Load routes (to get route_type: bus vs tram) and trips (to map
+        # trip_id -> route_id, service_id). Only the needed columns are
+        # parsed, and only the configured routes are kept (see gtfs_loader.py)
+        self.routes = load_routes(self.gtfs_dir, self.route_ids)
         logger.info(f"   ✓ Loaded {len(self.routes)} routes")
 
-        # Load trips (to map trip_id -> route_id)
-        trips_file = self.gtfs_dir / "trips.txt"
-        with open(trips_file, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                self.trips[row['trip_id']] = {
-                    'route_id': row['route_id'],
-                    'service_id': row.get('service_id', ''),
-                }
-        logger.info(f"   ✓ Loaded {len(self.trips)} trips")
+        self.trip_routes, self.trip_services = load_trips(self.gtfs_dir, self.route_ids)
+        logger.info(f"   ✓ Loaded {len(self.trip_routes)} trips")
 
         # Load stop_times (scheduled arrivals)
-        # NOTE: This is a large file (36MB), we'll only keep what we need
-        stop_times_file = self.gtfs_dir / "stop_times.txt"
-        logger.info("   ⏳ Loading stop times (this may take a moment)...")
-        with open(stop_times_file, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                trip_id = row['trip_id']
-                stop_seq = int(row.get('stop_sequence', 0))
-                stop_id = row['stop_id']
-                arrival_time = row.get('arrival_time', '')
-
-                self.stop_times[trip_id].append((stop_seq, stop_id, arrival_time))
-
-        # Sort stop times by sequence for each trip
-        for trip_id in self.stop_times:
-            self.stop_times[trip_id].sort(key=lambda x: x[0])
-
-        logger.info(f"   ✓ Loaded stop times for {len(self.stop_times)} trips")
+        # NOTE: stop_times.txt is a large file (36MB). It is compiled once into
+        # columnar NumPy arrays and memory-mapped on every later start.
+        if not CompiledSchedule.is_fresh(self.gtfs_dir):
+            logger.info("   ⏳ Compiling stop times (one-time, this may take a moment)...")
+        self.stop_times = CompiledSchedule.open(self.gtfs_dir)
+        # (trip, stop) -> arrival index, built once for the whole network
+        self.stop_times.build_lookup_keys()
+
+        logger.info(f"   ✓ Loaded stop times for {len(self.stop_times)} trips (memory-mapped)")
+
+        # Services x days bitmap, cached next to the compiled stop times
+        self.calendar = ServiceCalendar.open(self.gtfs_dir)
+        service_index = self.calendar.service_index
+        self._trip_service = np.array(
+            [service_index.get(self.trip_services.get(trip_id), -1)
+             for trip_id in self.stop_times.trip_ids],
+            dtype=np.int32,
+        )
+        self._active_trips.clear()
+        logger.info(f"   ✓ Loaded calendar for {len(service_index)} services "
+                    f"({self.calendar.first_date} -> {self.calendar.last_date})")
         logger.info("✅ GTFS schedules loaded successfully!")
 
     def get_route_type(self, route_id: str) -> int:
         """Get route type (0=Tram, 3=Bus)."""
         return self.routes.get(route_id, {}).get('route_type', 3)
 
-    def get_scheduled_arrival(self, trip_id: str, stop_id: str) -> Optional[str]:
-        """Get scheduled arrival time for a trip at a specific stop."""
-        if trip_id not in self.stop_times:
-            return None
-
-        for seq, sid, arrival_time in self.stop_times[trip_id]:
-            if sid == stop_id:
-                return arrival_time
-
-        return None
+    def includes_trip(self, trip_id: str) -> bool:
+        """False for trips outside the configured route subset."""
+        return self.route_ids is None or trip_id in self.trip_routes
+
+    def active_trips(self, service_day: date) -> np.ndarray:
+        """
+        bool[n_trips] over the compiled trips: True if the trip runs on that
+        service day. Trips with an unknown service_id are kept, and so is
+        everything when the day is outside the calendar (stale GTFS).
+        """
+        mask = self._active_trips.get(service_day)
+        if mask is not None:
+            return mask
+
+        if self.calendar is None or not self.calendar.covers(service_day):
+            if self.calendar is not None:
+                logger.warning(f"⚠️  GTFS calendar does not cover {service_day}, "
+                               f"not filtering trips by service day (update {self.gtfs_dir})")
+            mask = np.ones(len(self.stop_times), dtype=bool)
+        else:
+            services = self.calendar.active_services(service_day)
+            mask = np.where(self._trip_service >= 0, services[self._trip_service], True)
+
+        if len(self._active_trips) >= 4:  # only today/yesterday are ever needed
+            self._active_trips.clear()
+        self._active_trips[service_day] = mask
+        return mask
+
+    def scheduled_timestamp(self, trip_id: str, scheduled_seconds: int, actual_time: int,
+                            today: date) -> Optional[int]:
+        """
+        POSIX timestamp of a scheduled time, on the right service day.
+
+        GTFS times are relative to the service day, and may exceed 24:00 for
+        trips running past midnight: a 25:10 arrival seen at 01:10 belongs to
+        yesterday's service. Both today and yesterday are tried, keeping only
+        the days the trip actually runs (closest to the actual time if both).
+        Returns None if the trip runs on neither day.
+        """
+        trip_idx = self.stop_times.trip_index.get(trip_id)
+        best = None
+        for day in (today, today - timedelta(days=1)):
+            if trip_idx is not None and not self.active_trips(day)[trip_idx]:
+                continue
+            candidate = service_day_midnight(day) + scheduled_seconds
+            if best is None or abs(actual_time - candidate) < abs(actual_time - best):
+                best = candidate
+        return best
+
+    def get_scheduled_seconds(self, trip_id: str, stop_id: str,
+                              stop_sequence: Optional[int] = None) -> Optional[int]:
+        """
+        Get scheduled arrival for a trip at a stop, in seconds since midnight.
+
+        Binary search in the sorted (trip, stop) keys built at load time, the
+        same index as the batch path. When the feed provides stop_sequence it
+        is used as the key, which keeps loop trips (same stop visited twice)
+        correct.
+        """
+        return self.stop_times.arrival(trip_id, stop_id, stop_sequence)
 
-    def time_to_seconds(self, time_str: str) -> int:
-        """Convert HH:MM:SS to seconds since midnight (handles >24h)."""
-        try:
-            parts = time_str.split(':')
-            hours = int(parts[0])
-            minutes = int(parts[1])
-            seconds = int(parts[2])
-            return hours * 3600 + minutes * 60 + seconds
-        except:
-            return 0
+    def get_scheduled_arrival(self, trip_id: str, stop_id: str) -> Optional[str]:
+        """Get scheduled arrival time (HH:MM:SS) for a trip at a specific stop."""
+        seconds = self.get_scheduled_seconds(trip_id, stop_id)
+        return format_gtfs_time(seconds) if seconds is not None else None
 
 
 # ============================================================================
@@ -169,9 +237,7 @@ def fetch_gtfs_rt(url: str, timeout: int = 10) -> Optional[gtfs_realtime_pb2.Fee
     try:
         response = requests.get(url, timeout=timeout)
         response.raise_for_status()
-        feed = gtfs_realtime_pb2.FeedMessage()
-        feed.ParseFromString(response.content)
-        return feed
+        return parse_feed(response.content)
     except Exception as e:
         logger.error(f"Failed to fetch {url}: {e}")
         return None
@@ -181,6 +247,10 @@ def calculate_delays(trip_feed, vehicle_feed, schedule: GTFSSchedule) -> List[Di
     """
     Calculate delays by comparing real-time arrivals with schedules.
 
+    Per-update reference implementation; the collection loops use the
+    vectorised delay_batch.calculate_delays_batch(), which returns the same
+    observations.
+
     Returns:
         List of delay observations with full context
     """
@@ -201,7 +271,9 @@ def calculate_delays(trip_feed, vehicle_feed, schedule: GTFSSchedule) -> List[Di
 
     # Process trip updates to find delays
     observations = []
-    timestamp = datetime.now().isoformat()
+    now = datetime.now()
+    timestamp = now.isoformat()
+    today = now.date()
 
     for entity in trip_feed.entity:
         if not entity.HasField("trip_update"):
@@ -211,6 +283,9 @@ def calculate_delays(trip_feed, vehicle_feed, schedule: GTFSSchedule) -> List[Di
         trip_id = trip_update.trip.trip_id
         route_id = trip_update.trip.route_id
 
+        if not schedule.includes_trip(trip_id):
+            continue  # Route not monitored
+
         # Get vehicle position if available
         vehicle_data = vehicles.get(trip_id, {})
         if not vehicle_data:
@@ -222,6 +297,7 @@ def calculate_delays(trip_feed, vehicle_feed, schedule: GTFSSchedule) -> List[Di
         # Process each stop time update
         for stu in trip_update.stop_time_update:
             stop_id = stu.stop_id
+            stop_sequence = stu.stop_sequence if stu.HasField('stop_sequence') else None
 
             # Get actual time (prefer arrival, fallback to departure)
             actual_time = None
@@ -233,19 +309,17 @@ def calculate_delays(trip_feed, vehicle_feed, schedule: GTFSSchedule) -> List[Di
             if not actual_time:
                 continue
 
-            # Get scheduled time from static GTFS
-            scheduled_time_str = schedule.get_scheduled_arrival(trip_id, stop_id)
-            if not scheduled_time_str:
+            # Get scheduled time from static GTFS (seconds since midnight)
+            scheduled_seconds = schedule.get_scheduled_seconds(trip_id, stop_id, stop_sequence)
+            if scheduled_seconds is None:
                 continue
 
             # Calculate delay
             try:
-                # Convert scheduled time to timestamp (approximate - assumes today)
-                scheduled_seconds = schedule.time_to_seconds(scheduled_time_str)
-                now = datetime.now()
-                scheduled_dt = now.replace(hour=0, minute=0, second=0, microsecond=0)
-                scheduled_dt += timedelta(seconds=scheduled_seconds)
-                scheduled_timestamp = int(scheduled_dt.timestamp())
+                # Convert scheduled time to timestamp on the trip's service day
+                scheduled_timestamp = schedule.scheduled_timestamp(trip_id, scheduled_seconds, actual_time, today)
+                if scheduled_timestamp is None:
+                    continue  # Trip does not run today nor yesterday
 
                 # Calculate delay in seconds
                 delay_seconds = actual_time - scheduled_timestamp
@@ -284,32 +358,52 @@ def collect_observations(schedule: GTFSSchedule) -> List[Dict]:
     trip_feed = fetch_gtfs_rt(TRIP_UPDATES_URL)
     vehicle_feed = fetch_gtfs_rt(VEHICLE_POSITIONS_URL)
 
-    observations = calculate_delays(trip_feed, vehicle_feed, schedule)
+    observations = calculate_delays_batch(trip_feed, vehicle_feed, schedule)
     logger.info(f"✅ Calculated {len(observations)} delay observations")
 
     return observations
 
 
-def save_observations(observations: List[Dict]):
-    """Append observations to CSV."""
-    if not observations:
-        return
+_store = None
+_aggregator: Optional[DelayAggregator] = None
 
-    file_exists = CSV_FILE.exists()
 
+def update_aggregates(observations: List[Dict]):
+    """Fold a poll into the running aggregates and persist the snapshot."""
+    global _aggregator
     try:
-        with open(CSV_FILE, 'a', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=CSV_HEADERS)
+        if _aggregator is None:
+            _aggregator = DelayAggregator.open(AGGREGATES_FILE)
+        _aggregator.update(observations)
+        # Which bytes of the CSV the snapshot covers (checked by the dashboard)
+        _aggregator.source = source_token(CSV_FILE) if STORAGE == "csv" else None
+        _aggregator.save(AGGREGATES_FILE)
+    except Exception as e:
+        logger.error(f"❌ Failed to update aggregates: {e}")
 
-            if not file_exists:
-                writer.writeheader()
-                logger.info(f"📝 Created new CSV: {CSV_FILE}")
 
-            writer.writerows(observations)
-            logger.info(f"💾 Saved {len(observations)} observations")
+def save_observations(observations: List[Dict]):
+    """Append observations to CSV, or buffer them for Parquet (--storage parquet)."""
+    if not observations:
+        return
 
+    global _store
+    try:
+        if _store is None:
+            _store = make_store(STORAGE, CSV_HEADERS, CSV_FILE, PARQUET_DIR)
+        _store.append(observations)
     except Exception as e:
         logger.error(f"❌ Failed to save: {e}")
+        return
+
+    # Only once written: the snapshot must describe the stored observations
+    update_aggregates(observations)
+
+
+def close_storage():
+    """Flush the observations still buffered for Parquet."""
+    if _store is not None:
+        _store.close()
 
 
 # ============================================================================
@@ -323,11 +417,12 @@ def run_collector(duration_hours: Optional[float] = None):
     logger.info("=" * 70)
 
     # Load GTFS schedules
-    schedule = GTFSSchedule(GTFS_DIR)
+    schedule = GTFSSchedule(GTFS_DIR, ROUTE_IDS)
     schedule.load()
 
     logger.info(f"📂 Data directory: {DATA_DIR.absolute()}")
-    logger.info(f"📄 CSV file: {CSV_FILE.absolute()}")
+    logger.info(f"📄 Output: {CSV_FILE.absolute() if STORAGE == 'csv' else PARQUET_DIR.absolute()}")
+    logger.info(f"🧬 Protobuf backend: {protobuf_backend()}")
     logger.info(f"⏱️  Interval: {COLLECTION_INTERVAL}s")
 
     if duration_hours:
@@ -341,6 +436,8 @@ def run_collector(duration_hours: Optional[float] = None):
 
     collection_count = 0
     error_count = 0
+    # Disk I/O off the poll loop; the store is closed by the writer thread, after its last save
+    writer = WriteBehindQueue(save_observations, on_close=close_storage)
 
     try:
         while True:
@@ -351,7 +448,7 @@ def run_collector(duration_hours: Optional[float] = None):
 
             try:
                 observations = collect_observations(schedule)
-                save_observations(observations)
+                writer.put(observations)
                 collection_count += 1
                 error_count = 0
             except Exception as e:
@@ -374,18 +471,88 @@ def run_collector(duration_hours: Optional[float] = None):
         logger.info("\n⛔ Stopped by user")
 
     finally:
+        writer.close()
         logger.info("=" * 70)
         logger.info(f"📊 Total collections: {collection_count}")
-        if CSV_FILE.exists():
+        if STORAGE == "csv" and CSV_FILE.exists():
             size_mb = CSV_FILE.stat().st_size / 1024 / 1024
             logger.info(f"📦 File size: {size_mb:.2f} MB")
         logger.info("=" * 70)
 
 
+def run_collector_async(duration_hours: Optional[float] = None):
+    """
+    Run the collector on asyncio: concurrent keep-alive fetching, unchanged
+    feeds skipped (304 / same header timestamp), polls aligned on the feed
+    header timestamp instead of a blind sleep.
+    """
+    from async_fetcher import AsyncFeedFetcher, poll_feeds
+
+    logger.info("=" * 70)
+    logger.info("🚍 Nice Traffic Watch - Smart Collector V2 (async mode)")
+    logger.info("=" * 70)
+
+    schedule = GTFSSchedule(GTFS_DIR, ROUTE_IDS)
+    schedule.load()
+
+    logger.info(f"📄 Output: {CSV_FILE.absolute() if STORAGE == 'csv' else PARQUET_DIR.absolute()}")
+    logger.info(f"🧬 Protobuf backend: {protobuf_backend()}")
+    logger.info(f"🌐 Feeds: {TRIP_UPDATES_URL} | {VEHICLE_POSITIONS_URL}")
+    end_time = time.time() + duration_hours * 3600 if duration_hours else None
+    collection_count = 0
+    writer = WriteBehindQueue(save_observations, on_close=close_storage)
+
+    async def handle(results):
+        nonlocal collection_count
+        trip_result, vehicle_result = results
+        observations = calculate_delays_batch(trip_result.feed, vehicle_result.feed, schedule)
+        logger.info(f"✅ Calculated {len(observations)} delay observations")
+        await asyncio.to_thread(writer.put, observations)  # only waits if the queue is full
+        collection_count += 1
+
+    async def collect():
+        async with AsyncFeedFetcher() as fetcher:
+            await poll_feeds(fetcher, [TRIP_UPDATES_URL, VEHICLE_POSITIONS_URL], handle,
+                             interval=COLLECTION_INTERVAL, end_time=end_time)
+
+    try:
+        asyncio.run(collect())
+    except KeyboardInterrupt:
+        logger.info("\n⛔ Stopped by user")
+    finally:
+        writer.close()
+        logger.info("=" * 70)
+        logger.info(f"📊 Total collections: {collection_count}")
+        logger.info("=" * 70)
+
+
 # ============================================================================
 # Entry Point
 # ============================================================================
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Nice Traffic Watch - Smart Collector V2")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="Concurrent keep-alive fetching with conditional requests (requires aiohttp)")
+    parser.add_argument("--feed-base-url",
+                        help="Fetch <base>/trip-updates and <base>/vehicle-positions instead "
+                             "(e.g. a local feed_server.py)")
+    parser.add_argument("--duration-hours", type=float, default=None)
+    parser.add_argument("--routes", help="Only monitor these route_ids (comma-separated, e.g. 09,61)")
+    parser.add_argument("--storage", choices=["csv", "parquet"], default="csv",
+                        help="Append to one CSV file, or write partitioned Parquet files (requires pyarrow)")
+    args = parser.parse_args()
+
     logger = setup_logging()
-    run_collector(duration_hours=None)
+    install_sigterm_handler()
+    STORAGE = args.storage
+    ROUTE_IDS = args.routes.split(",") if args.routes else None
+
+    if args.feed_base_url:
+        TRIP_UPDATES_URL = f"{args.feed_base_url.rstrip('/')}/trip-updates"
+        VEHICLE_POSITIONS_URL = f"{args.feed_base_url.rstrip('/')}/vehicle-positions"
+
+    if args.use_async:
+        run_collector_async(duration_hours=args.duration_hours)
+    else:
+        run_collector(duration_hours=args.duration_hours)
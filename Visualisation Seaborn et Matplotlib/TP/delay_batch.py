@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+🧮 Nice Traffic Watch - Vectorised Delay Computation
+=====================================================
+Batch version of data_collector_v2.calculate_delays().
+
+The per-update loop of calculate_delays() calls datetime.now(), replace()
+and builds a timedelta for every stop_time_update, creates a dict per
+observation and re-checks HasField on every level. Here:
+
+1. The feeds are flattened in a single pass into columnar arrays
+   (trip index, stop index, stop_sequence, actual time, vehicle row)
+2. Scheduled arrivals are resolved for the whole batch at once with
+   CompiledSchedule.arrivals_for() (searchsorted over sorted keys)
+3. The service-day midnights (today, yesterday) are computed once;
+   service-day resolution, scheduled timestamps, delays and the
+   [-600, 3600] window filter are NumPy expressions
+
+Rows only become dicts at the very end, for the storage backends.
+
+Usage (benchmark against calculate_delays):
+    python delay_batch.py --vehicles 5000
+    python delay_batch.py --trip-updates tu.pb --vehicle-positions vp.pb
+"""
+
+import argparse
+import logging
+import time
+from array import array
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+from google.transit import gtfs_realtime_pb2
+
+from schedule_store import MISSING_TIME
+
+
+MIN_DELAY = -600    # seconds, earlier arrivals are considered noise
+MAX_DELAY = 3600    # seconds, later arrivals are considered noise
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class FeedColumns:
+    """One row per stop_time_update with an actual time and a known vehicle."""
+    trip_idx: np.ndarray        # int64, index in CompiledSchedule.trip_ids (-1 = unknown)
+    stop_idx: np.ndarray        # int64, index in CompiledSchedule.stop_ids (-1 = unknown)
+    stop_sequence: np.ndarray   # int64, -1 when the feed does not give it
+    actual_time: np.ndarray     # int64, POSIX seconds
+    vehicle_row: np.ndarray     # int64, row in the vehicle columns below
+    trip_ids: List[str]
+    route_ids: List[str]
+    stop_ids: List[str]
+    vehicle_ids: List[str]      # per vehicle row
+    latitudes: np.ndarray       # float64, per vehicle row
+    longitudes: np.ndarray      # float64, per vehicle row
+
+    def __len__(self) -> int:
+        return len(self.actual_time)
+
+
+def flatten_feeds(trip_feed, vehicle_feed, schedule) -> FeedColumns:
+    """
+    Flatten trip updates joined with vehicle positions into columns.
+
+    Same selection rules as calculate_delays(): trips without a vehicle
+    position or outside the monitored routes are skipped, and so are
+    updates without an arrival or departure time (arrival preferred).
+    """
+    # trip_id -> vehicle row (last entity wins, like the dict in calculate_delays)
+    vehicle_rows: Dict[str, int] = {}
+    vehicle_ids: List[str] = []
+    latitudes, longitudes = array('d'), array('d')
+    for entity in vehicle_feed.entity:
+        if not entity.HasField("vehicle"):
+            continue
+        v = entity.vehicle
+        if not v.trip.trip_id or not v.HasField("position"):
+            continue
+        vehicle_rows[v.trip.trip_id] = len(vehicle_ids)
+        vehicle_ids.append(v.vehicle.id if v.HasField("vehicle") else "")
+        latitudes.append(v.position.latitude)
+        longitudes.append(v.position.longitude)
+
+    trip_index = schedule.stop_times.trip_index
+    stop_index = schedule.stop_times.stop_index
+
+    trip_col, stop_col, seq_col, time_col, vehicle_col = (array('q') for _ in range(5))
+    trip_ids: List[str] = []
+    route_ids: List[str] = []
+    stop_ids: List[str] = []
+
+    for entity in trip_feed.entity:
+        if not entity.HasField("trip_update"):
+            continue
+        trip_update = entity.trip_update
+        trip_id = trip_update.trip.trip_id
+        row = vehicle_rows.get(trip_id)
+        if row is None or not schedule.includes_trip(trip_id):
+            continue
+        route_id = trip_update.trip.route_id
+        t_idx = trip_index.get(trip_id, -1)
+
+        for stu in trip_update.stop_time_update:
+            # Unset sub-messages read as 0, which calculate_delays skips anyway:
+            # no HasField round-trips needed for the times
+            actual = stu.arrival.time or stu.departure.time
+            if not actual:
+                continue
+            stop_id = stu.stop_id
+            trip_col.append(t_idx)
+            stop_col.append(stop_index.get(stop_id, -1))
+            seq_col.append(stu.stop_sequence if stu.HasField('stop_sequence') else -1)
+            time_col.append(actual)
+            vehicle_col.append(row)
+            trip_ids.append(trip_id)
+            route_ids.append(route_id)
+            stop_ids.append(stop_id)
+
+    return FeedColumns(
+        trip_idx=np.frombuffer(trip_col, dtype=np.int64),
+        stop_idx=np.frombuffer(stop_col, dtype=np.int64),
+        stop_sequence=np.frombuffer(seq_col, dtype=np.int64),
+        actual_time=np.frombuffer(time_col, dtype=np.int64),
+        vehicle_row=np.frombuffer(vehicle_col, dtype=np.int64),
+        trip_ids=trip_ids,
+        route_ids=route_ids,
+        stop_ids=stop_ids,
+        vehicle_ids=vehicle_ids,
+        latitudes=np.frombuffer(latitudes, dtype=np.float64),
+        longitudes=np.frombuffer(longitudes, dtype=np.float64),
+    )
+
+
+def service_day_midnight(day: Optional[date] = None) -> int:
+    """POSIX timestamp of local midnight starting a service day (default: today)."""
+    day = day or date.today()
+    return int(datetime.combine(day, datetime.min.time()).timestamp())
+
+
+def compute_delays(cols: FeedColumns, schedule, now: Optional[datetime] = None) -> Dict[str, np.ndarray]:
+    """
+    Scheduled timestamps and delays for a flattened batch.
+
+    Each row is resolved against today's and yesterday's service day (times
+    past 24:00 belong to yesterday), keeping only the days its trip runs
+    (GTFSSchedule.active_trips) and the closest one if both do.
+
+    Returns the row indices kept by the [MIN_DELAY, MAX_DELAY] window along
+    with their scheduled timestamp and delay, as NumPy arrays.
+    """
+    today = (now or datetime.now()).date()
+    yesterday = today - timedelta(days=1)
+    scheduled_seconds = schedule.stop_times.arrivals_for(cols.trip_idx, cols.stop_sequence, cols.stop_idx)
+
+    known = cols.trip_idx >= 0
+    trip_idx = np.where(known, cols.trip_idx, 0)
+    runs_today = ~known | schedule.active_trips(today)[trip_idx]
+    runs_yesterday = ~known | schedule.active_trips(yesterday)[trip_idx]
+
+    scheduled_today = service_day_midnight(today) + scheduled_seconds
+    scheduled_yesterday = service_day_midnight(yesterday) + scheduled_seconds
+    closer_yesterday = (np.abs(cols.actual_time - scheduled_yesterday)
+                        < np.abs(cols.actual_time - scheduled_today))
+    use_yesterday = runs_yesterday & (~runs_today | closer_yesterday)
+    scheduled = np.where(use_yesterday, scheduled_yesterday, scheduled_today)
+
+    delays = cols.actual_time - scheduled
+    keep = np.flatnonzero((scheduled_seconds != MISSING_TIME) & (runs_today | runs_yesterday)
+                          & (delays >= MIN_DELAY) & (delays <= MAX_DELAY))
+    return {"rows": keep, "scheduled_time": scheduled[keep], "delay_seconds": delays[keep]}
+
+
+def calculate_delays_batch(trip_feed, vehicle_feed, schedule,
+                           now: Optional[datetime] = None) -> List[Dict]:
+    """
+    Vectorised equivalent of data_collector_v2.calculate_delays().
+
+    Returns the same observation dicts (same keys, same filter).
+    """
+    if not trip_feed or not vehicle_feed:
+        return []
+
+    now = now or datetime.now()
+    timestamp = now.isoformat()
+    cols = flatten_feeds(trip_feed, vehicle_feed, schedule)
+    if not len(cols):
+        return []
+    result = compute_delays(cols, schedule, now)
+    rows = result["rows"]
+
+    route_types: Dict[str, int] = {}
+    latitudes, longitudes = cols.latitudes.tolist(), cols.longitudes.tolist()
+    observations = []
+    for i, scheduled, actual, delay, vrow in zip(rows.tolist(), result["scheduled_time"].tolist(),
+                                                 cols.actual_time[rows].tolist(),
+                                                 result["delay_seconds"].tolist(),
+                                                 cols.vehicle_row[rows].tolist()):
+        route_id = cols.route_ids[i]
+        route_type = route_types.get(route_id)
+        if route_type is None:
+            route_type = route_types[route_id] = schedule.get_route_type(route_id)
+        observations.append({
+            'timestamp': timestamp,
+            'trip_id': cols.trip_ids[i],
+            'route_id': route_id,
+            'route_type': route_type,
+            'vehicle_id': cols.vehicle_ids[vrow],
+            'stop_id': cols.stop_ids[i],
+            'scheduled_time': scheduled,
+            'actual_time': actual,
+            'delay_seconds': delay,
+            'latitude': latitudes[vrow],
+            'longitude': longitudes[vrow],
+        })
+    return observations
+
+
+# ============================================================================
+# Benchmark
+# ============================================================================
+
+def synthesize_feeds(schedule, n_vehicles: int, updates_per_trip: int = 20, seed: int = 0):
+    """Build a trip-updates / vehicle-positions pair with n_vehicles active trips."""
+    import random
+
+    rng = random.Random(seed)
+    midnight = service_day_midnight()
+    stamp = int(time.time())
+    trip_feed = gtfs_realtime_pb2.FeedMessage()
+    vehicle_feed = gtfs_realtime_pb2.FeedMessage()
+    for feed in (trip_feed, vehicle_feed):
+        feed.header.gtfs_realtime_version = "2.0"
+        feed.header.timestamp = stamp
+
+    trip_ids = schedule.stop_times.trip_ids
+    for i, trip_id in enumerate(rng.sample(trip_ids, min(n_vehicles, len(trip_ids)))):
+        route_id = schedule.trip_routes.get(trip_id, '')
+        entity = trip_feed.entity.add()
+        entity.id = f"tu-{i}"
+        entity.trip_update.trip.trip_id = trip_id
+        entity.trip_update.trip.route_id = route_id
+        for seq, stop_id, secs in schedule.stop_times.stop_times(trip_id)[:updates_per_trip]:
+            stu = entity.trip_update.stop_time_update.add()
+            stu.stop_id = stop_id
+            stu.stop_sequence = seq
+            stu.arrival.time = midnight + secs + rng.randint(-900, 4000)
+
+        entity = vehicle_feed.entity.add()
+        entity.id = f"vp-{i}"
+        vehicle = entity.vehicle
+        vehicle.trip.trip_id = trip_id
+        vehicle.trip.route_id = route_id
+        vehicle.vehicle.id = f"V{i}"
+        vehicle.position.latitude = 43.65 + rng.random() * 0.1
+        vehicle.position.longitude = 7.15 + rng.random() * 0.2
+    return trip_feed, vehicle_feed
+
+
+def _best_of(func, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(argv: Optional[List[str]] = None):
+    from data_collector_v2 import GTFS_DIR, GTFSSchedule, calculate_delays
+
+    parser = argparse.ArgumentParser(description="Benchmark calculate_delays vs calculate_delays_batch")
+    parser.add_argument("--gtfs-dir", type=Path, default=GTFS_DIR)
+    parser.add_argument("--vehicles", type=int, default=5000, help="Synthetic feed size")
+    parser.add_argument("--trip-updates", type=Path, help="Recorded trip-updates .pb (instead of synthetic)")
+    parser.add_argument("--vehicle-positions", type=Path, help="Recorded vehicle-positions .pb")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s | %(levelname)8s | %(message)s',
+                        datefmt='%H:%M:%S')
+    schedule = GTFSSchedule(args.gtfs_dir)
+    schedule.load()
+
+    if args.trip_updates and args.vehicle_positions:
+        trip_feed = gtfs_realtime_pb2.FeedMessage()
+        trip_feed.ParseFromString(args.trip_updates.read_bytes())
+        vehicle_feed = gtfs_realtime_pb2.FeedMessage()
+        vehicle_feed.ParseFromString(args.vehicle_positions.read_bytes())
+    else:
+        trip_feed, vehicle_feed = synthesize_feeds(schedule, args.vehicles)
+
+    n_updates = sum(len(e.trip_update.stop_time_update) for e in trip_feed.entity)
+    now = datetime.now()
+
+    # Warm both paths (arrival index / sorted keys), then check they agree
+    reference = calculate_delays(trip_feed, vehicle_feed, schedule)
+    batch = calculate_delays_batch(trip_feed, vehicle_feed, schedule, now=now)
+    strip = lambda rows: sorted((r['trip_id'], r['stop_id'], r['delay_seconds']) for r in rows)
+    if strip(reference) != strip(batch):
+        logger.warning("⚠️  Batch and per-update results differ")
+
+    loop_time = _best_of(lambda: calculate_delays(trip_feed, vehicle_feed, schedule), args.repeat)
+    batch_time = _best_of(lambda: calculate_delays_batch(trip_feed, vehicle_feed, schedule, now=now), args.repeat)
+    cols = flatten_feeds(trip_feed, vehicle_feed, schedule)
+    flatten_time = _best_of(lambda: flatten_feeds(trip_feed, vehicle_feed, schedule), args.repeat)
+    compute_time = _best_of(lambda: compute_delays(cols, schedule, now), args.repeat)
+
+    print(f"Feed: {len(vehicle_feed.entity):,} vehicles, {n_updates:,} stop time updates, "
+          f"{len(batch):,} observations kept")
+    print(f"calculate_delays        {loop_time * 1000:8.1f} ms")
+    print(f"calculate_delays_batch  {batch_time * 1000:8.1f} ms   (x{loop_time / batch_time:.1f})")
+    print(f"  flatten_feeds         {flatten_time * 1000:8.1f} ms")
+    print(f"  compute_delays        {compute_time * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+"""
+⚡ Nice Traffic Watch - GTFS-RT Decoding Layer
+===============================================
+Parses GTFS-RT payloads with only the fields the collectors read.
+
+gtfs_realtime_pb2.FeedMessage materialises every field of every entity
+(alerts, occupancy, bearing, speed, extensions...), while the collectors
+only read a dozen of them. Here:
+- Payloads are parsed into a trimmed copy of the schema (same field
+  numbers, same names): the other fields are not decoded into messages.
+  They are not dropped either: proto2 keeps them as raw unknown-field
+  bytes, which stay in memory with the feed and are written back by
+  SerializeToString(). DiscardUnknownFields() would free them, but costs
+  more than the parse (~70% on a 5 000-vehicle feed), so it is left to
+  callers that keep or re-serialise feeds. The trimmed messages have the
+  same attribute / HasField API, so extract_*() and flatten_feeds() work
+  on them unchanged.
+- The protobuf backend in use (upb, cpp or pure Python) is reported by
+  backend(); upb/cpp are picked automatically by the protobuf package when
+  installed (PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION overrides it).
+- vehicle_batch() / stop_time_update_batch() walk a feed once into
+  columns (record-batch view), convertible to a pyarrow.RecordBatch.
+
+Usage (micro-benchmark per backend, one subprocess each):
+    python feed_decoder.py snapshots/                 # feed_server.py layout
+    python feed_decoder.py tu.pb vp.pb --repeat 20
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+from array import array
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+from google.protobuf import descriptor_pb2, descriptor_pool, message_factory
+from google.protobuf.internal import api_implementation
+
+
+BACKENDS = ("upb", "cpp", "python")
+MISSING = -1  # stop_sequence / time sentinel when the feed does not give it
+
+# Trimmed gtfs-realtime.proto: message -> [(name, number, type, label, message type)]
+_F = descriptor_pb2.FieldDescriptorProto
+_OPTIONAL, _REPEATED = _F.LABEL_OPTIONAL, _F.LABEL_REPEATED
+_SCHEMA = {
+    "FeedMessage": [("header", 1, _F.TYPE_MESSAGE, _OPTIONAL, "FeedHeader"),
+                    ("entity", 2, _F.TYPE_MESSAGE, _REPEATED, "FeedEntity")],
+    "FeedHeader": [("gtfs_realtime_version", 1, _F.TYPE_STRING, _OPTIONAL, None),
+                   ("timestamp", 3, _F.TYPE_UINT64, _OPTIONAL, None)],
+    "FeedEntity": [("id", 1, _F.TYPE_STRING, _OPTIONAL, None),
+                   ("trip_update", 3, _F.TYPE_MESSAGE, _OPTIONAL, "TripUpdate"),
+                   ("vehicle", 4, _F.TYPE_MESSAGE, _OPTIONAL, "VehiclePosition")],
+    "TripUpdate": [("trip", 1, _F.TYPE_MESSAGE, _OPTIONAL, "TripDescriptor"),
+                   ("stop_time_update", 2, _F.TYPE_MESSAGE, _REPEATED, "StopTimeUpdate")],
+    "StopTimeUpdate": [("stop_sequence", 1, _F.TYPE_UINT32, _OPTIONAL, None),
+                       ("arrival", 2, _F.TYPE_MESSAGE, _OPTIONAL, "StopTimeEvent"),
+                       ("departure", 3, _F.TYPE_MESSAGE, _OPTIONAL, "StopTimeEvent"),
+                       ("stop_id", 4, _F.TYPE_STRING, _OPTIONAL, None)],
+    "StopTimeEvent": [("delay", 1, _F.TYPE_INT32, _OPTIONAL, None),
+                      ("time", 2, _F.TYPE_INT64, _OPTIONAL, None)],
+    "TripDescriptor": [("trip_id", 1, _F.TYPE_STRING, _OPTIONAL, None),
+                       ("route_id", 5, _F.TYPE_STRING, _OPTIONAL, None)],
+    "VehiclePosition": [("trip", 1, _F.TYPE_MESSAGE, _OPTIONAL, "TripDescriptor"),
+                        ("position", 2, _F.TYPE_MESSAGE, _OPTIONAL, "Position"),
+                        ("timestamp", 5, _F.TYPE_UINT64, _OPTIONAL, None),
+                        ("vehicle", 8, _F.TYPE_MESSAGE, _OPTIONAL, "VehicleDescriptor")],
+    "Position": [("latitude", 1, _F.TYPE_FLOAT, _OPTIONAL, None),
+                 ("longitude", 2, _F.TYPE_FLOAT, _OPTIONAL, None)],
+    "VehicleDescriptor": [("id", 1, _F.TYPE_STRING, _OPTIONAL, None)],
+}
+_PACKAGE = "nicetrafficwatch.trimmed"
+
+
+def _build_feed_message_class():
+    """Compile the trimmed schema in a private descriptor pool."""
+    file_proto = descriptor_pb2.FileDescriptorProto(
+        name="trimmed_gtfs_realtime.proto", package=_PACKAGE, syntax="proto2")
+    for message_name, fields in _SCHEMA.items():
+        message = file_proto.message_type.add(name=message_name)
+        for name, number, field_type, label, type_name in fields:
+            field = message.field.add(name=name, number=number, type=field_type, label=label)
+            if type_name:
+                field.type_name = f".{_PACKAGE}.{type_name}"
+    pool = descriptor_pool.DescriptorPool()
+    pool.Add(file_proto)
+    return message_factory.GetMessageClass(pool.FindMessageTypeByName(f"{_PACKAGE}.FeedMessage"))
+
+
+TrimmedFeedMessage = _build_feed_message_class()
+
+
+def backend() -> str:
+    """Protobuf implementation in use: 'upb', 'cpp' or 'python'."""
+    return api_implementation.Type()
+
+
+def parse_feed(payload: bytes):
+    """
+    Parse a GTFS-RT payload, decoding only the fields the collectors read.
+
+    Other fields are kept as unknown-field bytes (see the module docstring).
+    """
+    feed = TrimmedFeedMessage()
+    feed.ParseFromString(payload)
+    return feed
+
+
+def payload_digest(payload: bytes) -> bytes:
+    """Fingerprint of a raw payload, to spot a feed republished unchanged without re-serialising it."""
+    return hashlib.blake2b(payload, digest_size=16).digest()
+
+
+# ============================================================================
+# Record-batch view
+# ============================================================================
+
+@dataclass
+class VehicleBatch:
+    """One row per vehicle entity with a trip_id and a position."""
+    trip_ids: List[str]
+    route_ids: List[str]
+    vehicle_ids: List[str]      # "" when the feed does not give it
+    latitudes: np.ndarray       # float64
+    longitudes: np.ndarray      # float64
+    reported_at: np.ndarray     # int64, POSIX seconds (0 when not given)
+
+    def __len__(self) -> int:
+        return len(self.trip_ids)
+
+    def to_record_batch(self):
+        """Same columns as a pyarrow.RecordBatch (requires pyarrow)."""
+        import pyarrow as pa
+
+        return pa.RecordBatch.from_pydict({
+            "trip_id": self.trip_ids, "route_id": self.route_ids, "vehicle_id": self.vehicle_ids,
+            "latitude": self.latitudes, "longitude": self.longitudes, "reported_at": self.reported_at,
+        })
+
+
+@dataclass
+class StopTimeUpdateBatch:
+    """One row per stop_time_update of every trip update."""
+    trip_ids: List[str]
+    route_ids: List[str]
+    stop_ids: List[str]
+    stop_sequence: np.ndarray   # int64, MISSING when not given
+    arrival_time: np.ndarray    # int64, POSIX seconds, MISSING when not given
+    arrival_delay: np.ndarray   # float64, seconds, NaN when not given
+    departure_time: np.ndarray  # int64, POSIX seconds, MISSING when not given
+    departure_delay: np.ndarray  # float64, seconds, NaN when not given
+
+    def __len__(self) -> int:
+        return len(self.trip_ids)
+
+    def to_record_batch(self):
+        """Same columns as a pyarrow.RecordBatch (requires pyarrow); gaps become nulls."""
+        import pyarrow as pa
+
+        def column(values):
+            mask = np.isnan(values) if values.dtype.kind == "f" else values == MISSING
+            values = np.nan_to_num(values).astype(np.int64) if values.dtype.kind == "f" else values
+            return pa.array(values, mask=mask, type=pa.int64())
+
+        return pa.RecordBatch.from_pydict({
+            "trip_id": self.trip_ids, "route_id": self.route_ids, "stop_id": self.stop_ids,
+            "stop_sequence": column(self.stop_sequence),
+            "arrival_time": column(self.arrival_time), "arrival_delay": column(self.arrival_delay),
+            "departure_time": column(self.departure_time), "departure_delay": column(self.departure_delay),
+        })
+
+
+def vehicle_batch(feed) -> VehicleBatch:
+    """Columns of the vehicle positions of a feed (trimmed or full message)."""
+    trip_ids, route_ids, vehicle_ids = [], [], []
+    latitudes, longitudes, reported_at = array('d'), array('d'), array('q')
+    for entity in feed.entity:
+        if not entity.HasField("vehicle"):
+            continue
+        v = entity.vehicle
+        trip_id = v.trip.trip_id
+        if not trip_id or not v.HasField("position"):
+            continue
+        trip_ids.append(trip_id)
+        route_ids.append(v.trip.route_id)
+        vehicle_ids.append(v.vehicle.id)   # unset sub-message reads as ""
+        latitudes.append(v.position.latitude)
+        longitudes.append(v.position.longitude)
+        reported_at.append(v.timestamp)
+    return VehicleBatch(trip_ids, route_ids, vehicle_ids,
+                        np.frombuffer(latitudes, dtype=np.float64),
+                        np.frombuffer(longitudes, dtype=np.float64),
+                        np.frombuffer(reported_at, dtype=np.int64))
+
+
+def stop_time_update_batch(feed) -> StopTimeUpdateBatch:
+    """Columns of the stop time updates of a feed (trimmed or full message)."""
+    trip_ids, route_ids, stop_ids = [], [], []
+    sequences, arrival_times, departure_times = array('q'), array('q'), array('q')
+    arrival_delays, departure_delays = array('d'), array('d')
+    nan = float("nan")
+    for entity in feed.entity:
+        if not entity.HasField("trip_update"):
+            continue
+        trip_update = entity.trip_update
+        trip_id, route_id = trip_update.trip.trip_id, trip_update.trip.route_id
+        for stu in trip_update.stop_time_update:
+            trip_ids.append(trip_id)
+            route_ids.append(route_id)
+            stop_ids.append(stu.stop_id)
+            sequences.append(stu.stop_sequence if stu.HasField("stop_sequence") else MISSING)
+            arrival, departure = stu.arrival, stu.departure
+            arrival_times.append(arrival.time if arrival.HasField("time") else MISSING)
+            arrival_delays.append(arrival.delay if arrival.HasField("delay") else nan)
+            departure_times.append(departure.time if departure.HasField("time") else MISSING)
+            departure_delays.append(departure.delay if departure.HasField("delay") else nan)
+    return StopTimeUpdateBatch(
+        trip_ids, route_ids, stop_ids,
+        np.frombuffer(sequences, dtype=np.int64),
+        np.frombuffer(arrival_times, dtype=np.int64),
+        np.frombuffer(arrival_delays, dtype=np.float64),
+        np.frombuffer(departure_times, dtype=np.int64),
+        np.frombuffer(departure_delays, dtype=np.float64),
+    )
+
+
+# ============================================================================
+# Benchmark
+# ============================================================================
+
+def _find_payloads(paths: List[Path]) -> List[bytes]:
+    """Snapshot files given directly, or found in a feed_server.py snapshot tree."""
+    files = []
+    for path in paths:
+        files.extend(sorted(path.rglob("*.pb")) if path.is_dir() else [path])
+    return [f.read_bytes() for f in files]
+
+
+def _best_of(func, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _views(feed):
+    vehicle_batch(feed)
+    stop_time_update_batch(feed)
+
+
+def _run_worker(paths: List[Path], repeat: int) -> Dict:
+    """Timings with the backend of this process (entities per second)."""
+    from google.transit import gtfs_realtime_pb2
+
+    payloads = _find_payloads(paths)
+
+    def full_parse():
+        feeds = []
+        for payload in payloads:
+            feed = gtfs_realtime_pb2.FeedMessage()
+            feed.ParseFromString(payload)
+            feeds.append(feed)
+        return feeds
+
+    def trimmed_parse():
+        return [parse_feed(payload) for payload in payloads]
+
+    entities = sum(len(feed.entity) for feed in trimmed_parse())
+    timings = {
+        "full parse": _best_of(full_parse, repeat),
+        "trimmed parse": _best_of(trimmed_parse, repeat),
+        "full parse + views": _best_of(lambda: [_views(f) for f in full_parse()], repeat),
+        "trimmed parse + views": _best_of(lambda: [_views(f) for f in trimmed_parse()], repeat),
+    }
+    return {"backend": backend(), "entities": entities,
+            "rates": {name: entities / elapsed for name, elapsed in timings.items()}}
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Benchmark GTFS-RT decoding per protobuf backend")
+    parser.add_argument("paths", type=Path, nargs="+", help="Recorded .pb files or snapshot directories")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        print(json.dumps(_run_worker(args.paths, args.repeat)))
+        return
+
+    # The backend is fixed at import time: one subprocess per backend
+    results = []
+    for name in BACKENDS:
+        env = dict(os.environ, PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION=name)
+        command = [sys.executable, __file__, "--worker", "--repeat", str(args.repeat)] + [str(p) for p in args.paths]
+        proc = subprocess.run(command, env=env, capture_output=True, text=True)
+        if proc.returncode != 0:
+            print(f"⚠️  {name}: unavailable ({proc.stderr.strip().splitlines()[-1] if proc.stderr else 'error'})")
+            continue
+        result = json.loads(proc.stdout)
+        if result["backend"] != name:
+            print(f"⚠️  {name}: unavailable (protobuf fell back to {result['backend']})")
+            continue
+        results.append(result)
+
+    if not results:
+        return
+    print(f"{results[0]['entities']:,} entities per pass, best of {args.repeat}")
+    print(f"{'backend':8} " + " ".join(f"{name:>22}" for name in results[0]["rates"]))
+    for result in results:
+        print(f"{result['backend']:8} " + " ".join(f"{rate:>18,.0f} e/s" for rate in result["rates"].values()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+📼 Nice Traffic Watch - GTFS-RT Snapshot Recorder
+==================================================
+Archives the raw protobuf payloads of the live feeds, for offline replay
+with feed_server.py.
+
+Every new version of a feed is written untouched, named after its header
+timestamp (the fetch time when the header has none), in the layout that
+feed_server.py serves:
+
+    snapshots/
+    ├── trip-updates/
+    │   ├── 1767866313.pb
+    │   └── ...
+    └── vehicle-positions/
+        ├── 1767866313.pb
+        └── ...
+
+Payloads identical to the previous one of the same feed are not written
+again, so polling faster than the feed is republished costs no disk.
+
+Usage:
+    python feed_recorder.py snapshots/ --interval 15 --duration-hours 2
+"""
+
+import argparse
+import hashlib
+import logging
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import requests
+
+from feed_decoder import parse_feed
+from feed_server import DEFAULT_PREFIX, FEED_NAMES
+
+
+DEFAULT_BASE_URL = f"https://ara-api.enroute.mobi{DEFAULT_PREFIX}"
+DEFAULT_INTERVAL = 15  # seconds, shorter than the publication period
+
+logger = logging.getLogger(__name__)
+
+
+class FeedRecorder:
+    """Writes each new payload of a set of feeds to snapshot_dir/<feed>/<timestamp>.pb"""
+
+    def __init__(self, snapshot_dir: Path, base_url: str = DEFAULT_BASE_URL, timeout: int = 10):
+        self.snapshot_dir = Path(snapshot_dir)
+        self.urls = {name: f"{base_url.rstrip('/')}/{name}" for name in FEED_NAMES}
+        self.timeout = timeout
+        self.session = requests.Session()  # keep-alive between polls
+        self._last_digest: Dict[str, bytes] = {}
+        self.stats = {"polls": 0, "written": 0, "unchanged": 0, "errors": 0, "bytes": 0}
+        for name in FEED_NAMES:
+            (self.snapshot_dir / name).mkdir(parents=True, exist_ok=True)
+
+    def record_once(self) -> List[Path]:
+        """Fetch every feed once; returns the snapshot files written."""
+        self.stats["polls"] += 1
+        written = []
+        for name, url in self.urls.items():
+            try:
+                response = self.session.get(url, timeout=self.timeout)
+                response.raise_for_status()
+            except requests.exceptions.RequestException as e:
+                self.stats["errors"] += 1
+                logger.error(f"Failed to fetch {url}: {e}")
+                continue
+
+            payload = response.content
+            digest = hashlib.blake2b(payload, digest_size=16).digest()
+            if digest == self._last_digest.get(name):
+                self.stats["unchanged"] += 1
+                continue
+            try:
+                stamp = int(parse_feed(payload).header.timestamp) or int(time.time())
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error(f"Failed to parse feed from {url}: {e}")
+                continue
+
+            path = self.snapshot_dir / name / f"{stamp}.pb"
+            tmp = path.with_suffix(".pb.tmp")
+            tmp.write_bytes(payload)
+            tmp.replace(path)  # the replay server never sees a partial file
+            self._last_digest[name] = digest
+            self.stats["written"] += 1
+            self.stats["bytes"] += len(payload)
+            written.append(path)
+        return written
+
+    def run(self, interval: float = DEFAULT_INTERVAL, duration_hours: Optional[float] = None):
+        end_time = time.time() + duration_hours * 3600 if duration_hours else None
+        try:
+            while end_time is None or time.time() < end_time:
+                started = time.time()
+                for path in self.record_once():
+                    logger.info(f"📼 {path.parent.name}/{path.name} ({path.stat().st_size / 1024:.0f} KB)")
+                time.sleep(max(0.0, interval - (time.time() - started)))
+        except KeyboardInterrupt:
+            logger.info("⛔ Stopped by user")
+        finally:
+            self.session.close()
+            s = self.stats
+            logger.info(f"📊 {s['polls']} polls, {s['written']} snapshots "
+                        f"({s['bytes'] / 1024 / 1024:.1f} MB), {s['unchanged']} unchanged, {s['errors']} errors")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Record raw GTFS-RT snapshots for feed_server.py")
+    parser.add_argument("snapshot_dir", type=Path)
+    parser.add_argument("--feed-base-url", default=DEFAULT_BASE_URL,
+                        help="Fetch <base>/trip-updates and <base>/vehicle-positions")
+    parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL, help="Seconds between polls")
+    parser.add_argument("--duration-hours", type=float, default=None,
+                        help="Stop after this many hours (default: run until Ctrl+C)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s | %(levelname)8s | %(message)s',
+                        datefmt='%H:%M:%S')
+    logger.info(f"📼 Recording {args.feed_base_url} into {args.snapshot_dir.absolute()}")
+    FeedRecorder(args.snapshot_dir, args.feed_base_url).run(args.interval, args.duration_hours)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+🧪 Nice Traffic Watch - Local GTFS-RT Stand-in Server
+======================================================
+Serves recorded protobuf snapshots over HTTP so the collectors can be run
+and tested without hitting the live Lignes d'Azur endpoints.
+
+Snapshot layout (one file per feed version, replayed in name order):
+
+    snapshots/
+    ├── trip-updates/
+    │   ├── 1767866313.pb
+    │   └── ...
+    └── vehicle-positions/
+        ├── 1767866313.pb
+        └── ...
+
+Endpoints mirror the production URLs (/<prefix>/trip-updates and
+/<prefix>/vehicle-positions). The server speaks HTTP/1.1 keep-alive and
+honours conditional requests: every snapshot gets an ETag and a
+Last-Modified date, and If-None-Match / If-Modified-Since yield
+304 Not Modified while the current snapshot has not changed.
+
+Snapshots change every --period seconds, or, with --speed, follow the
+recorded timeline (file names are the timestamps written by
+feed_recorder.py) 1x to 100x faster than real time. --scale N synthesises
+a city N times bigger: every entity is served N times, with distinct
+vehicle ids and slightly shifted positions.
+
+Usage:
+    python feed_server.py snapshots/ --port 8765 --period 30
+    python feed_server.py snapshots/ --speed 10 --scale 5
+    python data_collector.py --async --feed-base-url http://127.0.0.1:8765/rla/gtfs
+"""
+
+import argparse
+import bisect
+import hashlib
+import logging
+import random
+import threading
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+
+FEED_NAMES = ("trip-updates", "vehicle-positions")
+DEFAULT_PREFIX = "/rla/gtfs"
+MAX_SPEED = 100
+SCALE_JITTER_DEG = 0.002  # max position shift of the synthetic copies (~200 m)
+
+logger = logging.getLogger(__name__)
+
+
+def scale_feed(payload: bytes, factor: int, seed: int = 0) -> bytes:
+    """
+    Serve every entity `factor` times: copy k gets "#k" appended to its
+    entity and vehicle ids, and its position shifted by up to
+    SCALE_JITTER_DEG. trip_ids are kept, so delays can still be computed.
+    """
+    from google.transit import gtfs_realtime_pb2
+
+    if factor <= 1:
+        return payload
+    feed = gtfs_realtime_pb2.FeedMessage()
+    feed.ParseFromString(payload)
+    originals = list(feed.entity)
+    rng = random.Random(seed)
+    for k in range(1, factor):
+        for original in originals:
+            entity = feed.entity.add()
+            entity.CopyFrom(original)
+            entity.id = f"{original.id}#{k}"
+            if entity.HasField("vehicle"):
+                vehicle = entity.vehicle
+                if vehicle.HasField("vehicle"):
+                    vehicle.vehicle.id = f"{vehicle.vehicle.id}#{k}"
+                if vehicle.HasField("position"):
+                    vehicle.position.latitude += rng.uniform(-SCALE_JITTER_DEG, SCALE_JITTER_DEG)
+                    vehicle.position.longitude += rng.uniform(-SCALE_JITTER_DEG, SCALE_JITTER_DEG)
+            if entity.HasField("trip_update") and entity.trip_update.HasField("vehicle"):
+                entity.trip_update.vehicle.id = f"{entity.trip_update.vehicle.id}#{k}"
+    return feed.SerializeToString()
+
+
+class SnapshotFeed:
+    """Cycles through the recorded snapshots of one feed."""
+
+    def __init__(self, files: List[Path], scale: int = 1):
+        if not files:
+            raise ValueError("No snapshot to serve")
+        self.files = files
+        self.scale = scale
+        self._cache: Dict[Path, Tuple[bytes, str]] = {}
+
+    @property
+    def timestamps(self) -> List[int]:
+        """Recording timestamps, from the feed_recorder.py file names."""
+        try:
+            return [int(path.stem) for path in self.files]
+        except ValueError:
+            raise ValueError(f"Snapshot names are not timestamps: {self.files[0].parent}") from None
+
+    def load(self, index: int) -> Tuple[bytes, str]:
+        """Return (payload, etag) of the index-th snapshot (wrapping around)."""
+        path = self.files[index % len(self.files)]
+        if path not in self._cache:
+            payload = scale_feed(path.read_bytes(), self.scale, seed=index % len(self.files))
+            self._cache[path] = (payload, '"' + hashlib.sha1(payload).hexdigest() + '"')
+        return self._cache[path]
+
+
+class SnapshotClock:
+    """Maps wall-clock time to a snapshot index (one snapshot per period)."""
+
+    def __init__(self, period: float):
+        self.period = period
+        self.started = time.time()
+
+    def index(self) -> int:
+        if self.period <= 0:
+            return 0
+        return int((time.time() - self.started) // self.period)
+
+    def published_at(self) -> float:
+        """Wall-clock time at which the current snapshot was 'published'."""
+        if self.period <= 0:
+            return self.started
+        return self.started + self.index() * self.period
+
+
+class ReplayClock:
+    """
+    Maps wall-clock time to the recorded timeline of one feed, `speed`
+    times faster, looping at the end of the recording.
+
+    Every feed of a replay shares the same origin and loop length, so
+    trip updates and vehicle positions recorded together stay together.
+    """
+
+    def __init__(self, timestamps: List[int], speed: float, origin: int, loop_seconds: float):
+        self.offsets = [t - origin for t in timestamps]
+        self.speed = speed
+        self.loop_seconds = loop_seconds
+        self.started = time.time()
+
+    def _position(self) -> Tuple[int, int]:
+        """(completed loops, snapshot index in the current loop)"""
+        recorded = (time.time() - self.started) * self.speed
+        loops, offset = divmod(recorded, self.loop_seconds)
+        return int(loops), max(bisect.bisect_right(self.offsets, offset) - 1, 0)
+
+    def index(self) -> int:
+        loops, i = self._position()
+        return loops * len(self.offsets) + i
+
+    def published_at(self) -> float:
+        loops, i = self._position()
+        return self.started + (loops * self.loop_seconds + self.offsets[i]) / self.speed
+
+
+def replay_clocks(feeds: Dict[str, SnapshotFeed], speed: float) -> Dict[str, ReplayClock]:
+    """One ReplayClock per feed, on a common recorded timeline."""
+    timelines = {name: feed.timestamps for name, feed in feeds.items()}
+    origin = min(t[0] for t in timelines.values())
+    last = max(t[-1] for t in timelines.values())
+    # The last snapshot stays up for a typical gap before looping
+    gaps = sorted(b - a for t in timelines.values() for a, b in zip(t, t[1:]))
+    loop_seconds = last - origin + (gaps[len(gaps) // 2] if gaps else 30)
+    return {name: ReplayClock(t, speed, origin, loop_seconds) for name, t in timelines.items()}
+
+
+def load_snapshots(snapshot_dir: Path, scale: int = 1) -> Dict[str, SnapshotFeed]:
+    feeds = {}
+    for name in FEED_NAMES:
+        files = sorted((snapshot_dir / name).glob("*.pb"))
+        feeds[name] = SnapshotFeed(files, scale)
+    return feeds
+
+
+Clock = Union[SnapshotClock, ReplayClock]
+
+
+def make_handler(feeds: Dict[str, SnapshotFeed], clock: Union[Clock, Dict[str, Clock]],
+                 prefix: str = DEFAULT_PREFIX):
+    """clock: one clock for every feed, or one per feed name."""
+    clocks = clock if isinstance(clock, dict) else {name: clock for name in feeds}
+    routes = {f"{prefix.rstrip('/')}/{name}": (feed, clocks[name]) for name, feed in feeds.items()}
+
+    class FeedHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive
+
+        def do_GET(self):
+            route = routes.get(self.path.split('?', 1)[0])
+            if route is None:
+                self.send_error(404, "Unknown feed")
+                return
+            feed, clock = route
+
+            payload, etag = feed.load(clock.index())
+            published = int(clock.published_at())
+            last_modified = formatdate(published, usegmt=True)
+
+            if self._not_modified(etag, published):
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Last-Modified", last_modified)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-protobuf")
+            self.send_header("Content-Length", str(len(payload)))
+            self.send_header("ETag", etag)
+            self.send_header("Last-Modified", last_modified)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _not_modified(self, etag: str, published: int) -> bool:
+            if_none_match = self.headers.get("If-None-Match")
+            if if_none_match is not None:
+                return etag in [tag.strip() for tag in if_none_match.split(',')]
+            if_modified_since = self.headers.get("If-Modified-Since")
+            if if_modified_since:
+                try:
+                    return published <= parsedate_to_datetime(if_modified_since).timestamp()
+                except (TypeError, ValueError):
+                    return False
+            return False
+
+        def log_message(self, format, *args):
+            logger.debug("%s - %s", self.address_string(), format % args)
+
+    return FeedHandler
+
+
+def make_clock(feeds: Dict[str, SnapshotFeed], period: float, speed: Optional[float]):
+    """Fixed period clock, or recorded timeline replayed at `speed`."""
+    if speed is None:
+        return SnapshotClock(period)
+    if not 1 <= speed <= MAX_SPEED:
+        raise ValueError(f"speed must be between 1 and {MAX_SPEED}")
+    return replay_clocks(feeds, speed)
+
+
+def start_server(snapshot_dir: Path, host: str = "127.0.0.1", port: int = 0,
+                 period: float = 30.0, prefix: str = DEFAULT_PREFIX,
+                 speed: Optional[float] = None, scale: int = 1) -> ThreadingHTTPServer:
+    """
+    Start the stand-in server in a background thread.
+
+    Returns the server; its URL base is
+    f"http://{host}:{server.server_address[1]}{prefix}". Call
+    server.shutdown() to stop it.
+    """
+    feeds = load_snapshots(Path(snapshot_dir), scale)
+    server = ThreadingHTTPServer((host, port), make_handler(feeds, make_clock(feeds, period, speed), prefix))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Serve recorded GTFS-RT snapshots over HTTP")
+    parser.add_argument("snapshot_dir", type=Path)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--period", type=float, default=30.0,
+                        help="Seconds between snapshot changes (0 = always serve the first one)")
+    parser.add_argument("--speed", type=float, default=None,
+                        help=f"Follow the recorded timeline, 1-{MAX_SPEED}x real time (instead of --period)")
+    parser.add_argument("--scale", type=int, default=1,
+                        help="Serve every entity N times (synthetic N x bigger network)")
+    parser.add_argument("--prefix", default=DEFAULT_PREFIX)
+    args = parser.parse_args(argv)
+    if args.speed is not None and not 1 <= args.speed <= MAX_SPEED:
+        parser.error(f"--speed must be between 1 and {MAX_SPEED}")
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s | %(levelname)8s | %(message)s',
+                        datefmt='%H:%M:%S')
+    feeds = load_snapshots(args.snapshot_dir, args.scale)
+    clock = make_clock(feeds, args.period, args.speed)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(feeds, clock, args.prefix))
+    logger.info(f"🧪 Serving {args.snapshot_dir} on http://{args.host}:{args.port}{args.prefix}"
+                + (f" at x{args.speed:g}" if args.speed else "") + (f", x{args.scale} vehicles" if args.scale > 1 else ""))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("⛔ Stopped by user")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+📥 Nice Traffic Watch - Projection-Aware GTFS Static Loader
+============================================================
+Loads only the GTFS columns the collector uses.
+
+csv.DictReader parses every column of routes.txt / trips.txt and allocates
+one dict per row, while GTFSSchedule only needs a handful of fields. Here:
+- Only the requested columns are parsed (pyarrow.csv include_columns, or
+  pandas usecols when pyarrow is not installed)
+- Repetitive columns (route_id, service_id) are dictionary-encoded /
+  categorical: each distinct value exists once in memory
+- Trips can be restricted to a subset of routes before anything is
+  turned into Python objects
+- Trips are returned as flat trip_id -> value maps, not a dict per row
+
+Usage (benchmark against the DictReader loop):
+    python gtfs_loader.py data/gtfs [--routes 09,61]
+"""
+
+import argparse
+import csv
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+
+ENGINES = ("pyarrow", "pandas")
+ROUTE_COLUMNS = ("route_id", "route_short_name", "route_type")
+TRIP_COLUMNS = ("trip_id", "route_id", "service_id")
+CATEGORICAL_COLUMNS = ("route_id", "service_id")
+
+
+def default_engine() -> str:
+    try:
+        import pyarrow.csv  # noqa: F401
+        return "pyarrow"
+    except ImportError:
+        return "pandas"
+
+
+def _read_pyarrow(path: Path, columns: Sequence[str], filter_column: Optional[str],
+                  keep: Optional[Iterable[str]]) -> Dict[str, List[str]]:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pacsv
+
+    column_types = {
+        c: pa.dictionary(pa.int32(), pa.string()) if c in CATEGORICAL_COLUMNS else pa.string()
+        for c in columns
+    }
+    table = pacsv.read_csv(path, convert_options=pacsv.ConvertOptions(
+        include_columns=list(columns),
+        include_missing_columns=True,
+        column_types=column_types,
+        strings_can_be_null=False,
+    ))
+    if filter_column is not None and keep is not None:
+        column = table[filter_column].cast(pa.string())
+        table = table.filter(pc.is_in(column, value_set=pa.array(list(keep), type=pa.string())))
+
+    result = {}
+    for name in columns:
+        values: List[str] = []
+        for chunk in table[name].chunks:
+            if pa.types.is_dictionary(chunk.type):
+                # One Python string per distinct value, shared by every row
+                dictionary = chunk.dictionary.to_pylist()
+                values.extend(dictionary[i] for i in chunk.indices.to_pylist())
+            else:
+                values.extend(chunk.to_pylist())
+        result[name] = [v if v is not None else "" for v in values]
+    return result
+
+
+def _read_pandas(path: Path, columns: Sequence[str], filter_column: Optional[str],
+                 keep: Optional[Iterable[str]]) -> Dict[str, List[str]]:
+    import pandas as pd
+
+    wanted = set(columns)
+    df = pd.read_csv(
+        path,
+        usecols=lambda c: c in wanted,
+        dtype={c: "category" if c in CATEGORICAL_COLUMNS else str for c in columns},
+        keep_default_na=False,
+    )
+    if filter_column is not None and keep is not None:
+        df = df[df[filter_column].isin(list(keep))]
+    return {name: df[name].astype(object).tolist() if name in df else [""] * len(df) for name in columns}
+
+
+def read_columns(path: Path, columns: Sequence[str], engine: Optional[str] = None,
+                 filter_column: Optional[str] = None, keep: Optional[Iterable[str]] = None) -> Dict[str, List[str]]:
+    """
+    Read some columns of a GTFS file as lists of strings.
+
+    Args:
+        columns: Columns to parse; missing ones come back as "".
+        engine: "pyarrow" or "pandas" (default: pyarrow if installed).
+        filter_column, keep: Only keep rows whose filter_column is in keep.
+    """
+    engine = engine or default_engine()
+    if engine == "pyarrow":
+        return _read_pyarrow(Path(path), columns, filter_column, keep)
+    if engine == "pandas":
+        return _read_pandas(Path(path), columns, filter_column, keep)
+    raise ValueError(f"Unknown engine: {engine}")
+
+
+def load_routes(gtfs_dir: Path, route_ids: Optional[Iterable[str]] = None,
+                engine: Optional[str] = None) -> Dict[str, Dict]:
+    """route_id -> {'route_short_name', 'route_type'} (same shape as before)."""
+    cols = read_columns(Path(gtfs_dir) / "routes.txt", ROUTE_COLUMNS, engine, "route_id", route_ids)
+    return {
+        route_id: {'route_short_name': short_name or route_id, 'route_type': int(route_type)}
+        for route_id, short_name, route_type in zip(cols["route_id"], cols["route_short_name"], cols["route_type"])
+    }
+
+
+def load_trips(gtfs_dir: Path, route_ids: Optional[Iterable[str]] = None,
+               engine: Optional[str] = None) -> Tuple[Dict[str, str], Dict[str, str]]:
+    """(trip_id -> route_id, trip_id -> service_id), optionally for some routes only."""
+    cols = read_columns(Path(gtfs_dir) / "trips.txt", TRIP_COLUMNS, engine, "route_id", route_ids)
+    trip_ids = cols["trip_id"]
+    return dict(zip(trip_ids, cols["route_id"])), dict(zip(trip_ids, cols["service_id"]))
+
+
+# ============================================================================
+# Benchmark
+# ============================================================================
+
+def load_dictreader(gtfs_dir: Path) -> Tuple[Dict[str, Dict], Dict[str, Dict]]:
+    """The historical GTFSSchedule.load() loop, kept as the benchmark baseline."""
+    routes, trips = {}, {}
+    with open(gtfs_dir / "routes.txt", 'r', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            routes[row['route_id']] = {
+                'route_short_name': row.get('route_short_name', row['route_id']),
+                'route_type': int(row['route_type']),
+            }
+    with open(gtfs_dir / "trips.txt", 'r', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            trips[row['trip_id']] = {'route_id': row['route_id'], 'service_id': row.get('service_id', '')}
+    return routes, trips
+
+
+def _measure(func, repeat: int):
+    """(best wall time, Python heap retained by the result)."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    result = func()
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return best, retained
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Benchmark GTFS static loading")
+    parser.add_argument("gtfs_dir", type=Path, nargs="?", default=Path("data") / "gtfs")
+    parser.add_argument("--routes", help="Comma-separated route_id subset")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+    routes = args.routes.split(",") if args.routes else None
+
+    candidates = [("csv.DictReader (all columns)", lambda: load_dictreader(args.gtfs_dir))]
+    for engine in ENGINES:
+        try:
+            __import__(engine)
+        except ImportError:
+            continue
+        candidates.append((f"{engine} (projected)",
+                           lambda e=engine: (load_routes(args.gtfs_dir, routes, e),
+                                             load_trips(args.gtfs_dir, routes, e))))
+
+    print(f"{'loader':32} {'time':>10} {'retained':>10}")
+    for name, func in candidates:
+        elapsed, retained = _measure(func, args.repeat)
+        print(f"{name:32} {elapsed * 1000:8.1f}ms {retained / 1024 / 1024:8.2f}MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+"""
+💾 Nice Traffic Watch - Observation Storage Backends
+=====================================================
+Where collected observations end up.
+
+- CsvObservationStore: the historical append-only CSV file (optionally one
+  file per day)
+- ParquetObservationStore: observations are buffered in memory and flushed
+  as compressed, typed Parquet files partitioned by date and hour:
+
+      data/delays/
+      ├── date=2026-01-08/
+      │   ├── hour=09/
+      │   │   ├── part-1767862713000.parquet
+      │   │   └── part-1767863013000.parquet
+      │   └── hour=10/
+      │       └── compacted-1767866400000.parquet
+      └── ...
+
+  compact() merges the small files of closed hours into one file (run
+  automatically once an hour is closed, or from the command line), and
+  read() only opens the requested columns and the partitions overlapping
+  the requested time range. A compacted file lists the files it replaces
+  in its Parquet metadata: readers skip them while compaction has not yet
+  deleted them, and list the partition again if one vanishes mid-read.
+
+  A batch that cannot be written is kept for the next flush, up to
+  MAX_BUFFER_ROWS buffered observations; beyond that the oldest ones are
+  dropped and counted. Rows that do not fit the schema are dropped and
+  counted rather than retried forever.
+
+Parquet requires pyarrow (and pandas for read()).
+
+Usage (maintenance):
+    python observation_store.py compact data/delays
+"""
+
+import argparse
+import csv
+import json
+import logging
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence
+
+
+FLUSH_ROWS = 50_000        # flush when this many observations are buffered...
+FLUSH_SECONDS = 300        # ...or when the oldest buffered one is this old
+MAX_BUFFER_ROWS = 4 * FLUSH_ROWS   # cap on observations kept after failed writes
+COMPRESSION = "zstd"
+REPLACES_KEY = b"replaces"     # compacted file metadata: names of the files it merged
+READ_ATTEMPTS = 3
+
+logger = logging.getLogger(__name__)
+
+
+def _arrow_type(column: str):
+    import pyarrow as pa
+
+    types = {
+        "timestamp": pa.timestamp("us"),
+        "route_type": pa.int16(),     # extended GTFS route types (e.g. 715) do not fit in int8
+        "delay_seconds": pa.int32(),
+        "scheduled_time": pa.int64(),
+        "actual_time": pa.int64(),
+        "latitude": pa.float64(),
+        "longitude": pa.float64(),
+        "stop_distance_m": pa.float32(),
+    }
+    return types.get(column, pa.string())
+
+
+class CsvObservationStore:
+    """Append-only CSV file (one header, one row per observation)."""
+
+    def __init__(self, csv_file: Path, headers: Sequence[str], daily: bool = False):
+        """
+        Args:
+            csv_file: Output file; with daily=True, its name inside one
+                date=YYYY-MM-DD directory per day next to it
+            headers: Column order
+        """
+        self.csv_file = Path(csv_file)
+        self.headers = list(headers)
+        self.daily = daily
+
+    def path(self, when: Optional[datetime] = None) -> Path:
+        if not self.daily:
+            return self.csv_file
+        when = when or datetime.now()
+        return self.csv_file.parent / f"date={when:%Y-%m-%d}" / self.csv_file.name
+
+    def append(self, observations: List[Dict]):
+        """Append observations; raises OSError if the file cannot be written."""
+        if not observations:
+            return
+        path = self.path()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        file_exists = path.exists()
+        with open(path, 'a', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=self.headers)
+            if not file_exists:
+                writer.writeheader()
+                logger.info(f"📝 Created new CSV: {path}")
+            writer.writerows(observations)
+        logger.info(f"💾 Saved {len(observations)} observations to {path}")
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class ParquetObservationStore:
+    """Buffered, date/hour-partitioned Parquet storage."""
+
+    def __init__(self, root: Path, headers: Sequence[str], flush_rows: int = FLUSH_ROWS,
+                 flush_seconds: float = FLUSH_SECONDS, compression: str = COMPRESSION,
+                 max_buffer_rows: int = MAX_BUFFER_ROWS):
+        import pyarrow as pa
+
+        self.root = Path(root)
+        self.headers = list(headers)
+        self.schema = pa.schema([(column, _arrow_type(column)) for column in self.headers])
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.compression = compression
+        self.max_buffer_rows = max(max_buffer_rows, flush_rows)
+        self.dropped_rows = 0     # observations lost (schema mismatch or buffer cap)
+        self._buffer: List[Dict] = []
+        self._buffer_since: Optional[float] = None
+        self._flushed_hour: Optional[str] = None
+
+    # ------------------------------------------------------------------
+    # Write path
+    # ------------------------------------------------------------------
+
+    def append(self, observations: List[Dict]):
+        """Buffer observations; flush once the buffer is big or old enough."""
+        if not observations:
+            return
+        if self._buffer_since is None:
+            self._buffer_since = time.monotonic()
+        self._buffer.extend(observations)
+
+        if (len(self._buffer) >= self.flush_rows
+                or time.monotonic() - self._buffer_since >= self.flush_seconds):
+            self.flush()
+
+    def _to_table(self, rows: List[Dict]):
+        """Arrow table of the rows that fit the schema, and those rows."""
+        import pyarrow as pa
+
+        try:
+            return pa.Table.from_pylist(rows, schema=self.schema), rows
+        except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError, ValueError, OverflowError):
+            pass
+        # Rare: find the offending rows one by one, keep the others
+        good, first_error = [], None
+        for row in rows:
+            try:
+                pa.Table.from_pylist([row], schema=self.schema)
+                good.append(row)
+            except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError, ValueError, OverflowError) as e:
+                first_error = first_error or e
+        logger.error(f"❌ Dropped {len(rows) - len(good)} observations not matching the schema ({first_error})")
+        return pa.Table.from_pylist(good, schema=self.schema), good
+
+    def flush(self):
+        """
+        Write the buffered observations, one file per (date, hour) partition.
+
+        Partitions that cannot be written (disk full, permissions...) stay
+        buffered for the next flush, within max_buffer_rows.
+        """
+        if not self._buffer:
+            return
+        import pyarrow.parquet as pq
+
+        partitions: Dict[str, List[Dict]] = {}
+        for obs in self._buffer:
+            ts = obs["timestamp"]
+            if isinstance(ts, str):
+                ts = datetime.fromisoformat(ts)
+                obs = {**obs, "timestamp": ts}
+            partitions.setdefault(f"date={ts:%Y-%m-%d}/hour={ts:%H}", []).append(obs)
+
+        stamp = int(time.time() * 1000)
+        written, failed = 0, []
+        for partition, rows in partitions.items():
+            table, kept = self._to_table(rows)
+            self.dropped_rows += len(rows) - len(kept)
+            if not kept:
+                continue
+            directory = self.root / partition
+            tmp = directory / f".part-{stamp}.parquet.tmp"
+            try:
+                directory.mkdir(parents=True, exist_ok=True)
+                pq.write_table(table, tmp, compression=self.compression)
+                tmp.rename(directory / f"part-{stamp}.parquet")
+                written += table.num_rows
+            except OSError as e:
+                logger.error(f"❌ Failed to write {partition} ({e}), keeping {len(kept)} observations buffered")
+                tmp.unlink(missing_ok=True)
+                failed.extend(kept)
+
+        if written:
+            logger.info(f"💾 Flushed {written} observations to {len(partitions)} partition(s) in {self.root}")
+        if len(failed) > self.max_buffer_rows:
+            lost = len(failed) - self.max_buffer_rows
+            self.dropped_rows += lost
+            failed = failed[lost:]
+            logger.error(f"❌ Write buffer full: dropped the {lost} oldest observations "
+                         f"({self.dropped_rows} dropped so far)")
+        self._buffer = failed
+        self._buffer_since = time.monotonic() if failed else None
+
+        # Once an hour is closed, merge its small files
+        hour = f"{datetime.now():%Y-%m-%d %H}"
+        if written and self._flushed_hour is not None and hour != self._flushed_hour:
+            try:
+                self.compact()
+            except OSError as e:
+                logger.error(f"❌ Compaction failed: {e}")
+        if written:
+            self._flushed_hour = hour
+
+    def close(self):
+        """Flush what is left; returns the number of observations that could not be written."""
+        self.flush()
+        if self._buffer:
+            logger.error(f"❌ {len(self._buffer)} observations could not be written to {self.root}")
+        return len(self._buffer)
+
+    # ------------------------------------------------------------------
+    # Maintenance
+    # ------------------------------------------------------------------
+
+    def partitions(self) -> List[Path]:
+        return sorted(p for p in self.root.glob("date=*/hour=*") if p.is_dir())
+
+    def compact(self, min_files: int = 2, include_current_hour: bool = False) -> int:
+        """
+        Merge the small files of each partition into a single file.
+
+        The current hour is skipped by default since it is still being
+        written to. Returns the number of partitions compacted.
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        now = datetime.now()
+        current = f"date={now:%Y-%m-%d}/hour={now:%H}"
+        compacted = 0
+        for directory in self.partitions():
+            if not include_current_hour and directory.relative_to(self.root).as_posix() == current:
+                continue
+            files = sorted(directory.glob("*.parquet"))
+            if len(files) < min_files:
+                continue
+
+            tables = [pq.read_table(f).cast(self.schema) for f in files]
+            merged = pa.concat_tables(tables).sort_by("timestamp")
+            # Readers listing the partition before the unlinks below skip these files
+            merged = merged.replace_schema_metadata({REPLACES_KEY: json.dumps([f.name for f in files])})
+
+            stamp = int(time.time() * 1000)
+            tmp = directory / f".compacted-{stamp}.parquet.tmp"
+            pq.write_table(merged, tmp, compression=self.compression)
+            tmp.rename(directory / f"compacted-{stamp}.parquet")
+            for f in files:
+                f.unlink()
+            compacted += 1
+
+        if compacted:
+            logger.info(f"🧹 Compacted {compacted} partition(s) in {self.root}")
+        return compacted
+
+    # ------------------------------------------------------------------
+    # Read path
+    # ------------------------------------------------------------------
+
+    def files(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> List[Path]:
+        """
+        Parquet files whose (date, hour) partition overlaps [start, end].
+
+        Files already merged into a compacted file are left out, even if the
+        compaction has not deleted them yet.
+        """
+        selected = []
+        for directory in self.partitions():
+            date_part, hour_part = directory.parent.name, directory.name
+            hour_start = datetime.strptime(f"{date_part[5:]} {hour_part[5:]}", "%Y-%m-%d %H")
+            if start is not None and hour_start + timedelta(hours=1) <= start:
+                continue
+            if end is not None and hour_start > end:
+                continue
+            files = sorted(directory.glob("*.parquet"))
+            replaced = self._replaced(files)
+            selected.extend(f for f in files if f.name not in replaced)
+        return selected
+
+    @staticmethod
+    def _replaced(files: List[Path]) -> set:
+        """Names of the files merged into the compacted files among `files`."""
+        replaced = set()
+        for f in files:
+            if f.name.startswith("compacted-"):
+                import pyarrow.parquet as pq
+
+                metadata = pq.read_schema(f).metadata or {}
+                replaced.update(json.loads(metadata.get(REPLACES_KEY, b"[]")))
+        return replaced
+
+    def read(self, columns: Optional[Iterable[str]] = None,
+             start: Optional[datetime] = None, end: Optional[datetime] = None):
+        """
+        Read observations as a pandas DataFrame.
+
+        Args:
+            columns: Columns to load (None = all). Other columns are never read.
+            start, end: Inclusive time range; only overlapping partitions are opened.
+        """
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.parquet as pq
+
+        columns = list(columns) if columns is not None else list(self.headers)
+        read_columns = columns if "timestamp" in columns or (start is None and end is None) \
+            else columns + ["timestamp"]
+        schema = pa.schema([self.schema.field(c) for c in read_columns])
+
+        for attempt in range(READ_ATTEMPTS):
+            try:
+                tables = [pq.read_table(f, columns=read_columns).cast(schema) for f in self.files(start, end)]
+                break
+            except FileNotFoundError:
+                # A compaction deleted a file after it was listed: list the partitions again
+                if attempt == READ_ATTEMPTS - 1:
+                    raise
+        if not tables:
+            return schema.empty_table().to_pandas()
+
+        table = pa.concat_tables(tables)
+        mask = None
+        if start is not None:
+            mask = pc.greater_equal(table["timestamp"], pa.scalar(start, type=pa.timestamp("us")))
+        if end is not None:
+            upper = pc.less_equal(table["timestamp"], pa.scalar(end, type=pa.timestamp("us")))
+            mask = upper if mask is None else pc.and_(mask, upper)
+        if mask is not None:
+            table = table.filter(mask)
+
+        return table.select(columns).to_pandas()
+
+
+def make_store(kind: str, headers: Sequence[str], csv_file: Path, parquet_dir: Path, daily_csv: bool = False):
+    """Build the storage backend selected on the command line."""
+    if kind == "csv":
+        return CsvObservationStore(csv_file, headers, daily=daily_csv)
+    if kind == "parquet":
+        return ParquetObservationStore(parquet_dir, headers)
+    raise ValueError(f"Unknown storage backend: {kind}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Observation store maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+    compact = sub.add_parser("compact", help="Merge the small Parquet files of closed hours")
+    compact.add_argument("root", type=Path, help="Parquet directory (e.g. data/delays)")
+    compact.add_argument("--min-files", type=int, default=2)
+    compact.add_argument("--include-current-hour", action="store_true")
+    args = parser.parse_args(argv)
+
+    import pyarrow.parquet as pq
+
+    first = next(iter(sorted(args.root.glob("date=*/hour=*/*.parquet"))), None)
+    if first is None:
+        print(f"❌ No Parquet files in {args.root}")
+        return
+    store = ParquetObservationStore(args.root, pq.read_schema(first).names)
+    count = store.compact(min_files=args.min_files, include_current_hour=args.include_current_hour)
+    print(f"🧹 {count} partition(s) compacted in {args.root}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    main()
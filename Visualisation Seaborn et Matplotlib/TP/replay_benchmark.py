@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+⏱️ Nice Traffic Watch - Offline Collector Load Test
+====================================================
+Runs the collector poll (fetch -> delays -> save) back to back against a
+local feed_server.py replay, and reports per-stage latency and throughput.
+
+The replay can be sped up (--speed, 1-100x the recorded timeline) and
+scaled up (--scale N serves every vehicle N times), so city-scale loads
+can be measured without touching the live endpoints. Output goes to a
+temporary directory.
+
+Usage:
+    python feed_recorder.py snapshots/ --duration-hours 1       # once
+    python replay_benchmark.py snapshots/ --scale 10 --speed 20 --polls 30
+    python replay_benchmark.py snapshots/ --collector v1 --storage parquet
+"""
+
+import argparse
+import logging
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from feed_server import DEFAULT_PREFIX, start_server
+
+logger = logging.getLogger(__name__)
+
+STAGES = ("fetch", "delays", "save")
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def run(snapshot_dir: Path, collector: str = "v2", polls: int = 20, speed: float = 10,
+        scale: int = 1, storage: str = "csv", gtfs_dir: Optional[Path] = None) -> Dict:
+    """Poll a replay `polls` times; returns per-stage timings and counts."""
+    import data_collector
+    import data_collector_v2
+
+    module = data_collector_v2 if collector == "v2" else data_collector
+    server = start_server(snapshot_dir, speed=speed, scale=scale)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}{DEFAULT_PREFIX}"
+    timings: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+    observations = 0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Redirect the module-level configuration, as the CLI flags do
+        out = Path(tmp)
+        module.TRIP_UPDATES_URL = f"{base_url}/trip-updates"
+        module.VEHICLE_POSITIONS_URL = f"{base_url}/vehicle-positions"
+        module.STORAGE = storage
+        module.CSV_FILE = out / "observations.csv"
+        module.PARQUET_DIR = out / "observations"
+        if collector == "v2":
+            module.AGGREGATES_FILE = out / "delay_aggregates.json"
+            schedule = module.GTFSSchedule(gtfs_dir or module.GTFS_DIR, module.ROUTE_IDS)
+            schedule.load()
+        else:
+            module._vehicle_states = None  # every poll does the full work
+
+        try:
+            for _ in range(polls):
+                start = time.perf_counter()
+                trip_feed = module.fetch_gtfs_rt(module.TRIP_UPDATES_URL)
+                vehicle_feed = module.fetch_gtfs_rt(module.VEHICLE_POSITIONS_URL)
+                fetched = time.perf_counter()
+                if collector == "v2":
+                    rows = module.calculate_delays_batch(trip_feed, vehicle_feed, schedule)
+                else:
+                    rows = module.merge_observations(trip_feed, vehicle_feed)
+                computed = time.perf_counter()
+                module.save_observations(rows)
+                saved = time.perf_counter()
+
+                timings["fetch"].append(fetched - start)
+                timings["delays"].append(computed - fetched)
+                timings["save"].append(saved - computed)
+                observations += len(rows)
+        finally:
+            module.close_storage()
+            server.shutdown()
+            server.server_close()
+
+    return {"polls": polls, "observations": observations, "timings": timings}
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Collector throughput/latency against a local replay")
+    parser.add_argument("snapshot_dir", type=Path, help="Snapshots recorded by feed_recorder.py")
+    parser.add_argument("--collector", choices=["v1", "v2"], default="v2",
+                        help="v1: data_collector.py (positions), v2: data_collector_v2.py (delays)")
+    parser.add_argument("--gtfs-dir", type=Path, help="Static GTFS for v2 (default: data/gtfs)")
+    parser.add_argument("--polls", type=int, default=20)
+    parser.add_argument("--speed", type=float, default=10, help="Replay speed, 1-100x real time")
+    parser.add_argument("--scale", type=int, default=1, help="Serve every vehicle N times")
+    parser.add_argument("--storage", choices=["csv", "parquet"], default="csv")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s | %(levelname)8s | %(message)s',
+                        datefmt='%H:%M:%S')
+    result = run(args.snapshot_dir, args.collector, args.polls, args.speed, args.scale,
+                 args.storage, args.gtfs_dir)
+
+    timings = result["timings"]
+    total = sum(sum(values) for values in timings.values())
+    print(f"{result['polls']} polls, {result['observations']:,} observations "
+          f"(x{args.scale} vehicles, replay x{args.speed:g}, {args.storage})")
+    print(f"{'stage':8} {'median':>10} {'p95':>10} {'max':>10}")
+    for stage, values in timings.items():
+        print(f"{stage:8} {statistics.median(values) * 1000:8.1f}ms {_percentile(values, 0.95) * 1000:8.1f}ms "
+              f"{max(values) * 1000:8.1f}ms")
+    print(f"⚡ Throughput: {result['observations'] / total:,.0f} observations/s")
+
+
+if __name__ == "__main__":
+    main()
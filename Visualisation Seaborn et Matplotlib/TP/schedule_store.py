@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+🗜️ Nice Traffic Watch - Compiled GTFS Schedule Store
+=====================================================
+Columnar, memory-mapped version of stop_times.txt.
+
+Parsing the 36MB stop_times.txt with csv.DictReader on every collector start
+takes seconds and hundreds of MB of Python tuples. This module compiles it
+once into flat NumPy arrays sorted by (trip, stop_sequence):
+
+    compiled/
+    ├── manifest.json          # Source file fingerprint + counts
+    ├── trip_ids.txt           # Intern table: trip index -> trip_id
+    ├── stop_ids.txt           # Intern table: stop index -> stop_id
+    ├── trip_offsets.npy       # int64[n_trips + 1], CSR offsets into the columns
+    ├── stop_idx.npy           # int32[n_stop_times]
+    ├── stop_sequence.npy      # int32[n_stop_times]
+    └── arrival_seconds.npy    # int32[n_stop_times], seconds since service-day midnight
+
+At startup the arrays are opened with np.load(mmap_mode='r'): only the
+pages actually touched by lookups are read, and they are shared with the
+OS page cache instead of being copied into the Python heap.
+
+Usage:
+    python schedule_store.py data/gtfs     # one-time (re)build
+"""
+
+import csv
+import json
+import logging
+import sys
+import time
+from array import array
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+STORE_VERSION = 1
+COMPILED_DIRNAME = "compiled"
+MISSING_TIME = -1  # arrival_seconds sentinel for stop_times without a time
+
+logger = logging.getLogger(__name__)
+
+
+def parse_gtfs_time(time_str: str) -> int:
+    """Convert GTFS HH:MM:SS (hours may exceed 24) to seconds since midnight."""
+    try:
+        hours, minutes, seconds = time_str.split(':')
+        return int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+    except (ValueError, AttributeError):
+        return MISSING_TIME
+
+
+def format_gtfs_time(seconds: int) -> str:
+    """Convert seconds since midnight back to GTFS HH:MM:SS."""
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def _source_fingerprint(source: Path) -> Dict:
+    stat = source.stat()
+    return {"source_size": stat.st_size, "source_mtime_ns": stat.st_mtime_ns}
+
+
+class CompiledSchedule:
+    """Read-only, memory-mapped stop_times index."""
+
+    def __init__(self, store_dir: Path):
+        self.store_dir = Path(store_dir)
+
+        with open(self.store_dir / "manifest.json", 'r', encoding='utf-8') as f:
+            self.manifest = json.load(f)
+
+        self.trip_ids = self._read_intern_table("trip_ids.txt")
+        self.stop_ids = self._read_intern_table("stop_ids.txt")
+        self.trip_index = {trip_id: i for i, trip_id in enumerate(self.trip_ids)}
+        self.stop_index = {stop_id: i for i, stop_id in enumerate(self.stop_ids)}
+
+        self.trip_offsets = np.load(self.store_dir / "trip_offsets.npy", mmap_mode='r')
+        self.stop_idx = np.load(self.store_dir / "stop_idx.npy", mmap_mode='r')
+        self.stop_sequence = np.load(self.store_dir / "stop_sequence.npy", mmap_mode='r')
+        self.arrival_seconds = np.load(self.store_dir / "arrival_seconds.npy", mmap_mode='r')
+
+        # Sorted keys for arrival() / arrivals_for(), see build_lookup_keys()
+        self._sequence_keys: Optional[np.ndarray] = None
+
+    def _read_intern_table(self, name: str) -> List[str]:
+        with open(self.store_dir / name, 'r', encoding='utf-8') as f:
+            return f.read().split('\n')[:-1]
+
+    def __len__(self) -> int:
+        return len(self.trip_ids)
+
+    def __contains__(self, trip_id: str) -> bool:
+        return trip_id in self.trip_index
+
+    def trip_slice(self, trip_id: str) -> Optional[slice]:
+        """Row range of a trip in the columnar arrays (None if unknown)."""
+        i = self.trip_index.get(trip_id)
+        if i is None:
+            return None
+        return slice(int(self.trip_offsets[i]), int(self.trip_offsets[i + 1]))
+
+    def stop_times(self, trip_id: str) -> List[Tuple[int, str, int]]:
+        """[(stop_sequence, stop_id, arrival_seconds), ...] sorted by sequence."""
+        rows = self.trip_slice(trip_id)
+        if rows is None:
+            return []
+        return [
+            (int(seq), self.stop_ids[sidx], int(secs))
+            for seq, sidx, secs in zip(self.stop_sequence[rows], self.stop_idx[rows], self.arrival_seconds[rows])
+        ]
+
+    # ------------------------------------------------------------------
+    # Vectorised lookups
+    # ------------------------------------------------------------------
+
+    def build_lookup_keys(self):
+        """
+        Sorted int64 keys (trip << 32 | stop_sequence) and (trip << 32 | stop)
+        over the stop times that have a scheduled time, for searchsorted.
+
+        Built on the first lookup if not called beforehand (GTFSSchedule.load
+        builds them up front).
+        """
+        trips = np.repeat(np.arange(len(self.trip_ids), dtype=np.int64), np.diff(self.trip_offsets))
+        valid = np.flatnonzero(np.asarray(self.arrival_seconds) != MISSING_TIME)
+        trips = trips[valid]
+        arrivals = np.asarray(self.arrival_seconds)[valid]
+
+        # Rows are already sorted by (trip, stop_sequence)
+        self._sequence_keys = (trips << 32) | np.asarray(self.stop_sequence)[valid].astype(np.int64)
+        self._sequence_arrivals = arrivals
+
+        # Stable sort keeps the first visit of a stop first (loop trips)
+        stop_keys = (trips << 32) | np.asarray(self.stop_idx)[valid].astype(np.int64)
+        order = np.argsort(stop_keys, kind='stable')
+        self._stop_keys = stop_keys[order]
+        self._stop_arrivals = arrivals[order]
+
+    @staticmethod
+    def _search(keys: np.ndarray, values: np.ndarray, queries: np.ndarray) -> np.ndarray:
+        pos = np.searchsorted(keys, queries)
+        pos_clipped = np.minimum(pos, len(keys) - 1)
+        found = (pos < len(keys)) & (keys[pos_clipped] == queries)
+        return np.where(found, values[pos_clipped], MISSING_TIME)
+
+    def arrival(self, trip_id: str, stop_id: str, stop_sequence: Optional[int] = None) -> Optional[int]:
+        """
+        Scheduled arrival seconds of one (trip, stop), None if unresolved.
+
+        stop_sequence is the unambiguous key (loop trips visit a stop more
+        than once); otherwise the first visit of stop_id is used.
+        """
+        if self._sequence_keys is None:
+            self.build_lookup_keys()
+        trip = self.trip_index.get(trip_id)
+        if trip is None:
+            return None
+        stop = self.stop_index.get(stop_id)
+        for keys, values, key in ((self._sequence_keys, self._sequence_arrivals, stop_sequence),
+                                  (self._stop_keys, self._stop_arrivals, stop)):
+            if key is None or key < 0:
+                continue
+            query = (trip << 32) | key
+            pos = int(keys.searchsorted(query))
+            if pos < len(keys) and keys[pos] == query:
+                return int(values[pos])
+        return None
+
+    def arrivals_for(self, trip_idx: np.ndarray, stop_sequence: np.ndarray,
+                     stop_idx: np.ndarray) -> np.ndarray:
+        """
+        Scheduled arrival seconds for a batch of (trip, stop) pairs.
+
+        Same resolution rules as arrival(): stop_sequence first, then the
+        first visit of stop_idx. Unknown trips/stops are passed as -1,
+        missing stop sequences as -1. Unresolved rows get MISSING_TIME.
+        """
+        if self._sequence_keys is None:
+            self.build_lookup_keys()
+
+        trip_idx = np.asarray(trip_idx, dtype=np.int64)
+        stop_sequence = np.asarray(stop_sequence, dtype=np.int64)
+        stop_idx = np.asarray(stop_idx, dtype=np.int64)
+        result = np.full(len(trip_idx), MISSING_TIME, dtype=np.int64)
+        if len(self._sequence_keys) == 0:
+            return result
+
+        known = trip_idx >= 0
+        by_sequence = known & (stop_sequence >= 0)
+        result[by_sequence] = self._search(self._sequence_keys, self._sequence_arrivals,
+                                           (trip_idx[by_sequence] << 32) | stop_sequence[by_sequence])
+
+        by_stop = known & (result == MISSING_TIME) & (stop_idx >= 0)
+        result[by_stop] = self._search(self._stop_keys, self._stop_arrivals,
+                                       (trip_idx[by_stop] << 32) | stop_idx[by_stop])
+        return result
+
+    # ------------------------------------------------------------------
+    # Build
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def is_fresh(gtfs_dir: Path) -> bool:
+        """True if the compiled store exists and matches stop_times.txt."""
+        gtfs_dir = Path(gtfs_dir)
+        manifest_file = gtfs_dir / COMPILED_DIRNAME / "manifest.json"
+        source = gtfs_dir / "stop_times.txt"
+        if not manifest_file.exists() or not source.exists():
+            return False
+        try:
+            with open(manifest_file, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return False
+        fingerprint = _source_fingerprint(source)
+        return (
+            manifest.get("version") == STORE_VERSION
+            and manifest.get("source_size") == fingerprint["source_size"]
+            and manifest.get("source_mtime_ns") == fingerprint["source_mtime_ns"]
+        )
+
+    @staticmethod
+    def build(gtfs_dir: Path) -> Path:
+        """Compile gtfs_dir/stop_times.txt into gtfs_dir/compiled/."""
+        gtfs_dir = Path(gtfs_dir)
+        source = gtfs_dir / "stop_times.txt"
+        store_dir = gtfs_dir / COMPILED_DIRNAME
+        store_dir.mkdir(parents=True, exist_ok=True)
+
+        start = time.time()
+        logger.info(f"🗜️  Compiling {source} -> {store_dir}")
+
+        trip_index: Dict[str, int] = {}
+        stop_index: Dict[str, int] = {}
+        trip_col, stop_col, seq_col, arr_col = array('i'), array('i'), array('i'), array('i')
+
+        with open(source, 'r', encoding='utf-8', newline='') as f:
+            reader = csv.reader(f)
+            header = next(reader)
+            i_trip = header.index('trip_id')
+            i_stop = header.index('stop_id')
+            i_seq = header.index('stop_sequence')
+            i_arr = header.index('arrival_time')
+            i_dep = header.index('departure_time') if 'departure_time' in header else i_arr
+
+            for row in reader:
+                if not row:
+                    continue
+                trip_col.append(trip_index.setdefault(row[i_trip], len(trip_index)))
+                stop_col.append(stop_index.setdefault(row[i_stop], len(stop_index)))
+                seq_col.append(int(row[i_seq]) if row[i_seq] else 0)
+                arr_col.append(parse_gtfs_time(row[i_arr] or row[i_dep]))
+
+        trips = np.frombuffer(trip_col, dtype=np.int32)
+        seqs = np.frombuffer(seq_col, dtype=np.int32)
+        order = np.lexsort((seqs, trips))
+
+        counts = np.bincount(trips, minlength=len(trip_index))
+        offsets = np.zeros(len(trip_index) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+
+        np.save(store_dir / "trip_offsets.npy", offsets)
+        np.save(store_dir / "stop_idx.npy", np.frombuffer(stop_col, dtype=np.int32)[order])
+        np.save(store_dir / "stop_sequence.npy", seqs[order])
+        np.save(store_dir / "arrival_seconds.npy", np.frombuffer(arr_col, dtype=np.int32)[order])
+
+        for name, index in (("trip_ids.txt", trip_index), ("stop_ids.txt", stop_index)):
+            with open(store_dir / name, 'w', encoding='utf-8') as f:
+                f.writelines(f"{key}\n" for key in index)
+
+        # Manifest last: a partially written store is never considered fresh
+        manifest = {
+            "version": STORE_VERSION,
+            **_source_fingerprint(source),
+            "n_trips": len(trip_index),
+            "n_stops": len(stop_index),
+            "n_stop_times": len(trips),
+        }
+        with open(store_dir / "manifest.json", 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+
+        logger.info(f"   ✓ Compiled {len(trips):,} stop times for {len(trip_index):,} trips "
+                    f"in {time.time() - start:.1f}s")
+        return store_dir
+
+    @classmethod
+    def open(cls, gtfs_dir: Path, rebuild_if_stale: bool = True) -> "CompiledSchedule":
+        """Open the compiled store, (re)building it first if needed."""
+        gtfs_dir = Path(gtfs_dir)
+        if rebuild_if_stale and not cls.is_fresh(gtfs_dir):
+            cls.build(gtfs_dir)
+        return cls(gtfs_dir / COMPILED_DIRNAME)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s | %(levelname)8s | %(message)s',
+                        datefmt='%H:%M:%S')
+    target = Path(sys.argv[1]) if len(sys.argv) > 1 else Path("data") / "gtfs"
+    CompiledSchedule.build(target)
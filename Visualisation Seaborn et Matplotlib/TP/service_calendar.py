@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+📅 Nice Traffic Watch - GTFS Service Calendar
+==============================================
+Which services run on which day, from calendar.txt and calendar_dates.txt.
+
+The two files are expanded once into a services x days bitmap (one row per
+service_id, one column per day of the feed validity range) and cached next
+to the compiled stop times:
+
+    compiled/
+    ├── calendar.json          # Source fingerprints, first date, service ids
+    └── calendar.npy           # bool[n_services, n_days]
+
+Looking up the services active on a date is then a single column read.
+
+Usage:
+    python service_calendar.py data/gtfs     # one-time (re)build
+"""
+
+import csv
+import json
+import logging
+import sys
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from schedule_store import COMPILED_DIRNAME
+
+
+CALENDAR_VERSION = 1
+SOURCES = ("calendar.txt", "calendar_dates.txt")
+WEEKDAYS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+
+logger = logging.getLogger(__name__)
+
+
+def parse_gtfs_date(value: str) -> date:
+    return datetime.strptime(value.strip(), "%Y%m%d").date()
+
+
+def _fingerprints(gtfs_dir: Path) -> Dict:
+    fingerprints = {}
+    for name in SOURCES:
+        path = gtfs_dir / name
+        if path.exists():
+            stat = path.stat()
+            fingerprints[name] = [stat.st_size, stat.st_mtime_ns]
+    return fingerprints
+
+
+class ServiceCalendar:
+    """Read-only services x days bitmap."""
+
+    def __init__(self, service_ids: List[str], first_date: Optional[date], bitmap: np.ndarray):
+        self.service_ids = service_ids
+        self.service_index = {service_id: i for i, service_id in enumerate(service_ids)}
+        self.first_date = first_date
+        self.bitmap = bitmap
+
+    @property
+    def n_days(self) -> int:
+        return self.bitmap.shape[1]
+
+    @property
+    def last_date(self) -> Optional[date]:
+        if self.first_date is None or not self.n_days:
+            return None
+        return self.first_date + timedelta(days=self.n_days - 1)
+
+    def covers(self, day: date) -> bool:
+        """True if the day is inside the feed validity range."""
+        return self.first_date is not None and 0 <= (day - self.first_date).days < self.n_days
+
+    def active_services(self, day: date) -> np.ndarray:
+        """bool[n_services]: services running on that day (none outside the range)."""
+        if not self.covers(day):
+            return np.zeros(len(self.service_ids), dtype=bool)
+        return self.bitmap[:, (day - self.first_date).days]
+
+    def is_active(self, service_id: str, day: date) -> bool:
+        i = self.service_index.get(service_id)
+        return i is not None and self.covers(day) and bool(self.bitmap[i, (day - self.first_date).days])
+
+    # ------------------------------------------------------------------
+    # Build
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def is_fresh(gtfs_dir: Path) -> bool:
+        """True if the cached bitmap exists and matches the calendar files."""
+        gtfs_dir = Path(gtfs_dir)
+        meta_file = gtfs_dir / COMPILED_DIRNAME / "calendar.json"
+        if not meta_file.exists() or not (gtfs_dir / COMPILED_DIRNAME / "calendar.npy").exists():
+            return False
+        try:
+            with open(meta_file, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return False
+        return meta.get("version") == CALENDAR_VERSION and meta.get("sources") == _fingerprints(gtfs_dir)
+
+    @staticmethod
+    def build(gtfs_dir: Path) -> Path:
+        """Expand calendar.txt + calendar_dates.txt into gtfs_dir/compiled/calendar.*"""
+        gtfs_dir = Path(gtfs_dir)
+        store_dir = gtfs_dir / COMPILED_DIRNAME
+        store_dir.mkdir(parents=True, exist_ok=True)
+
+        weekly = []      # (service_id, weekday flags, start, end)
+        exceptions = []  # (service_id, date, exception_type)
+
+        calendar_file = gtfs_dir / "calendar.txt"
+        if calendar_file.exists():
+            with open(calendar_file, 'r', encoding='utf-8-sig', newline='') as f:
+                for row in csv.DictReader(f):
+                    flags = [row.get(day, "0").strip() == "1" for day in WEEKDAYS]
+                    weekly.append((row['service_id'], flags,
+                                   parse_gtfs_date(row['start_date']), parse_gtfs_date(row['end_date'])))
+
+        dates_file = gtfs_dir / "calendar_dates.txt"
+        if dates_file.exists():
+            with open(dates_file, 'r', encoding='utf-8-sig', newline='') as f:
+                for row in csv.DictReader(f):
+                    exceptions.append((row['service_id'], parse_gtfs_date(row['date']),
+                                       int(row['exception_type'])))
+
+        service_index: Dict[str, int] = {}
+        for service_id, *_ in weekly + exceptions:
+            service_index.setdefault(service_id, len(service_index))
+
+        bounds = [d for _, _, start, end in weekly for d in (start, end)] + [d for _, d, _ in exceptions]
+        first_date = min(bounds) if bounds else None
+        n_days = (max(bounds) - first_date).days + 1 if bounds else 0
+        bitmap = np.zeros((len(service_index), n_days), dtype=bool)
+
+        if n_days:
+            day_weekdays = (first_date.weekday() + np.arange(n_days)) % 7
+            for service_id, flags, start, end in weekly:
+                lo, hi = (start - first_date).days, (end - first_date).days + 1
+                bitmap[service_index[service_id], lo:hi] = np.asarray(flags)[day_weekdays[lo:hi]]
+            for service_id, day, exception_type in exceptions:
+                # 1 = service added for that date, 2 = service removed
+                bitmap[service_index[service_id], (day - first_date).days] = exception_type == 1
+
+        np.save(store_dir / "calendar.npy", bitmap)
+        meta = {
+            "version": CALENDAR_VERSION,
+            "sources": _fingerprints(gtfs_dir),
+            "first_date": first_date.isoformat() if first_date else None,
+            "service_ids": list(service_index),
+        }
+        with open(store_dir / "calendar.json", 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+
+        logger.info(f"   ✓ Compiled calendar: {len(service_index)} services over {n_days} days")
+        return store_dir
+
+    @classmethod
+    def open(cls, gtfs_dir: Path, rebuild_if_stale: bool = True) -> "ServiceCalendar":
+        """Open the cached bitmap, (re)building it first if needed."""
+        gtfs_dir = Path(gtfs_dir)
+        if rebuild_if_stale and not cls.is_fresh(gtfs_dir):
+            cls.build(gtfs_dir)
+        store_dir = gtfs_dir / COMPILED_DIRNAME
+        with open(store_dir / "calendar.json", 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        first_date = date.fromisoformat(meta["first_date"]) if meta["first_date"] else None
+        return cls(meta["service_ids"], first_date, np.load(store_dir / "calendar.npy"))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s | %(levelname)8s | %(message)s',
+                        datefmt='%H:%M:%S')
+    target = Path(sys.argv[1]) if len(sys.argv) > 1 else Path("data") / "gtfs"
+    ServiceCalendar.build(target)
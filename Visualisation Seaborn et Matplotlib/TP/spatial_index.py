@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+🗺️ Nice Traffic Watch - Spatial Index
+======================================
+Uniform grid index over lat/lon points, with vectorised batch queries.
+
+- GridIndex: any set of points (stops, observation samples...). Points are
+  projected to local metres (equirectangular, exact enough at city scale),
+  bucketed in square cells and stored sorted by cell with CSR offsets.
+  * query_bbox(): indices of the points inside a lat/lon rectangle
+    (dashboard map viewport)
+  * nearest(): nearest point of a whole batch of positions at once
+    (3x3 cell neighbourhood, brute force only for the few positions
+    with nothing close)
+- StopIndex: GridIndex over GTFS stops.txt (location_type 0), to snap
+  vehicle positions to their current stop
+
+NumPy only, so the collector and the dashboard can both use it.
+
+Usage:
+    python spatial_index.py data/gtfs 43.7 7.27    # nearest stop of a point
+"""
+
+import csv
+import math
+import sys
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+
+EARTH_RADIUS_M = 6_371_000
+DEFAULT_CELL_SIZE_M = 250
+
+
+class GridIndex:
+    """Uniform grid over lat/lon points."""
+
+    def __init__(self, latitudes, longitudes, cell_size_m: float = DEFAULT_CELL_SIZE_M):
+        latitudes = np.asarray(latitudes, dtype=np.float64)
+        longitudes = np.asarray(longitudes, dtype=np.float64)
+        if len(latitudes) != len(longitudes):
+            raise ValueError("latitudes and longitudes must have the same length")
+
+        self.cell_size_m = cell_size_m
+        self.lat0 = float(latitudes.mean()) if len(latitudes) else 0.0
+        self.lon0 = float(longitudes.mean()) if len(longitudes) else 0.0
+        self._m_per_deg_lat = EARTH_RADIUS_M * math.pi / 180
+        self._m_per_deg_lon = self._m_per_deg_lat * math.cos(math.radians(self.lat0))
+
+        self.latitudes = latitudes
+        self.longitudes = longitudes
+        self.x, self.y = self._project(latitudes, longitudes)
+
+        cx, cy = self._cells(self.x, self.y)
+        self._cx_min, self._cy_min = (int(cx.min()), int(cy.min())) if len(cx) else (0, 0)
+        self._nx = int(cx.max()) - self._cx_min + 1 if len(cx) else 1
+        self._ny = int(cy.max()) - self._cy_min + 1 if len(cy) else 1
+
+        keys = self._keys(cx, cy)
+        self.order = np.argsort(keys, kind='stable')   # point indices sorted by cell
+        self._cell_offsets = np.searchsorted(keys[self.order], np.arange(self._nx * self._ny + 1))
+
+    def __len__(self) -> int:
+        return len(self.latitudes)
+
+    def _project(self, latitudes, longitudes) -> Tuple[np.ndarray, np.ndarray]:
+        x = (np.asarray(longitudes, dtype=np.float64) - self.lon0) * self._m_per_deg_lon
+        y = (np.asarray(latitudes, dtype=np.float64) - self.lat0) * self._m_per_deg_lat
+        return x, y
+
+    def _cells(self, x, y) -> Tuple[np.ndarray, np.ndarray]:
+        return (np.floor(x / self.cell_size_m).astype(np.int64),
+                np.floor(y / self.cell_size_m).astype(np.int64))
+
+    def _keys(self, cx, cy) -> np.ndarray:
+        return (cx - self._cx_min) * self._ny + (cy - self._cy_min)
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    def query_bbox(self, lat_min: float, lat_max: float, lon_min: float, lon_max: float) -> np.ndarray:
+        """Indices (sorted) of the points inside the rectangle, bounds included."""
+        if not len(self):
+            return np.empty(0, dtype=np.int64)
+        x0, y0 = self._project(lat_min, lon_min)
+        x1, y1 = self._project(lat_max, lon_max)
+        (cx0, cx1), (cy0, cy1) = self._cells(np.array([x0, x1]), np.array([y0, y1]))
+        cx0, cy0 = max(int(cx0), self._cx_min), max(int(cy0), self._cy_min)
+        cx1 = min(int(cx1), self._cx_min + self._nx - 1)
+        cy1 = min(int(cy1), self._cy_min + self._ny - 1)
+        if cx0 > cx1 or cy0 > cy1:
+            return np.empty(0, dtype=np.int64)
+
+        # Cells of one grid column are contiguous: one slice per column
+        chunks = []
+        for cx in range(cx0, cx1 + 1):
+            start = self._cell_offsets[self._keys(cx, cy0)]
+            end = self._cell_offsets[self._keys(cx, cy1) + 1]
+            chunks.append(self.order[start:end])
+        candidates = np.concatenate(chunks)
+
+        inside = ((self.latitudes[candidates] >= lat_min) & (self.latitudes[candidates] <= lat_max)
+                  & (self.longitudes[candidates] >= lon_min) & (self.longitudes[candidates] <= lon_max))
+        return np.sort(candidates[inside])
+
+    def nearest(self, latitudes, longitudes) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Nearest indexed point of every query position.
+
+        Returns:
+            (indices int64, distances in metres float64), -1 / inf when the
+            index is empty.
+        """
+        qx, qy = self._project(np.atleast_1d(latitudes), np.atleast_1d(longitudes))
+        n = len(qx)
+        best = np.full(n, -1, dtype=np.int64)
+        best_dist = np.full(n, np.inf)
+        if not len(self) or not n:
+            return best, best_dist
+
+        # 1. Candidates from the 3x3 cells around every query
+        qcx, qcy = self._cells(qx, qy)
+        query_ids, point_ids = [], []
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                cx, cy = qcx + dx, qcy + dy
+                valid = ((cx >= self._cx_min) & (cx < self._cx_min + self._nx)
+                         & (cy >= self._cy_min) & (cy < self._cy_min + self._ny))
+                keys = self._keys(cx[valid], cy[valid])
+                starts, ends = self._cell_offsets[keys], self._cell_offsets[keys + 1]
+                counts = ends - starts
+                if not counts.sum():
+                    continue
+                # Expand every (query, cell) pair into its points without a Python loop
+                query_ids.append(np.repeat(np.flatnonzero(valid), counts))
+                within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+                point_ids.append(self.order[np.repeat(starts, counts) + within])
+
+        if query_ids:
+            q = np.concatenate(query_ids)
+            p = np.concatenate(point_ids)
+            d = np.hypot(self.x[p] - qx[q], self.y[p] - qy[q])
+            # Per query minimum: sort by (query, distance), keep the first of each query
+            order = np.lexsort((d, q))
+            first = np.ones(len(order), dtype=bool)
+            first[1:] = q[order][1:] != q[order][:-1]
+            winners = order[first]
+            best[q[winners]] = p[winners]
+            best_dist[q[winners]] = d[winners]
+
+        # 2. A point outside the 3x3 block is at least one cell away: results
+        #    farther than that (or missing) are checked against every point
+        unsure = np.flatnonzero(best_dist > self.cell_size_m)
+        for start in range(0, len(unsure), 256):
+            rows = unsure[start:start + 256]
+            d = np.hypot(self.x[None, :] - qx[rows, None], self.y[None, :] - qy[rows, None])
+            best[rows] = d.argmin(axis=1)
+            best_dist[rows] = d[np.arange(len(rows)), best[rows]]
+
+        return best, best_dist
+
+
+class StopIndex(GridIndex):
+    """GridIndex over the GTFS stops (platforms, location_type 0)."""
+
+    def __init__(self, stop_ids: List[str], stop_names: List[str], latitudes, longitudes,
+                 cell_size_m: float = DEFAULT_CELL_SIZE_M):
+        super().__init__(latitudes, longitudes, cell_size_m)
+        self.stop_ids = stop_ids
+        self.stop_names = stop_names
+
+    @classmethod
+    def from_gtfs(cls, gtfs_dir: Path, cell_size_m: float = DEFAULT_CELL_SIZE_M) -> "StopIndex":
+        stop_ids, stop_names, latitudes, longitudes = [], [], [], []
+        with open(Path(gtfs_dir) / "stops.txt", 'r', encoding='utf-8-sig', newline='') as f:
+            for row in csv.DictReader(f):
+                if row.get('location_type', '0') not in ('', '0') or not row.get('stop_lat'):
+                    continue
+                stop_ids.append(row['stop_id'])
+                stop_names.append(row.get('stop_name', ''))
+                latitudes.append(float(row['stop_lat']))
+                longitudes.append(float(row['stop_lon']))
+        return cls(stop_ids, stop_names, latitudes, longitudes, cell_size_m)
+
+    def snap(self, latitudes, longitudes, max_distance_m: Optional[float] = None) -> Tuple[List[str], np.ndarray]:
+        """
+        Nearest stop_id of every position ("" beyond max_distance_m).
+
+        Returns:
+            (stop_ids, distances in metres)
+        """
+        indices, distances = self.nearest(latitudes, longitudes)
+        stop_ids = []
+        for i, d in zip(indices.tolist(), distances.tolist()):
+            far = i < 0 or (max_distance_m is not None and d > max_distance_m)
+            stop_ids.append("" if far else self.stop_ids[i])
+        return stop_ids, distances
+
+
+if __name__ == "__main__":
+    gtfs_dir = Path(sys.argv[1]) if len(sys.argv) > 1 else Path("data") / "gtfs"
+    index = StopIndex.from_gtfs(gtfs_dir)
+    if len(sys.argv) > 3:
+        i, d = index.nearest([float(sys.argv[2])], [float(sys.argv[3])])
+        print(f"{index.stop_ids[i[0]]} {index.stop_names[i[0]]} ({d[0]:.0f} m)")
+    else:
+        print(f"{len(index):,} stops indexed")
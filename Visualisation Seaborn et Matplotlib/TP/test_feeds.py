@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+🧪 Nice Traffic Watch - Feed Server / Async Fetcher Tests
+==========================================================
+Starts feed_server.start_server on a few synthetic snapshots and runs
+AsyncFeedFetcher against it:
+- ETag (If-None-Match) and If-Modified-Since requests get 304 Not Modified
+- A payload that fails to parse is not cached: the next request downloads it again
+- A new snapshot with the same header timestamp is not reported as changed
+- poll_feeds only hands rounds with a changed feed to the handler
+- next_poll_delay follows the feed header timestamp
+
+Usage:
+    python test_feeds.py        # or: python -m pytest test_feeds.py
+"""
+
+import asyncio
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from google.transit import gtfs_realtime_pb2
+
+from async_fetcher import AsyncFeedFetcher, FeedResult, next_poll_delay, poll_feeds
+from feed_server import DEFAULT_PREFIX, FEED_NAMES, start_server
+
+
+def write_snapshots(snapshot_dir: Path, header_timestamps):
+    """One snapshot per header timestamp and per feed (vehicle ids differ, so every payload differs)."""
+    stamps = range(1767866313, 1767866313 + len(header_timestamps))
+    for name in FEED_NAMES:
+        (snapshot_dir / name).mkdir(parents=True, exist_ok=True)
+        for i, (stamp, header_timestamp) in enumerate(zip(stamps, header_timestamps)):
+            feed = gtfs_realtime_pb2.FeedMessage()
+            feed.header.gtfs_realtime_version = "2.0"
+            feed.header.timestamp = int(header_timestamp)
+            entity = feed.entity.add()
+            entity.id = f"{name}-{i}"
+            entity.vehicle.vehicle.id = f"V{i}"
+            (snapshot_dir / name / f"{stamp}.pb").write_bytes(feed.SerializeToString())
+
+
+def feed_urls(server):
+    base = f"http://127.0.0.1:{server.server_address[1]}{DEFAULT_PREFIX}"
+    return [f"{base}/{name}" for name in FEED_NAMES]
+
+
+def test_etag_and_if_modified_since(tmp_path):
+    write_snapshots(tmp_path, [time.time()])
+    server = start_server(tmp_path, period=0)   # always the same snapshot
+    url = feed_urls(server)[0]
+
+    async def scenario():
+        async with AsyncFeedFetcher() as fetcher:
+            first = await fetcher.fetch(url)
+            again = await fetcher.fetch(url)   # If-None-Match
+            fetcher._validators[url].etag = None
+            since = await fetcher.fetch(url)   # If-Modified-Since only
+            return first, again, since, fetcher.stats
+
+    try:
+        first, again, since, stats = asyncio.run(scenario())
+    finally:
+        server.shutdown()
+    assert first.status == 200 and first.changed and first.feed is not None
+    assert again.status == 304 and not again.changed
+    assert again.feed is first.feed, "304: the last parsed feed is reused, not downloaded again"
+    assert since.status == 304 and not since.changed
+    assert stats["not_modified"] == 2 and stats["errors"] == 0
+
+
+def test_corrupt_payload_is_downloaded_again(tmp_path):
+    write_snapshots(tmp_path, [time.time()])
+    name = FEED_NAMES[0]
+    snapshot = next((tmp_path / name).iterdir())
+    snapshot.write_bytes(snapshot.read_bytes()[:-3])   # truncated download
+    server = start_server(tmp_path, period=0)
+    url = feed_urls(server)[0]
+
+    async def scenario():
+        async with AsyncFeedFetcher() as fetcher:
+            first = await fetcher.fetch(url)
+            again = await fetcher.fetch(url)
+            return first, again, fetcher.stats
+
+    try:
+        first, again, stats = asyncio.run(scenario())
+    finally:
+        server.shutdown()
+    assert first.feed is None and again.feed is None
+    assert again.status == 200, "the ETag of a payload that failed to parse must not be sent back"
+    assert stats["not_modified"] == 0 and stats["errors"] == 2
+
+
+def test_same_header_timestamp_is_unchanged(tmp_path):
+    stamp = int(time.time())
+    write_snapshots(tmp_path, [stamp, stamp])   # new payload, same feed version
+    server = start_server(tmp_path, period=0.3)
+    url = feed_urls(server)[0]
+
+    async def scenario():
+        async with AsyncFeedFetcher() as fetcher:
+            first = await fetcher.fetch(url)
+            await asyncio.sleep(0.4)   # next snapshot: new ETag, 200
+            second = await fetcher.fetch(url)
+            return first, second
+
+    try:
+        first, second = asyncio.run(scenario())
+    finally:
+        server.shutdown()
+    assert first.changed
+    assert second.status == 200 and not second.changed
+    assert second.feed.entity[0].id != first.feed.entity[0].id
+
+
+def test_poll_feeds_skips_unchanged_rounds(tmp_path):
+    write_snapshots(tmp_path, [time.time()])
+    server = start_server(tmp_path, period=0)
+    urls = feed_urls(server)
+    handled = []
+
+    async def handle(results):
+        handled.append(results)
+
+    async def scenario():
+        async with AsyncFeedFetcher() as fetcher:
+            await poll_feeds(fetcher, urls, handle, interval=0.1, min_interval=0.05,
+                             end_time=time.time() + 0.5)
+            return fetcher.stats
+
+    try:
+        stats = asyncio.run(scenario())
+    finally:
+        server.shutdown()
+    assert len(handled) == 1, "only the first round carries new feeds"
+    assert stats["requests"] >= 4 and stats["not_modified"] == stats["requests"] - len(urls)
+
+
+def test_next_poll_delay(tmp_path):
+    now = time.time()
+    write_snapshots(tmp_path, [now - 20])   # published 20 s ago
+    server = start_server(tmp_path, period=0)
+
+    async def scenario():
+        async with AsyncFeedFetcher() as fetcher:
+            return await fetcher.fetch_all(feed_urls(server))
+
+    try:
+        results = asyncio.run(scenario())
+    finally:
+        server.shutdown()
+    # Next version expected 60 s after the header timestamp
+    assert abs(next_poll_delay(results, 60, 5, now=now) - 40) < 1
+    # Feed late: poll again soon, never sooner than min_interval
+    assert next_poll_delay(results, 60, 5, now=now + 100) == 5
+    # Never later than one interval, even if the feed clock is ahead of ours
+    assert next_poll_delay(results, 60, 5, now=now - 100) == 60
+
+    # Servers without a header timestamp: interval when something changed, else min_interval
+    bare = gtfs_realtime_pb2.FeedMessage()
+    assert next_poll_delay([FeedResult("u", bare, changed=True)], 60, 5) == 60
+    assert next_poll_delay([FeedResult("u", bare, changed=False)], 60, 5) == 5
+
+
+if __name__ == "__main__":
+    tests = [test_etag_and_if_modified_since, test_corrupt_payload_is_downloaded_again,
+             test_same_header_timestamp_is_unchanged,
+             test_poll_feeds_skips_unchanged_rounds, test_next_poll_delay]
+    failed = 0
+    for test in tests:
+        with tempfile.TemporaryDirectory() as tmp:
+            try:
+                test(Path(tmp))
+                print(f"✅ {test.__name__}")
+            except AssertionError as e:
+                failed += 1
+                print(f"❌ {test.__name__}: {e}")
+    sys.exit(1 if failed else 0)
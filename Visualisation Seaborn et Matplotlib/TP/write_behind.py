@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+📮 Nice Traffic Watch - Write-Behind Queue
+===========================================
+Decouples polling from persistence.
+
+The collectors used to fetch, compute and write inline: a slow disk (CSV
+append, Parquet flush, aggregate snapshot) pushed the next poll back and
+skewed the observation timing. Here:
+- The poll loop hands each batch of observations to a bounded queue and
+  goes straight back to sleep
+- A writer thread takes whatever has piled up, merges it into one batch
+  and calls the usual save function once
+- When the queue is full (disk stalled for max_batches polls) put() waits
+  at most put_timeout seconds, then drops the batch and counts it: the
+  poll cadence never depends on the disk for longer than that
+- close() drains everything still queued, within close_timeout seconds
+  (what is still pending then is reported, not waited for), and SIGTERM is
+  turned into the same clean shutdown as Ctrl+C (see install_sigterm_handler)
+- on_close (e.g. the final Parquet flush) runs on the writer thread after
+  the last batch, so the store is never written from two threads; if
+  close() gives up on a stalled writer, the caller must not close the
+  store itself (the writer still does it if the process lives long enough)
+
+Backpressure metrics (queue depth, flush latency, waits, drops) are
+available from stats() and logged periodically by the writer.
+"""
+
+import logging
+import queue
+import signal
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+
+DEFAULT_MAX_BATCHES = 30       # polls buffered before put() pushes back
+DEFAULT_MAX_ROWS = 200_000     # rows merged into a single save call
+DEFAULT_PUT_TIMEOUT = 5.0      # seconds a poll may wait for room in the queue
+DEFAULT_CLOSE_TIMEOUT = 60.0   # seconds close() waits for the queue to drain
+STATS_EVERY = 10               # flushes between two metric log lines
+
+logger = logging.getLogger(__name__)
+
+_CLOSE = object()
+
+
+class WriteBehindQueue:
+    """Bounded queue of observation batches, written by a background thread."""
+
+    def __init__(self, save: Callable[[List[Dict]], None], max_batches: int = DEFAULT_MAX_BATCHES,
+                 max_rows: int = DEFAULT_MAX_ROWS, put_timeout: float = DEFAULT_PUT_TIMEOUT,
+                 on_close: Optional[Callable[[], None]] = None):
+        self.save = save
+        self.on_close = on_close
+        self.max_rows = max_rows
+        self.put_timeout = put_timeout
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_batches)
+        self._flush_latencies: deque = deque(maxlen=100)
+        self._lock = threading.Lock()
+        self._stats = {"batches_in": 0, "rows_in": 0, "flushes": 0, "rows_written": 0,
+                       "dropped_batches": 0, "dropped_rows": 0, "save_errors": 0,
+                       "max_depth": 0, "put_wait_s": 0.0}
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+
+    # ------------------------------------------------------------------
+    # Producer side (poll loop)
+    # ------------------------------------------------------------------
+
+    def put(self, observations: List[Dict]) -> bool:
+        """Queue a batch. Returns False if it had to be dropped (queue full)."""
+        if not observations:
+            return True
+        start = time.perf_counter()
+        try:
+            self._queue.put(observations, timeout=self.put_timeout)
+            queued = True
+        except queue.Full:
+            queued = False
+        waited = time.perf_counter() - start
+
+        with self._lock:
+            self._stats["put_wait_s"] += waited
+            if queued:
+                self._stats["batches_in"] += 1
+                self._stats["rows_in"] += len(observations)
+                self._stats["max_depth"] = max(self._stats["max_depth"], self._queue.qsize())
+            else:
+                self._stats["dropped_batches"] += 1
+                self._stats["dropped_rows"] += len(observations)
+        if not queued:
+            logger.error(f"❌ Write queue still full after {self.put_timeout:g}s, "
+                         f"dropped {len(observations)} observations")
+            return False
+        if waited > 0.1:
+            logger.warning(f"⚠️  Poll waited {waited:.1f}s for room in the write queue")
+        return True
+
+    def close(self, timeout: Optional[float] = DEFAULT_CLOSE_TIMEOUT) -> int:
+        """
+        Write everything still queued, then stop the writer thread.
+
+        Gives up after `timeout` seconds (None = wait forever) if the disk is
+        stalled: on_close is then left to the writer thread, which may still
+        be inside save(). Returns the number of batches left unwritten.
+        """
+        if not self._thread.is_alive():
+            return 0
+        depth = self._queue.qsize()
+        if depth:
+            logger.info(f"⏳ Draining {depth} queued batches...")
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        try:
+            self._queue.put(_CLOSE, timeout=timeout)  # after every batch already queued
+            self._thread.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        except queue.Full:
+            pass
+        self.log_stats()
+        if not self._thread.is_alive():
+            return 0
+
+        with self._queue.mutex:
+            pending = [batch for batch in self._queue.queue if batch is not _CLOSE]
+        logger.error(f"❌ Writer still busy after {timeout:g}s: {len(pending)} batches "
+                     f"({sum(len(batch) for batch in pending):,} observations) not written, "
+                     f"storage left open")
+        return len(pending)
+
+    # ------------------------------------------------------------------
+    # Consumer side (writer thread)
+    # ------------------------------------------------------------------
+
+    def _run(self):
+        closing = False
+        while not closing:
+            batch = self._queue.get()
+            if batch is _CLOSE:
+                break
+            rows = list(batch)
+            # Merge whatever else piled up while the previous flush ran
+            while len(rows) < self.max_rows:
+                try:
+                    more = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if more is _CLOSE:
+                    closing = True
+                    break
+                rows.extend(more)
+            self._flush(rows)
+
+        if self.on_close is not None:
+            try:
+                self.on_close()
+            except Exception as e:
+                logger.error(f"❌ Write-behind close failed: {e}")
+
+    def _flush(self, rows: List[Dict]):
+        start = time.perf_counter()
+        try:
+            self.save(rows)
+        except Exception as e:
+            with self._lock:
+                self._stats["save_errors"] += 1
+            logger.error(f"❌ Write-behind save failed: {e}")
+            return
+        latency = time.perf_counter() - start
+        with self._lock:
+            self._flush_latencies.append(latency)
+            self._stats["flushes"] += 1
+            self._stats["rows_written"] += len(rows)
+            flushes = self._stats["flushes"]
+        if flushes % STATS_EVERY == 0:
+            self.log_stats()
+
+    # ------------------------------------------------------------------
+    # Metrics
+    # ------------------------------------------------------------------
+
+    def stats(self) -> Dict:
+        """Counters plus current queue depth and flush latency (last 100 flushes)."""
+        with self._lock:
+            stats = dict(self._stats)
+            latencies = sorted(self._flush_latencies)
+        stats["depth"] = self._queue.qsize()
+        stats["flush_p50_s"] = latencies[len(latencies) // 2] if latencies else 0.0
+        stats["flush_max_s"] = latencies[-1] if latencies else 0.0
+        return stats
+
+    def log_stats(self):
+        s = self.stats()
+        logger.info(f"📮 Write queue: depth {s['depth']} (max {s['max_depth']}), "
+                    f"{s['flushes']} flushes, {s['rows_written']:,}/{s['rows_in']:,} rows written, "
+                    f"flush p50 {s['flush_p50_s'] * 1000:.0f}ms max {s['flush_max_s'] * 1000:.0f}ms, "
+                    f"put waits {s['put_wait_s']:.1f}s, {s['dropped_batches']} batches dropped")
+
+
+def install_sigterm_handler():
+    """Handle SIGTERM like Ctrl+C, so the collectors drain their queue and close cleanly."""
+    def handle(signum, frame):
+        logger.info("🛑 SIGTERM received, shutting down")
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, handle)
@@ -3,22 +3,47 @@ Nice Traffic Watch - Dashboard Interactif
 Application Dash pour le monitoring des retards du réseau Lignes d'Azur
 """
 
+import os
+
 import dash
-from dash import dcc, html, Input, Output, State
+from dash import dcc, html, ctx, Input, Output, State
 import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import pandas as pd
 import numpy as np
-from data_loader import load_transit_data
+from data_loader import HEX_RADIUS_PIXELS, MAP_DEFAULT_ZOOM, MAP_TILE_PIXELS, load_transit_data
+from figure_cache import FigureCache
+from shared_store import open_store
+from refresher import DataRefresher, LiveData
 
 # Initialisation de l'application Dash
 app = dash.Dash(__name__, title="Nice Traffic Watch")
 
+# Point d'entrée WSGI pour le déploiement multi-workers (gunicorn app:server)
+server = app.server
+
 # Chargement des données
+#   TRANSIT_STORE défini: attache en lecture seule au store partagé (shared_store.py),
+#   chaque worker partage les mêmes pages au lieu de recharger et pré-calculer
 print("🚀 Démarrage de l'application Nice Traffic Watch...")
-loader, df_clean = load_transit_data()
-stats = loader.get_summary_stats()
+STORE_DIR = os.environ.get('TRANSIT_STORE')
+if STORE_DIR:
+    loader = open_store(STORE_DIR)
+    df_clean = loader.df_clean
+else:
+    loader, df_clean = load_transit_data()
+
+# Données servies aux callbacks: remplacées en arrière-plan (refresher.py) quand
+# le collecteur ajoute des lignes, sans redémarrage ni attente côté callbacks
+live = LiveData(loader)
+REFRESH_SECONDS = float(os.environ.get('TRANSIT_REFRESH_SECONDS', 30))   # 0 = désactivé
+refresher = DataRefresher(live, REFRESH_SECONDS, STORE_DIR) if REFRESH_SECONDS > 0 else None
+if refresher is not None:
+    refresher.start()
+
+# Figures mémorisées par graphique et valeurs de filtres (LRU, borné en taille)
+figure_cache = FigureCache()
 
 # Configuration des couleurs
 COLORS = {
@@ -41,309 +66,349 @@ DELAY_COLORSCALE = [
     [1.0, '#d73027']    # Rouge (très en retard)
 ]
 
-# Layout de l'application
-app.layout = html.Div(style={'backgroundColor': COLORS['background'], 'minHeight': '100vh'}, children=[
-
-    # Header
-    html.Div(style={
-        'backgroundColor': COLORS['primary'],
-        'color': 'white',
-        'padding': '30px',
-        'marginBottom': '30px',
-        'boxShadow': '0 2px 4px rgba(0,0,0,0.1)'
-    }, children=[
-        html.H1('🚌 Nice Traffic Watch', style={'margin': '0', 'fontSize': '36px'}),
-        html.P('Dashboard Interactif de Monitoring des Retards - Réseau Lignes d\'Azur',
-               style={'margin': '10px 0 0 0', 'fontSize': '16px', 'opacity': '0.9'})
-    ]),
-
-    # Section des KPIs
-    html.Div(style={'maxWidth': '1400px', 'margin': '0 auto', 'padding': '0 20px'}, children=[
-
-        # Cartes de statistiques
-        html.Div(style={'display': 'grid', 'gridTemplateColumns': 'repeat(auto-fit, minmax(200px, 1fr))',
-                        'gap': '20px', 'marginBottom': '30px'}, children=[
-
-            # KPI 1: Retard Moyen
-            html.Div(style={
-                'backgroundColor': COLORS['card'],
-                'padding': '20px',
-                'borderRadius': '8px',
-                'boxShadow': '0 2px 4px rgba(0,0,0,0.1)',
-                'border': f'2px solid {COLORS["danger"] if stats["mean_delay"] > 2 else COLORS["success"]}'
-            }, children=[
-                html.H3('Retard Moyen', style={'margin': '0 0 10px 0', 'fontSize': '14px', 'color': '#666'}),
-                html.H2(f'{stats["mean_delay"]:.2f} min',
-                        style={'margin': '0', 'color': COLORS['danger'] if stats["mean_delay"] > 2 else COLORS['success']})
-            ]),
+TRANSPORT_COLORS = {'Bus': '#ff7f50', 'Tram': '#87ceeb'}
 
-            # KPI 2: % à l'heure
-            html.Div(style={
-                'backgroundColor': COLORS['card'],
-                'padding': '20px',
-                'borderRadius': '8px',
-                'boxShadow': '0 2px 4px rgba(0,0,0,0.1)'
-            }, children=[
-                html.H3('À l\'heure (±1 min)', style={'margin': '0 0 10px 0', 'fontSize': '14px', 'color': '#666'}),
-                html.H2(f'{stats["ontime_pct"]:.1f}%', style={'margin': '0', 'color': COLORS['primary']})
-            ]),
 
-            # KPI 3: Observations
-            html.Div(style={
-                'backgroundColor': COLORS['card'],
-                'padding': '20px',
-                'borderRadius': '8px',
-                'boxShadow': '0 2px 4px rgba(0,0,0,0.1)'
-            }, children=[
-                html.H3('Observations', style={'margin': '0 0 10px 0', 'fontSize': '14px', 'color': '#666'}),
-                html.H2(f'{stats["total_obs"]:,}', style={'margin': '0', 'color': COLORS['primary']})
-            ]),
+def box_trace(distribution, name, position, color, width=0.5):
+    """Boîte à moustaches tracée depuis les statistiques exactes du cube (sans points bruts)"""
+    box = distribution.box_stats()
+    return go.Box(
+        x=[position], q1=[box['q1']], median=[box['median']], q3=[box['q3']],
+        lowerfence=[box['lowerfence']], upperfence=[box['upperfence']],
+        mean=[box['mean']], sd=[box['sd']], boxpoints=False, width=width,
+        name=name, marker_color=color
+    )
 
-            # KPI 4: Lignes
-            html.Div(style={
-                'backgroundColor': COLORS['card'],
-                'padding': '20px',
-                'borderRadius': '8px',
-                'boxShadow': '0 2px 4px rgba(0,0,0,0.1)'
-            }, children=[
-                html.H3('Lignes Analysées', style={'margin': '0 0 10px 0', 'fontSize': '14px', 'color': '#666'}),
-                html.H2(f'{stats["unique_lines"]}', style={'margin': '0', 'color': COLORS['primary']})
-            ]),
 
-            # KPI 5: % en retard
-            html.Div(style={
-                'backgroundColor': COLORS['card'],
-                'padding': '20px',
-                'borderRadius': '8px',
-                'boxShadow': '0 2px 4px rgba(0,0,0,0.1)'
-            }, children=[
-                html.H3('En retard (>2 min)', style={'margin': '0 0 10px 0', 'fontSize': '14px', 'color': '#666'}),
-                html.H2(f'{stats["late_pct"]:.1f}%', style={'margin': '0', 'color': COLORS['danger']})
-            ]),
-        ]),
+def violin_traces(distribution, name, position, color, n_points=200):
+    """
+    Violon (densité miroir + boîte) tracé depuis la densité pré-calculée sur le cube
 
-        # Section des filtres
+    Returns:
+        Liste de traces (contour de densité, boîte intérieure)
+    """
+    grid, density = distribution.density(n_points)
+    half_width = 0.4 * density / density.max() if len(density) else density
+    outline = go.Scatter(
+        x=np.concatenate([position + half_width, (position - half_width)[::-1]]).astype(np.float32),
+        y=np.concatenate([grid, grid[::-1]]).astype(np.float32),
+        fill='toself', fillcolor=color, opacity=0.6, mode='lines',
+        line=dict(color='black', width=1), name=name, hoverinfo='skip'
+    )
+    return [outline, box_trace(distribution, name, position, 'black', width=0.08)]
+
+
+# Layout de l'application
+def serve_layout():
+    """Layout recalculé à chaque chargement de page (KPIs des données courantes)"""
+    stats = live.loader.get_summary_stats()
+    return html.Div(style={'backgroundColor': COLORS['background'], 'minHeight': '100vh'}, children=[
+
+        # Version des données servies, vérifiée périodiquement (rafraîchissement en arrière-plan)
+        dcc.Interval(id='data-poll', interval=max(REFRESH_SECONDS, 1) * 1000, disabled=refresher is None),
+        dcc.Store(id='data-version', data=live.loader.version),
+
+        # Header
         html.Div(style={
-            'backgroundColor': COLORS['card'],
-            'padding': '20px',
-            'borderRadius': '8px',
-            'boxShadow': '0 2px 4px rgba(0,0,0,0.1)',
-            'marginBottom': '30px'
+            'backgroundColor': COLORS['primary'],
+            'color': 'white',
+            'padding': '30px',
+            'marginBottom': '30px',
+            'boxShadow': '0 2px 4px rgba(0,0,0,0.1)'
         }, children=[
-            html.H3('🔍 Filtres Interactifs', style={'marginTop': '0', 'color': COLORS['primary']}),
-
-            html.Div(style={'display': 'grid', 'gridTemplateColumns': '1fr 1fr 1fr', 'gap': '20px'}, children=[
-
-                # Filtre par type de transport
-                html.Div(children=[
-                    html.Label('Type de Transport:', style={'fontWeight': 'bold', 'marginBottom': '5px', 'display': 'block'}),
-                    dcc.Checklist(
-                        id='transport-filter',
-                        options=[
-                            {'label': ' Bus', 'value': 'Bus'},
-                            {'label': ' Tram', 'value': 'Tram'}
-                        ],
-                        value=['Bus', 'Tram'],
-                        style={'display': 'flex', 'gap': '15px'}
-                    )
+            html.H1('🚌 Nice Traffic Watch', style={'margin': '0', 'fontSize': '36px'}),
+            html.P('Dashboard Interactif de Monitoring des Retards - Réseau Lignes d\'Azur',
+                   style={'margin': '10px 0 0 0', 'fontSize': '16px', 'opacity': '0.9'})
+        ]),
+
+        # Section des KPIs
+        html.Div(style={'maxWidth': '1400px', 'margin': '0 auto', 'padding': '0 20px'}, children=[
+
+            # Cartes de statistiques
+            html.Div(style={'display': 'grid', 'gridTemplateColumns': 'repeat(auto-fit, minmax(200px, 1fr))',
+                            'gap': '20px', 'marginBottom': '30px'}, children=[
+
+                # KPI 1: Retard Moyen
+                html.Div(style={
+                    'backgroundColor': COLORS['card'],
+                    'padding': '20px',
+                    'borderRadius': '8px',
+                    'boxShadow': '0 2px 4px rgba(0,0,0,0.1)',
+                    'border': f'2px solid {COLORS["danger"] if stats["mean_delay"] > 2 else COLORS["success"]}'
+                }, children=[
+                    html.H3('Retard Moyen', style={'margin': '0 0 10px 0', 'fontSize': '14px', 'color': '#666'}),
+                    html.H2(f'{stats["mean_delay"]:.2f} min',
+                            style={'margin': '0', 'color': COLORS['danger'] if stats["mean_delay"] > 2 else COLORS['success']})
                 ]),
 
-                # Filtre par heure
-                html.Div(children=[
-                    html.Label('Plage Horaire:', style={'fontWeight': 'bold', 'marginBottom': '5px', 'display': 'block'}),
-                    dcc.RangeSlider(
-                        id='hour-filter',
-                        min=0,
-                        max=23,
-                        step=1,
-                        marks={i: f'{i:02d}h' for i in range(0, 24, 3)},
-                        value=[0, 23],
-                        tooltip={"placement": "bottom", "always_visible": False}
-                    )
+                # KPI 2: % à l'heure
+                html.Div(style={
+                    'backgroundColor': COLORS['card'],
+                    'padding': '20px',
+                    'borderRadius': '8px',
+                    'boxShadow': '0 2px 4px rgba(0,0,0,0.1)'
+                }, children=[
+                    html.H3('À l\'heure (±1 min)', style={'margin': '0 0 10px 0', 'fontSize': '14px', 'color': '#666'}),
+                    html.H2(f'{stats["ontime_pct"]:.1f}%', style={'margin': '0', 'color': COLORS['primary']})
                 ]),
 
-                # Filtre par nombre de lignes
-                html.Div(children=[
-                    html.Label('Top N Lignes (Hit Parade):', style={'fontWeight': 'bold', 'marginBottom': '5px', 'display': 'block'}),
-                    dcc.Slider(
-                        id='top-lines-filter',
-                        min=5,
-                        max=30,
-                        step=5,
-                        marks={i: str(i) for i in range(5, 35, 5)},
-                        value=15,
-                        tooltip={"placement": "bottom", "always_visible": True}
-                    )
+                # KPI 3: Observations
+                html.Div(style={
+                    'backgroundColor': COLORS['card'],
+                    'padding': '20px',
+                    'borderRadius': '8px',
+                    'boxShadow': '0 2px 4px rgba(0,0,0,0.1)'
+                }, children=[
+                    html.H3('Observations', style={'margin': '0 0 10px 0', 'fontSize': '14px', 'color': '#666'}),
+                    html.H2(f'{stats["total_obs"]:,}', style={'margin': '0', 'color': COLORS['primary']})
                 ]),
-            ]),
 
-            html.Div(style={'marginTop': '15px', 'textAlign': 'center'}, children=[
-                html.Button('🔄 Rafraîchir les données', id='refresh-button', n_clicks=0, style={
-                    'padding': '10px 30px',
-                    'backgroundColor': COLORS['primary'],
-                    'color': 'white',
-                    'border': 'none',
-                    'borderRadius': '5px',
-                    'cursor': 'pointer',
-                    'fontSize': '14px',
-                    'fontWeight': 'bold'
-                })
-            ])
-        ]),
+                # KPI 4: Lignes
+                html.Div(style={
+                    'backgroundColor': COLORS['card'],
+                    'padding': '20px',
+                    'borderRadius': '8px',
+                    'boxShadow': '0 2px 4px rgba(0,0,0,0.1)'
+                }, children=[
+                    html.H3('Lignes Analysées', style={'margin': '0 0 10px 0', 'fontSize': '14px', 'color': '#666'}),
+                    html.H2(f'{stats["unique_lines"]}', style={'margin': '0', 'color': COLORS['primary']})
+                ]),
 
-        # Onglets pour les visualisations
-        dcc.Tabs(id='tabs', value='tab-overview', children=[
+                # KPI 5: % en retard
+                html.Div(style={
+                    'backgroundColor': COLORS['card'],
+                    'padding': '20px',
+                    'borderRadius': '8px',
+                    'boxShadow': '0 2px 4px rgba(0,0,0,0.1)'
+                }, children=[
+                    html.H3('En retard (>2 min)', style={'margin': '0 0 10px 0', 'fontSize': '14px', 'color': '#666'}),
+                    html.H2(f'{stats["late_pct"]:.1f}%', style={'margin': '0', 'color': COLORS['danger']})
+                ]),
+            ]),
 
-            # Onglet 1: Vue d'ensemble
-            dcc.Tab(label='📊 Vue d\'Ensemble', value='tab-overview', children=[
-                html.Div(style={'padding': '20px'}, children=[
+            # Section des filtres
+            html.Div(style={
+                'backgroundColor': COLORS['card'],
+                'padding': '20px',
+                'borderRadius': '8px',
+                'boxShadow': '0 2px 4px rgba(0,0,0,0.1)',
+                'marginBottom': '30px'
+            }, children=[
+                html.H3('🔍 Filtres Interactifs', style={'marginTop': '0', 'color': COLORS['primary']}),
+
+                html.Div(style={'display': 'grid', 'gridTemplateColumns': '1fr 1fr 1fr', 'gap': '20px'}, children=[
+
+                    # Filtre par type de transport
+                    html.Div(children=[
+                        html.Label('Type de Transport:', style={'fontWeight': 'bold', 'marginBottom': '5px', 'display': 'block'}),
+                        dcc.Checklist(
+                            id='transport-filter',
+                            options=[
+                                {'label': ' Bus', 'value': 'Bus'},
+                                {'label': ' Tram', 'value': 'Tram'}
+                            ],
+                            value=['Bus', 'Tram'],
+                            style={'display': 'flex', 'gap': '15px'}
+                        )
+                    ]),
 
-                    # Graphique 1 & 2: Distribution des retards
-                    html.Div(style={'display': 'grid', 'gridTemplateColumns': '1fr 1fr', 'gap': '20px', 'marginBottom': '20px'}, children=[
-                        html.Div(style={'backgroundColor': COLORS['card'], 'padding': '20px', 'borderRadius': '8px', 'boxShadow': '0 2px 4px rgba(0,0,0,0.1)'}, children=[
-                            dcc.Graph(id='graph-distribution')
-                        ]),
-                        html.Div(style={'backgroundColor': COLORS['card'], 'padding': '20px', 'borderRadius': '8px', 'boxShadow': '0 2px 4px rgba(0,0,0,0.1)'}, children=[
-                            dcc.Graph(id='graph-violin')
-                        ]),
+                    # Filtre par heure
+                    html.Div(children=[
+                        html.Label('Plage Horaire:', style={'fontWeight': 'bold', 'marginBottom': '5px', 'display': 'block'}),
+                        dcc.RangeSlider(
+                            id='hour-filter',
+                            min=0,
+                            max=23,
+                            step=1,
+                            marks={i: f'{i:02d}h' for i in range(0, 24, 3)},
+                            value=[0, 23],
+                            tooltip={"placement": "bottom", "always_visible": False}
+                        )
                     ]),
 
-                    # Graphique 3: Hit Parade des lignes
-                    html.Div(style={'backgroundColor': COLORS['card'], 'padding': '20px', 'borderRadius': '8px', 'boxShadow': '0 2px 4px rgba(0,0,0,0.1)', 'marginBottom': '20px'}, children=[
-                        dcc.Graph(id='graph-hit-parade')
+                    # Filtre par nombre de lignes
+                    html.Div(children=[
+                        html.Label('Top N Lignes (Hit Parade):', style={'fontWeight': 'bold', 'marginBottom': '5px', 'display': 'block'}),
+                        dcc.Slider(
+                            id='top-lines-filter',
+                            min=5,
+                            max=30,
+                            step=5,
+                            marks={i: str(i) for i in range(5, 35, 5)},
+                            value=15,
+                            tooltip={"placement": "bottom", "always_visible": True}
+                        )
                     ]),
+                ]),
+
+                html.Div(style={'marginTop': '15px', 'textAlign': 'center'}, children=[
+                    html.Button('🔄 Rafraîchir les données', id='refresh-button', n_clicks=0, style={
+                        'padding': '10px 30px',
+                        'backgroundColor': COLORS['primary'],
+                        'color': 'white',
+                        'border': 'none',
+                        'borderRadius': '5px',
+                        'cursor': 'pointer',
+                        'fontSize': '14px',
+                        'fontWeight': 'bold'
+                    })
                 ])
             ]),
 
-            # Onglet 2: Analyse Temporelle
-            dcc.Tab(label='⏰ Analyse Temporelle', value='tab-temporal', children=[
-                html.Div(style={'padding': '20px'}, children=[
+            # Onglets pour les visualisations
+            dcc.Tabs(id='tabs', value='tab-overview', children=[
+
+                # Onglet 1: Vue d'ensemble
+                dcc.Tab(label='📊 Vue d\'Ensemble', value='tab-overview', children=[
+                    html.Div(style={'padding': '20px'}, children=[
+
+                        # Graphique 1 & 2: Distribution des retards
+                        html.Div(style={'display': 'grid', 'gridTemplateColumns': '1fr 1fr', 'gap': '20px', 'marginBottom': '20px'}, children=[
+                            html.Div(style={'backgroundColor': COLORS['card'], 'padding': '20px', 'borderRadius': '8px', 'boxShadow': '0 2px 4px rgba(0,0,0,0.1)'}, children=[
+                                dcc.Graph(id='graph-distribution')
+                            ]),
+                            html.Div(style={'backgroundColor': COLORS['card'], 'padding': '20px', 'borderRadius': '8px', 'boxShadow': '0 2px 4px rgba(0,0,0,0.1)'}, children=[
+                                dcc.Graph(id='graph-violin')
+                            ]),
+                        ]),
 
-                    # Graphique 4: Évolution horaire
-                    html.Div(style={'backgroundColor': COLORS['card'], 'padding': '20px', 'borderRadius': '8px', 'boxShadow': '0 2px 4px rgba(0,0,0,0.1)', 'marginBottom': '20px'}, children=[
-                        dcc.Graph(id='graph-hourly')
-                    ]),
+                        # Graphique 3: Hit Parade des lignes
+                        html.Div(style={'backgroundColor': COLORS['card'], 'padding': '20px', 'borderRadius': '8px', 'boxShadow': '0 2px 4px rgba(0,0,0,0.1)', 'marginBottom': '20px'}, children=[
+                            dcc.Graph(id='graph-hit-parade')
+                        ]),
+                    ])
+                ]),
 
-                    # Graphique 5: Heatmap
-                    html.Div(style={'backgroundColor': COLORS['card'], 'padding': '20px', 'borderRadius': '8px', 'boxShadow': '0 2px 4px rgba(0,0,0,0.1)'}, children=[
-                        dcc.Graph(id='graph-heatmap')
-                    ]),
-                ])
-            ]),
+                # Onglet 2: Analyse Temporelle
+                dcc.Tab(label='⏰ Analyse Temporelle', value='tab-temporal', children=[
+                    html.Div(style={'padding': '20px'}, children=[
 
-            # Onglet 3: Comparaison & Géographie
-            dcc.Tab(label='🗺️ Comparaison & Carte', value='tab-comparison', children=[
-                html.Div(style={'padding': '20px'}, children=[
+                        # Graphique 4: Évolution horaire
+                        html.Div(style={'backgroundColor': COLORS['card'], 'padding': '20px', 'borderRadius': '8px', 'boxShadow': '0 2px 4px rgba(0,0,0,0.1)', 'marginBottom': '20px'}, children=[
+                            dcc.Graph(id='graph-hourly')
+                        ]),
 
-                    # Graphique 6: Bus vs Tram
-                    html.Div(style={'display': 'grid', 'gridTemplateColumns': '1fr 1fr', 'gap': '20px', 'marginBottom': '20px'}, children=[
+                        # Graphique 5: Heatmap
                         html.Div(style={'backgroundColor': COLORS['card'], 'padding': '20px', 'borderRadius': '8px', 'boxShadow': '0 2px 4px rgba(0,0,0,0.1)'}, children=[
-                            dcc.Graph(id='graph-boxplot')
+                            dcc.Graph(id='graph-heatmap')
                         ]),
-                        html.Div(style={'backgroundColor': COLORS['card'], 'padding': '20px', 'borderRadius': '8px', 'boxShadow': '0 2px 4px rgba(0,0,0,0.1)'}, children=[
-                            dcc.Graph(id='graph-violin-compare')
+                    ])
+                ]),
+
+                # Onglet 3: Comparaison & Géographie
+                dcc.Tab(label='🗺️ Comparaison & Carte', value='tab-comparison', children=[
+                    html.Div(style={'padding': '20px'}, children=[
+
+                        # Graphique 6: Bus vs Tram
+                        html.Div(style={'display': 'grid', 'gridTemplateColumns': '1fr 1fr', 'gap': '20px', 'marginBottom': '20px'}, children=[
+                            html.Div(style={'backgroundColor': COLORS['card'], 'padding': '20px', 'borderRadius': '8px', 'boxShadow': '0 2px 4px rgba(0,0,0,0.1)'}, children=[
+                                dcc.Graph(id='graph-boxplot')
+                            ]),
+                            html.Div(style={'backgroundColor': COLORS['card'], 'padding': '20px', 'borderRadius': '8px', 'boxShadow': '0 2px 4px rgba(0,0,0,0.1)'}, children=[
+                                dcc.Graph(id='graph-violin-compare')
+                            ]),
                         ]),
-                    ]),
 
-                    # Graphique 7: Carte géographique
-                    html.Div(style={'backgroundColor': COLORS['card'], 'padding': '20px', 'borderRadius': '8px', 'boxShadow': '0 2px 4px rgba(0,0,0,0.1)'}, children=[
-                        dcc.Graph(id='graph-map')
-                    ]),
-                ])
+                        # Graphique 7: Carte géographique
+                        html.Div(style={'backgroundColor': COLORS['card'], 'padding': '20px', 'borderRadius': '8px', 'boxShadow': '0 2px 4px rgba(0,0,0,0.1)'}, children=[
+                            dcc.RadioItems(
+                                id='map-render-mode',
+                                options=[
+                                    {'label': ' Hexagones (toutes les observations)', 'value': 'hexbin'},
+                                    {'label': ' Points (échantillon de 5k)', 'value': 'points'}
+                                ],
+                                value='hexbin',
+                                style={'display': 'flex', 'gap': '15px', 'marginBottom': '10px'}
+                            ),
+                            dcc.Graph(id='graph-map')
+                        ]),
+                    ])
+                ]),
             ]),
-        ]),
 
-        # Footer
-        html.Div(style={
-            'textAlign': 'center',
-            'padding': '30px',
-            'color': '#666',
-            'marginTop': '30px'
-        }, children=[
-            html.P('📊 Nice Traffic Watch - Dashboard Interactif avec Dash & Plotly'),
-            html.P(f'Données: {stats["start_time"]} → {stats["end_time"]}'),
-            html.P('Créé avec ❤️ pour le TP Visualisation - Doranco', style={'fontSize': '12px'})
+            # Footer
+            html.Div(style={
+                'textAlign': 'center',
+                'padding': '30px',
+                'color': '#666',
+                'marginTop': '30px'
+            }, children=[
+                html.P('📊 Nice Traffic Watch - Dashboard Interactif avec Dash & Plotly'),
+                html.P(f'Données: {stats["start_time"]} → {stats["end_time"]}'),
+                html.P('Créé avec ❤️ pour le TP Visualisation - Doranco', style={'fontSize': '12px'})
+            ])
         ])
     ])
-])
 
 
-# Callbacks pour mettre à jour les graphiques
-@app.callback(
-    [Output('graph-distribution', 'figure'),
-     Output('graph-violin', 'figure'),
-     Output('graph-hit-parade', 'figure'),
-     Output('graph-hourly', 'figure'),
-     Output('graph-heatmap', 'figure'),
-     Output('graph-boxplot', 'figure'),
-     Output('graph-violin-compare', 'figure'),
-     Output('graph-map', 'figure')],
-    [Input('transport-filter', 'value'),
-     Input('hour-filter', 'value'),
-     Input('top-lines-filter', 'value'),
-     Input('refresh-button', 'n_clicks')]
-)
-def update_graphs(transport_types, hour_range, top_n_lines, n_clicks):
-    """
-    🚀 OPTIMISÉ: Mise à jour de tous les graphiques en fonction des filtres
-    Utilise les agrégations pré-calculées pour des performances instantanées
-    """
+app.layout = serve_layout
 
-    # Paramètres de filtrage
-    hours_list = list(range(hour_range[0], hour_range[1] + 1))
 
-    # ⚡ Échantillon optimisé pour les distributions (10k points au lieu de 1.5M)
-    df_sample = loader.get_filtered_data(
-        route_ids=None,
-        hours=hours_list,
-        transport_types=transport_types,
-        sample_size=10000  # 150x plus rapide !
-    )
+# ==================== Construction des figures ====================
+# Une fonction par graphique, qui ne reçoit que les filtres dont il dépend
 
-    # ==================== GRAPHIQUE 1: Distribution (Histogramme) ====================
-    fig_dist = px.histogram(
-        df_sample,
-        x='delay_minutes',
-        nbins=50,
-        title='Distribution des Retards (échantillon 10k)',
-        labels={'delay_minutes': 'Retard (minutes)', 'count': 'Fréquence'},
-        color_discrete_sequence=['#0066cc']
-    )
+# Taille maximale (pixels) de la vue de carte, pour la zone à agréger autour du centre
+MAP_VIEW_PIXELS = (1200, 600)
+
+
+def hours_from_range(hour_range):
+    return list(range(hour_range[0], hour_range[1] + 1))
+
+
+def build_distribution(loader, transport_types, hour_range):
+    """Graphique 1: histogramme exact des retards de la sélection"""
+    # ⚡ Distribution exacte depuis le cube type × heure × retard (toutes les observations)
+    distribution = loader.get_delay_distribution(transport_types=transport_types, hours=hours_from_range(hour_range))
+
+    hist, edges = distribution.histogram(bin_minutes=1.0)
+    fig_dist = go.Figure(go.Bar(
+        x=(edges[:-1] + edges[1:]) / 2,
+        y=hist,
+        width=np.diff(edges),
+        marker_color='#0066cc',
+        hovertemplate='Retard: %{x:.1f} min<br>Fréquence: %{y:,}<extra></extra>'
+    ))
 
     # Ajouter la ligne à l'heure
     fig_dist.add_vline(x=0, line_dash="dash", line_color="red", annotation_text="À l'heure")
-    fig_dist.add_vline(x=df_sample['delay_minutes'].mean(), line_dash="dash", line_color="orange",
-                       annotation_text=f"Moyenne: {df_sample['delay_minutes'].mean():.1f} min")
+    if distribution.count:
+        fig_dist.add_vline(x=distribution.mean, line_dash="dash", line_color="orange",
+                           annotation_text=f"Moyenne: {distribution.mean:.1f} min")
 
     fig_dist.update_layout(
+        title=f'Distribution des Retards ({distribution.count:,} observations)',
+        xaxis_title='Retard (minutes)',
+        yaxis_title='Fréquence',
         template='plotly_white',
         hovermode='x unified',
+        bargap=0,
         showlegend=False
     )
 
-    # ==================== GRAPHIQUE 2: Violin Plot ====================
-    fig_violin = go.Figure()
-
-    fig_violin.add_trace(go.Violin(
-        y=df_sample['delay_minutes'],
-        name='Retards',
-        box_visible=True,
-        meanline_visible=True,
-        fillcolor='lightblue',
-        opacity=0.6,
-        line_color='black'
-    ))
+    return fig_dist
+
+
+def build_violin(loader, transport_types, hour_range):
+    """Graphique 2: violon de la sélection, depuis le cube"""
+    distribution = loader.get_delay_distribution(transport_types=transport_types, hours=hours_from_range(hour_range))
+
+    fig_violin = go.Figure(violin_traces(distribution, 'Retards', 0, 'lightblue') if distribution.count else [])
 
     fig_violin.add_hline(y=0, line_dash="dash", line_color="red", annotation_text="À l'heure")
 
     fig_violin.update_layout(
-        title='Densité de Probabilité des Retards (échantillon 10k)',
+        title='Densité de Probabilité des Retards (toutes les observations)',
         yaxis_title='Retard (minutes)',
+        xaxis=dict(visible=False),
         template='plotly_white',
         showlegend=False
     )
 
-    # ==================== GRAPHIQUE 3: Hit Parade des Lignes ====================
+    return fig_violin
+
+
+def build_hit_parade(loader, top_n_lines):
+    """Graphique 3: lignes avec les plus grands retards moyens"""
     line_stats = loader.get_line_stats(min_observations=50)
     top_worst = line_stats.nlargest(top_n_lines, 'mean_delay')
 
@@ -370,11 +435,15 @@ def update_graphs(transport_types, hour_range, top_n_lines, n_clicks):
         showlegend=False
     )
 
-    # ==================== GRAPHIQUE 4: Évolution Horaire ====================
+    return fig_hitparade
+
+
+def build_hourly(loader, transport_types, hour_range):
+    """Graphique 4: retard moyen par heure avec IC 95%"""
     # ⚡ Utiliser les agrégations pré-calculées (100x plus rapide)
     hourly_stats = loader.get_hourly_stats(
         transport_types=transport_types,
-        hours=hours_list
+        hours=hours_from_range(hour_range)
     )
 
     fig_hourly = go.Figure()
@@ -412,7 +481,11 @@ def update_graphs(transport_types, hour_range, top_n_lines, n_clicks):
         xaxis=dict(tickmode='linear', tick0=0, dtick=1, ticksuffix='h')
     )
 
-    # ==================== GRAPHIQUE 5: Heatmap ====================
+    return fig_hourly
+
+
+def build_heatmap(loader):
+    """Graphique 5: heatmap ligne × heure (20 lignes principales, sans filtre)"""
     heatmap_data = loader.get_heatmap_data(top_n_lines=20)
 
     fig_heatmap = go.Figure(go.Heatmap(
@@ -435,80 +508,265 @@ def update_graphs(transport_types, hour_range, top_n_lines, n_clicks):
         height=600
     )
 
-    # ==================== GRAPHIQUE 6 & 7: Bus vs Tram ====================
-    if len(df_sample['transport_type'].unique()) >= 2:
-        # Boxplot
-        fig_boxplot = px.box(
-            df_sample,
-            x='transport_type',
-            y='delay_minutes',
-            color='transport_type',
-            title='Distribution des Retards par Type de Transport (Boxplot)',
-            labels={'delay_minutes': 'Retard (minutes)', 'transport_type': 'Type de Transport'},
-            color_discrete_map={'Bus': '#ff7f50', 'Tram': '#87ceeb'}
-        )
-        fig_boxplot.add_hline(y=0, line_dash="dash", line_color="red")
-        fig_boxplot.update_layout(template='plotly_white', showlegend=False)
-
-        # Violin plot
-        fig_violin_compare = px.violin(
-            df_sample,
-            x='transport_type',
-            y='delay_minutes',
-            color='transport_type',
-            title='Distribution des Retards par Type de Transport (Violin)',
-            labels={'delay_minutes': 'Retard (minutes)', 'transport_type': 'Type de Transport'},
-            color_discrete_map={'Bus': '#ff7f50', 'Tram': '#87ceeb'},
-            box=True
-        )
-        fig_violin_compare.add_hline(y=0, line_dash="dash", line_color="red")
-        fig_violin_compare.update_layout(template='plotly_white', showlegend=False)
+    return fig_heatmap
+
+
+def build_type_comparison(loader, kind, transport_types, hour_range):
+    """Graphiques 6 & 7: une boîte (kind='box') ou un violon (kind='violin') par type de transport"""
+    by_type = loader.get_delay_distribution(transport_types=transport_types, hours=hours_from_range(hour_range),
+                                            by_type=True)
+
+    # Statistiques exactes du cube, pour chaque type présent dans la sélection
+    names = list(by_type)
+    if kind == 'box':
+        fig = go.Figure([
+            box_trace(by_type[name], name, i, TRANSPORT_COLORS.get(name, '#0066cc'))
+            for i, name in enumerate(names)
+        ])
+    else:
+        fig = go.Figure([
+            trace
+            for i, name in enumerate(names)
+            for trace in violin_traces(by_type[name], name, i, TRANSPORT_COLORS.get(name, '#0066cc'))
+        ])
+
+    if len(names) >= 2:
+        title = ('Distribution des Retards par Type de Transport '
+                 + ('(Boxplot)' if kind == 'box' else '(Violin)'))
     else:
         # Si un seul type de transport
-        fig_boxplot = px.box(
-            df_sample,
-            y='delay_minutes',
-            title=f'Distribution des Retards - {df_sample["transport_type"].iloc[0]}',
-            labels={'delay_minutes': 'Retard (minutes)'}
+        title = f'Distribution des Retards - {names[0] if names else "aucune donnée"}'
+
+    fig.add_hline(y=0, line_dash="dash", line_color="red")
+    fig.update_layout(
+        title=title,
+        xaxis=dict(tickmode='array', tickvals=list(range(len(names))), ticktext=names,
+                   title='Type de Transport'),
+        yaxis_title='Retard (minutes)',
+        template='plotly_white',
+        showlegend=False
+    )
+    return fig
+
+
+def map_view(relayout_data):
+    """
+    Zoom et zone à couvrir depuis le relayoutData de la carte (None = vue initiale)
+
+    Le zoom est arrondi au demi-niveau; la zone, alignée sur une grille d'une
+    demi-vue, couvre la demi-vue du centre et une demi-vue de chaque côté
+    (1,5 vue par axe): la vue entière est toujours couverte, et un petit
+    déplacement retombe sur la même clé de cache.
+    """
+    if not relayout_data or 'map.zoom' not in relayout_data or 'map.center' not in relayout_data:
+        return None
+    zoom = round(float(relayout_data['map.zoom']) * 2) / 2
+    center = relayout_data['map.center']
+    degrees_per_pixel = 360 / (MAP_TILE_PIXELS * 2 ** zoom)
+    half_lon = MAP_VIEW_PIXELS[0] / 2 * degrees_per_pixel
+    # Latitude arrondie au degré: même grille pour tous les centres proches
+    half_lat = MAP_VIEW_PIXELS[1] / 2 * degrees_per_pixel * np.cos(np.deg2rad(round(center['lat'])))
+    tile_lat = np.floor(center['lat'] / half_lat)
+    tile_lon = np.floor(center['lon'] / half_lon)
+    bounds = tuple(round(float(v), 6) for v in ((tile_lat - 1) * half_lat, (tile_lat + 2) * half_lat,
+                                                (tile_lon - 1) * half_lon, (tile_lon + 2) * half_lon))
+    return zoom, bounds
+
+
+def build_map(loader, transport_types, mode='hexbin', view=None):
+    """
+    Graphique 8: carte des retards
+
+    mode='hexbin': hexagones agrégés côté serveur sur toutes les observations,
+    à la taille du zoom courant (couleur = retard moyen, taille = nombre
+    d'observations); mode='points': échantillon géographique pré-calculé.
+    """
+    zoom, bounds = view if view is not None else (MAP_DEFAULT_ZOOM, None)
+    # Centre de la vue initiale (la vue de l'utilisateur est conservée par uirevision)
+    geo = loader.get_geo_sample()
+    center = dict(lat=float(geo['latitude'].mean()), lon=float(geo['longitude'].mean())) if len(geo) else None
+
+    if mode == 'points':
+        df_geo = loader.get_geo_sample(transport_types=transport_types, bounds=bounds)
+
+        # ✅ FIXÉ: scatter_map au lieu de scatter_mapbox (deprecated)
+        fig_map = px.scatter_map(
+            df_geo,
+            lat='latitude',
+            lon='longitude',
+            color='delay_minutes',
+            size=abs(df_geo['delay_minutes']) + 1,
+            color_continuous_scale='RdYlGn_r',
+            range_color=[-10, 10],
+            height=600,
+            title=f'Carte des Retards à Nice ({len(df_geo):,} points pré-échantillonnés)',
+            labels={'delay_minutes': 'Retard (min)'},
+            hover_data={'route_id': True, 'delay_minutes': ':.1f', 'latitude': ':.4f', 'longitude': ':.4f'}
         )
-        fig_boxplot.add_hline(y=0, line_dash="dash", line_color="red")
-        fig_boxplot.update_layout(template='plotly_white')
-
-        fig_violin_compare = px.violin(
-            df_sample,
-            y='delay_minutes',
-            title=f'Distribution des Retards - {df_sample["transport_type"].iloc[0]}',
-            labels={'delay_minutes': 'Retard (minutes)'},
-            box=True
+    else:
+        # ⚡ Quelques centaines d'hexagones au lieu de milliers de points
+        bins = loader.get_geo_bins(transport_types=transport_types, bounds=bounds, zoom=zoom)
+        counts = bins['count'].to_numpy()
+        sizes = 4 + (2 * HEX_RADIUS_PIXELS - 4) * np.sqrt(counts / counts.max()) if len(counts) else counts
+        fig_map = go.Figure(go.Scattermap(
+            lat=bins['latitude'].to_numpy(np.float32),
+            lon=bins['longitude'].to_numpy(np.float32),
+            mode='markers',
+            marker=dict(
+                size=np.asarray(sizes, dtype=np.float32),
+                color=bins['mean_delay'].to_numpy(np.float32),
+                colorscale='RdYlGn_r', cmin=-10, cmax=10, opacity=0.8,
+                colorbar=dict(title='Retard moyen (min)')
+            ),
+            customdata=counts.astype(np.int32),
+            hovertemplate='Retard moyen: %{marker.color:.1f} min<br>Observations: %{customdata:,}<extra></extra>'
+        ))
+        fig_map.update_layout(
+            height=600,
+            title=f'Carte des Retards à Nice ({counts.sum():,} observations, {len(counts):,} hexagones)'
         )
-        fig_violin_compare.add_hline(y=0, line_dash="dash", line_color="red")
-        fig_violin_compare.update_layout(template='plotly_white')
-
-    # ==================== GRAPHIQUE 8: Carte Géographique ====================
-    # ⚡ Utiliser l'échantillon géographique pré-calculé (instantané)
-    df_geo = loader.get_geo_sample(transport_types=transport_types)
-
-    # ✅ FIXÉ: scatter_map au lieu de scatter_mapbox (deprecated)
-    fig_map = px.scatter_map(
-        df_geo,
-        lat='latitude',
-        lon='longitude',
-        color='delay_minutes',
-        size=abs(df_geo['delay_minutes']) + 1,
-        color_continuous_scale='RdYlGn_r',
-        range_color=[-10, 10],
-        zoom=11,
-        height=600,
-        title='Carte des Retards à Nice (5k points pré-échantillonnés)',
-        labels={'delay_minutes': 'Retard (min)'},
-        hover_data={'route_id': True, 'delay_minutes': ':.1f', 'latitude': ':.4f', 'longitude': ':.4f'}
-    )
 
     fig_map.update_layout(
+        map=dict(center=center, zoom=MAP_DEFAULT_ZOOM),
+        uirevision='carte',
         template='plotly_white'
     )
 
-    return fig_dist, fig_violin, fig_hitparade, fig_hourly, fig_heatmap, fig_boxplot, fig_violin_compare, fig_map
+    return fig_map
+
+
+# ==================== Callbacks: un par graphique ====================
+# Chaque callback n'écoute que ses filtres (plus le bouton d'actualisation),
+# et la figure est mémorisée sous ces seules valeurs
+
+def filter_key(transport_types, hour_range=None):
+    """Clé de cache normalisée (l'ordre des cases cochées n'importe pas)"""
+    key = (tuple(sorted(transport_types or ())),)
+    if hour_range is not None:
+        key += (tuple(hour_range),)
+    return key
+
+
+def cached_figure(name, key, build):
+    """
+    Figure des données courantes, depuis le cache
+
+    La version des données fait partie de la clé: après un rafraîchissement
+    les figures sont reconstruites, les anciennes sortent du LRU. Le bouton
+    d'actualisation demande une vérification immédiate des nouvelles données
+    (sans l'attendre) et reconstruit la figure.
+    """
+    loader = live.loader
+    refresh = ctx.triggered_id == 'refresh-button'
+    if refresh and refresher is not None:
+        refresher.request_refresh()
+    return figure_cache.get_or_build(name, (loader.version,) + key, lambda: build(loader), refresh=refresh)
+
+
+@app.callback(
+    Output('data-version', 'data'),
+    Input('data-poll', 'n_intervals'),
+    State('data-version', 'data')
+)
+def poll_data_version(n_intervals, version):
+    """Nouvelle version des données: les graphiques se mettent à jour d'eux-mêmes"""
+    current = live.loader.version
+    return current if current != version else dash.no_update
+
+
+@app.callback(
+    Output('graph-distribution', 'figure'),
+    [Input('transport-filter', 'value'),
+     Input('hour-filter', 'value'),
+     Input('refresh-button', 'n_clicks'),
+     Input('data-version', 'data')]
+)
+def update_distribution(transport_types, hour_range, n_clicks, data_version):
+    return cached_figure('distribution', filter_key(transport_types, hour_range),
+                         lambda loader: build_distribution(loader, transport_types, hour_range))
+
+
+@app.callback(
+    Output('graph-violin', 'figure'),
+    [Input('transport-filter', 'value'),
+     Input('hour-filter', 'value'),
+     Input('refresh-button', 'n_clicks'),
+     Input('data-version', 'data')]
+)
+def update_violin(transport_types, hour_range, n_clicks, data_version):
+    return cached_figure('violin', filter_key(transport_types, hour_range),
+                         lambda loader: build_violin(loader, transport_types, hour_range))
+
+
+@app.callback(
+    Output('graph-hit-parade', 'figure'),
+    [Input('top-lines-filter', 'value'),
+     Input('refresh-button', 'n_clicks'),
+     Input('data-version', 'data')]
+)
+def update_hit_parade(top_n_lines, n_clicks, data_version):
+    return cached_figure('hit_parade', (top_n_lines,), lambda loader: build_hit_parade(loader, top_n_lines))
+
+
+@app.callback(
+    Output('graph-hourly', 'figure'),
+    [Input('transport-filter', 'value'),
+     Input('hour-filter', 'value'),
+     Input('refresh-button', 'n_clicks'),
+     Input('data-version', 'data')]
+)
+def update_hourly(transport_types, hour_range, n_clicks, data_version):
+    return cached_figure('hourly', filter_key(transport_types, hour_range),
+                         lambda loader: build_hourly(loader, transport_types, hour_range))
+
+
+@app.callback(
+    Output('graph-heatmap', 'figure'),
+    [Input('refresh-button', 'n_clicks'),
+     Input('data-version', 'data')]
+)
+def update_heatmap(n_clicks, data_version):
+    return cached_figure('heatmap', (), build_heatmap)
+
+
+@app.callback(
+    Output('graph-boxplot', 'figure'),
+    [Input('transport-filter', 'value'),
+     Input('hour-filter', 'value'),
+     Input('refresh-button', 'n_clicks'),
+     Input('data-version', 'data')]
+)
+def update_boxplot(transport_types, hour_range, n_clicks, data_version):
+    return cached_figure('boxplot', filter_key(transport_types, hour_range),
+                         lambda loader: build_type_comparison(loader, 'box', transport_types, hour_range))
+
+
+@app.callback(
+    Output('graph-violin-compare', 'figure'),
+    [Input('transport-filter', 'value'),
+     Input('hour-filter', 'value'),
+     Input('refresh-button', 'n_clicks'),
+     Input('data-version', 'data')]
+)
+def update_violin_compare(transport_types, hour_range, n_clicks, data_version):
+    return cached_figure('violin_compare', filter_key(transport_types, hour_range),
+                         lambda loader: build_type_comparison(loader, 'violin', transport_types, hour_range))
+
+
+@app.callback(
+    Output('graph-map', 'figure'),
+    [Input('transport-filter', 'value'),
+     Input('map-render-mode', 'value'),
+     Input('graph-map', 'relayoutData'),
+     Input('refresh-button', 'n_clicks'),
+     Input('data-version', 'data')]
+)
+def update_map(transport_types, mode, relayout_data, n_clicks, data_version):
+    view = map_view(relayout_data)
+    if view is None and ctx.triggered_id == 'graph-map':
+        return dash.no_update   # redimensionnement, pas de changement de zoom ni de centre
+    return cached_figure('map', filter_key(transport_types) + (mode, view),
+                         lambda loader: build_map(loader, transport_types, mode, view))
 
 
 # Lancement de l'application
@@ -2,6 +2,12 @@
 Module de chargement et préparation des données pour le dashboard Dash
 Optimisé avec pré-agrégation et cache pour performances instantanées
 """
+import hashlib
+import io
+import json
+import os
+import shutil
+import sys
 import pandas as pd
 import numpy as np
 from datetime import datetime
@@ -9,44 +15,800 @@ from pathlib import Path
 from functools import lru_cache
 import time
 
+from spatial_index import GridIndex
+
+# Paramètres de nettoyage (ils font partie de la clé du cache disque)
+CLEANING_PARAMS = {
+    'max_abs_delay_minutes': 60,
+    'latitude_range': [43.6, 43.8],    # Nice: ~43.7°N
+    'longitude_range': [7.0, 7.5],     # Nice: ~7.2°E
+}
+CACHE_VERSION = 5
+DEFAULT_CACHE_DIR = Path(__file__).resolve().parent / "cache"
+
+# Schéma compact: identifiants en catégories (chaque valeur stockée une fois),
+# entiers et flottants réduits à la précision utile
+CSV_DTYPES = {
+    'trip_id': 'category',
+    'route_id': 'category',
+    'vehicle_id': 'category',
+    'stop_id': 'category',
+    'route_type': 'int16',         # types GTFS étendus (ex: 715, transport à la demande) > 127
+    'delay_seconds': 'float32',    # cellule vide possible (supprimée au nettoyage), entiers exacts en float32
+    'latitude': 'float32',
+    'longitude': 'float32',
+}
+TRANSPORT_TYPES = {0: 'Tram', 3: 'Bus'}
+
+# Classes du cube des retards: 1 s = résolution du collecteur (cube exact)
+CUBE_BIN_SECONDS = 1
+
+# Sketch des agrégats horaires: mêmes classes de 10 s que TP/aggregation.py,
+# pour reprendre directement les histogrammes du snapshot du collecteur
+SKETCH_BIN_SECONDS = 10
+SKETCH_OFFSET = CLEANING_PARAMS['max_abs_delay_minutes'] * 60 // SKETCH_BIN_SECONDS
+SKETCH_BINS = 2 * SKETCH_OFFSET + 1
+SOURCE_TOKEN_BYTES = 4096   # fin du CSV hachée dans le jeton du snapshot (TOKEN_BYTES de TP/aggregation.py)
+MOMENT_COLUMNS = ['count', 'sum_delay', 'sumsq_delay']
+CELL_KEYS = ['route_id', 'hour', 'transport_type']
+GEO_SAMPLE_SIZE = 5000
+
+# Carte agrégée: hexagones de taille constante à l'écran, quel que soit le zoom
+HEX_RADIUS_PIXELS = 12
+MAP_TILE_PIXELS = 512      # tuiles MapLibre (go.Scattermap)
+MAP_DEFAULT_ZOOM = 11
+
+
+def format_time(df):
+    """Libellés 'HH:MM' à la demande depuis les colonnes hour/minute (remplace time_str)"""
+    return (df['hour'].astype(str).str.zfill(2) + ':' + df['minute'].astype(str).str.zfill(2))
+
+
+def memory_report(before, after):
+    """
+    Compare l'empreinte mémoire de deux versions du DataFrame, colonne par colonne
+
+    Returns:
+        DataFrame (colonne, dtype et Mo avant/après), avec une ligne TOTAL
+    """
+    def usage(df):
+        return df.memory_usage(deep=True, index=False) / 1024 ** 2
+
+    columns = list(before.columns) + [c for c in after.columns if c not in before.columns]
+    report = pd.DataFrame({
+        'dtype_before': before.dtypes.astype(str),
+        'mb_before': usage(before),
+        'dtype_after': after.dtypes.astype(str),
+        'mb_after': usage(after),
+    }).reindex(columns)
+    report['dtype_after'] = report['dtype_after'].fillna('(supprimée)')
+    report['mb_after'] = report['mb_after'].fillna(0.0)
+    report.loc['TOTAL'] = ['', report['mb_before'].sum(), '', report['mb_after'].sum()]
+    report['ratio'] = report['mb_before'] / report['mb_after']
+    return report.round(2)
+
+
+def file_digest(path, memo_path=None):
+    """
+    Empreinte blake2b du contenu d'un fichier
+
+    Args:
+        path: Fichier à hacher
+        memo_path: Index JSON (taille, mtime) -> empreinte, pour ne pas relire
+            un gros CSV inchangé à chaque démarrage
+
+    Returns:
+        Empreinte hexadécimale
+    """
+    path = Path(path).resolve()
+    stat = path.stat()
+    memo = {}
+    if memo_path is not None and Path(memo_path).exists():
+        try:
+            with open(memo_path, 'r', encoding='utf-8') as f:
+                memo = json.load(f)
+        except (OSError, ValueError):
+            memo = {}
+    entry = memo.get(str(path))
+    if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+        return entry['digest']
+
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    if memo_path is not None:
+        memo[str(path)] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'digest': digest.hexdigest()}
+        Path(memo_path).parent.mkdir(parents=True, exist_ok=True)
+        tmp = Path(str(memo_path) + '.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(memo, f)
+        os.replace(tmp, memo_path)
+    return digest.hexdigest()
+
+
+def delay_sketch(delay_minutes, cell_codes, n_cells):
+    """
+    Histogrammes (classes de SKETCH_BIN_SECONDS) des retards de chaque cellule
+
+    Args:
+        delay_minutes: Retards des observations
+        cell_codes: Numéro de cellule (0..n_cells-1) de chaque observation
+        n_cells: Nombre de cellules
+
+    Returns:
+        Tableau int32 (n_cells, SKETCH_BINS)
+    """
+    seconds = np.rint(np.asarray(delay_minutes, dtype=np.float64) * 60)
+    bins = np.clip(np.floor(seconds / SKETCH_BIN_SECONDS).astype(np.int64) + SKETCH_OFFSET, 0, SKETCH_BINS - 1)
+    flat = np.asarray(cell_codes, dtype=np.int64) * SKETCH_BINS + bins
+    return np.bincount(flat, minlength=n_cells * SKETCH_BINS).reshape(n_cells, SKETCH_BINS).astype(np.int32)
+
+
+def sketch_quantile(sketch, q):
+    """
+    Quantile (minutes) de chaque ligne d'un tableau d'histogrammes, vectorisé
+
+    Même estimation que RunningStats.quantile (TP/aggregation.py): valeurs
+    réparties uniformément dans leur classe, interpolation linéaire entre
+    rangs comme pandas. Erreur bornée par la largeur d'une classe (10 s).
+    """
+    sketch = np.asarray(sketch, dtype=np.int64)
+    cumulative = np.cumsum(sketch, axis=1)
+    counts = cumulative[:, -1] if sketch.shape[1] else np.zeros(len(sketch), dtype=np.int64)
+    rows = np.arange(len(sketch))
+
+    def order_statistic(k):
+        # Première classe dont le cumul dépasse le rang k, puis position dans la classe
+        i = (cumulative > k[:, None]).argmax(axis=1)
+        n = sketch[rows, i]
+        before = cumulative[rows, i] - n
+        return (i - SKETCH_OFFSET + (k - before + 0.5) / np.maximum(n, 1)) * SKETCH_BIN_SECONDS / 60
+
+    position = q * np.maximum(counts - 1, 0)
+    lower = np.floor(position).astype(np.int64)
+    upper = np.minimum(lower + 1, np.maximum(counts - 1, 0))
+    low = order_statistic(lower)
+    value = low + (position - lower) * (order_statistic(upper) - low)
+    return np.where(counts > 0, value, np.nan)
+
+
+def finish_moments(df):
+    """Moyenne, écart-type (ddof=1) et IC 95% depuis les moments count / sum / sum of squares"""
+    count = df['count'].astype(np.float64)
+    df['mean_delay'] = df['sum_delay'] / count
+    variance = (df['sumsq_delay'] - df['sum_delay'] * df['mean_delay']) / (count - 1).where(count > 1)
+    df['std_delay'] = np.sqrt(variance.clip(lower=0))
+    df['ci'] = 1.96 * df['std_delay'] / np.sqrt(count)
+    return df
+
+
+def prepare_frame(df):
+    """Colonnes dérivées d'un DataFrame lu depuis le CSV du collecteur (en place)"""
+    # Conversion des timestamps (l'heure 'HH:MM' se formate à la demande: format_time)
+    df['timestamp'] = pd.to_datetime(df['timestamp'])
+    df['hour'] = df['timestamp'].dt.hour.astype('int8')
+    df['minute'] = df['timestamp'].dt.minute.astype('int8')
+
+    # Conversion des retards en minutes
+    df['delay_minutes'] = (df['delay_seconds'] / 60).astype('float32')
+
+    # Type de transport
+    df['transport_type'] = pd.Categorical(df['route_type'].map(TRANSPORT_TYPES),
+                                          categories=sorted(TRANSPORT_TYPES.values()))
+    return df
+
+
+def clean_frame(df, params=CLEANING_PARAMS):
+    """Supprime les valeurs nulles, les retards aberrants et les positions hors de Nice"""
+    # Suppression des valeurs nulles
+    df_clean = df.dropna(subset=['delay_minutes', 'route_id', 'vehicle_id'])
+
+    # Suppression des retards aberrants (> ±60 minutes)
+    df_clean = df_clean[df_clean['delay_minutes'].abs() <= params['max_abs_delay_minutes']]
+
+    # Vérification des coordonnées GPS valides (Nice: ~43.7°N, 7.2°E)
+    return df_clean[
+        (df_clean['latitude'].between(*params['latitude_range'])) &
+        (df_clean['longitude'].between(*params['longitude_range']))
+    ]
+
+
+def concat_frames(first, second):
+    """Concatène deux DataFrames de même schéma en gardant les colonnes catégorielles (union des catégories)"""
+    columns = {}
+    for name in first.columns:
+        if isinstance(first[name].dtype, pd.CategoricalDtype):
+            columns[name] = pd.api.types.union_categoricals(
+                [first[name], second[name].astype('category')], ignore_order=True)
+        else:
+            columns[name] = pd.concat([first[name], second[name]], ignore_index=True)
+    return pd.DataFrame(columns)
+
+
+class _BoundedReader(io.RawIOBase):
+    """Lecture d'un fichier limitée à `limit` octets (le CSV peut grossir pendant la lecture)"""
+
+    def __init__(self, f, limit):
+        self._f = f
+        self._remaining = limit
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._f.read(min(len(buffer), self._remaining))
+        buffer[:len(data)] = data
+        self._remaining -= len(data)
+        return len(data)
+
+
+def complete_size(path, start=0):
+    """Taille du préfixe de `path` qui se termine par une ligne complète (le collecteur peut écrire en ce moment)"""
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        position = end
+        while position > start:
+            step = min(1 << 16, position - start)
+            f.seek(position - step)
+            block = f.read(step)
+            newline = block.rfind(b'\n')
+            if newline >= 0:
+                return position - step + newline + 1
+            position -= step
+    return start
+
+
+def source_token(path, offset):
+    """
+    Jeton des `offset` premiers octets d'un CSV: taille et empreinte de ses
+    SOURCE_TOKEN_BYTES derniers octets (None si le fichier est plus court)
+    """
+    with open(path, 'rb') as f:
+        if f.seek(0, os.SEEK_END) < offset:
+            return None
+        f.seek(max(0, offset - SOURCE_TOKEN_BYTES))
+        tail = f.read(offset - f.tell())
+    return {'offset': offset, 'digest': hashlib.blake2b(tail, digest_size=8).hexdigest()}
+
+
+def source_matches(path, token):
+    """Vrai si le CSV commence toujours par la partie décrite par `token` (snapshot du collecteur, cache)"""
+    current = source_token(path, token['offset'])
+    return current is not None and current['digest'] == token['digest']
+
+
+def write_arrow_table(df, path):
+    """Écrit un DataFrame en Arrow IPC non compressé, en un seul bloc"""
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(df, preserve_index=False).combine_chunks()
+    with pa.OSFile(str(path), 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table, max_chunksize=max(table.num_rows, 1))
+
+
+def read_arrow_table(path):
+    """
+    DataFrame adossé au fichier mappé en mémoire, sans copie des colonnes
+
+    Colonnes numériques et codes des catégories sont des vues (lecture seule)
+    sur le fichier; seuls les dictionnaires des catégories sont copiés (et les
+    codes des colonnes qui ont des valeurs manquantes).
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    table = pa.ipc.open_file(pa.memory_map(str(path), 'r')).read_all()
+    columns = {}
+    for name in table.column_names:
+        column = table.column(name)
+        if column.num_chunks != 1:
+            # Fichier écrit autrement que par write_arrow_table: conversion classique
+            columns[name] = column.to_pandas()
+            continue
+        array = column.chunk(0)
+        if pa.types.is_dictionary(array.type):
+            codes = array.indices
+            if codes.null_count:
+                # Valeur manquante = code -1 (sinon NaN, converti en 0: la première catégorie)
+                codes = pc.fill_null(codes, -1)
+            columns[name] = pd.Categorical.from_codes(
+                codes.to_numpy(zero_copy_only=False),
+                categories=array.dictionary.to_pandas(),
+                ordered=array.type.ordered, validate=False)
+        elif array.null_count == 0 and (pa.types.is_integer(array.type) or pa.types.is_floating(array.type)
+                                        or (pa.types.is_timestamp(array.type) and array.type.tz is None)):
+            columns[name] = array.to_numpy(zero_copy_only=True)
+        else:
+            columns[name] = array.to_pandas()
+    return pd.DataFrame(columns, copy=False)
+
+
+def read_csv_range(path, start, end, header=None):
+    """
+    Lit les lignes complètes du CSV entre les octets [start, end)
+
+    Args:
+        header: Ligne d'en-tête (octets) à ajouter quand start > 0
+
+    Returns:
+        DataFrame brut (dtypes de CSV_DTYPES)
+    """
+    with open(path, 'rb') as f:
+        f.seek(start)
+        if start:
+            source = io.BytesIO((header or b'') + f.read(end - start))
+        else:
+            source = io.BufferedReader(_BoundedReader(f, end))
+        return pd.read_csv(source, dtype=CSV_DTYPES)
+
+
+def hourly_cells(df_clean):
+    """
+    Cellules ligne × heure × type d'un DataFrame nettoyé
+
+    Returns:
+        Tuple (DataFrame des moments et médianes, sketch aligné sur ses lignes)
+    """
+    delays = df_clean['delay_minutes'].astype(np.float64)
+    grouped = pd.DataFrame({
+        'delay': delays, 'delay_sq': delays * delays,
+        'route_id': df_clean['route_id'], 'hour': df_clean['hour'],
+        'transport_type': df_clean['transport_type'],
+    }).groupby(CELL_KEYS, observed=True)
+    cells = grouped.agg(count=('delay', 'count'), sum_delay=('delay', 'sum'),
+                        sumsq_delay=('delay_sq', 'sum'),
+                        median_delay=('delay', 'median')).reset_index()
+    # Petite table: colonnes simples, comme le snapshot du collecteur
+    cells = cells.astype({'route_id': str, 'hour': int, 'transport_type': str, 'count': np.int64})
+    finish_moments(cells)
+    # Lignes sans cellule (type de transport inconnu, ex: route_type 715) exclues, comme dans DelayCube
+    codes = grouped.ngroup().to_numpy()
+    keep = codes >= 0
+    return cells, delay_sketch(delays.to_numpy()[keep], codes[keep], len(cells))
+
+
+def rollup_cells(agg, sketch, keys):
+    """
+    Regroupe des cellules par `keys`: sommes des moments et des sketchs
+
+    Returns:
+        Tuple (DataFrame keys + moments, sketchs fusionnés, taille de chaque groupe,
+        première ligne source de chaque groupe)
+    """
+    grouped = agg.groupby(keys, sort=True)
+    rollup = grouped[MOMENT_COLUMNS].sum().reset_index()
+    finish_moments(rollup)
+
+    # Sketchs: lignes triées par groupe, puis une somme par tranche
+    codes = grouped.ngroup().to_numpy()
+    order = np.argsort(codes, kind='stable')
+    if len(rollup):
+        starts = np.searchsorted(codes[order], np.arange(len(rollup)))
+        merged = np.add.reduceat(sketch[order], starts, axis=0, dtype=np.int64)
+    else:
+        starts = np.zeros(0, dtype=np.int64)
+        merged = np.zeros((0, SKETCH_BINS), dtype=np.int64)
+    sizes = np.diff(np.append(starts, len(codes)))
+    return rollup, merged, sizes, order[starts]
+
+
+def merge_hourly(agg, sketch, new_agg, new_sketch):
+    """
+    Fusionne de nouvelles cellules dans les agrégats horaires
+
+    Les cellules inchangées gardent leur médiane exacte, celles qui reçoivent
+    des observations prennent la médiane de leur sketch fusionné.
+    """
+    combined = pd.concat([agg, new_agg], ignore_index=True)
+    rollup, merged, sizes, first = rollup_cells(combined, np.concatenate([sketch, new_sketch]), CELL_KEYS)
+    rollup['median_delay'] = np.where(sizes == 1, combined['median_delay'].to_numpy()[first],
+                                      sketch_quantile(merged, 0.5))
+    return rollup[list(agg.columns)], merged.astype(np.int32)
+
+
+def reservoir_update(sample, n_seen, new_rows, size=GEO_SAMPLE_SIZE, seed=None):
+    """
+    Échantillon uniforme de `size` lignes parmi n_seen + len(new_rows), sans relire les anciennes
+
+    Algorithme du réservoir: la i-ème ligne vue remplace une ligne de
+    l'échantillon avec une probabilité size / i.
+    """
+    rng = np.random.default_rng(seed)
+    columns = list(sample.columns)
+    free = max(0, size - len(sample))
+    fill, rest = new_rows.iloc[:free][columns], new_rows.iloc[free:]
+    sample = concat_frames(sample, fill) if len(fill) else sample
+
+    seen = n_seen + free + np.arange(len(rest))
+    slots = rng.integers(0, seen + 1) if len(rest) else np.zeros(0, dtype=np.int64)
+    accepted = np.flatnonzero(slots < size)
+    # Une même place remplacée plusieurs fois: seule la dernière ligne compte
+    last_slots, last = np.unique(slots[accepted][::-1], return_index=True)
+    replacing = accepted[::-1][last]
+    keep = np.ones(len(sample), dtype=bool)
+    keep[last_slots] = False
+    if not len(replacing):
+        return sample
+    return concat_frames(sample[keep].reset_index(drop=True), rest.iloc[replacing][columns].reset_index(drop=True))
+
+
+def hex_radius(zoom, ref_latitude):
+    """
+    Rayon (degrés de latitude) d'un hexagone de HEX_RADIUS_PIXELS pixels au zoom donné
+
+    En Mercator un pixel couvre 360 / (512 · 2^zoom) degrés de longitude, soit
+    ce nombre × cos(latitude) degrés de latitude.
+    """
+    return HEX_RADIUS_PIXELS * 360 / (MAP_TILE_PIXELS * 2 ** zoom) * np.cos(np.deg2rad(ref_latitude))
+
+
+def hex_bins(latitude, longitude, delay_minutes, radius, ref_latitude):
+    """
+    Regroupe des observations en hexagones (comptes et retard moyen par cellule)
+
+    Les longitudes sont ramenées à l'échelle des latitudes (× cos de la latitude
+    de référence); les centres des hexagones forment deux grilles rectangulaires
+    décalées, chaque point va au centre le plus proche des deux. La grille ne
+    dépend que du rayon: les cellules restent fixes d'un déplacement de carte à l'autre.
+
+    Returns:
+        DataFrame latitude, longitude (centres), count, mean_delay
+    """
+    scale = np.cos(np.deg2rad(ref_latitude))
+    x = np.asarray(longitude, dtype=np.float64) * scale
+    y = np.asarray(latitude, dtype=np.float64)
+    width, height = np.sqrt(3) * radius, 3 * radius
+
+    # Grille A (centres en i·w, j·h) et grille B (décalée d'une demi-maille)
+    ia, ja = np.round(x / width), np.round(y / height)
+    ib, jb = np.floor(x / width), np.floor(y / height)
+    da = (x - ia * width) ** 2 + (y - ja * height) ** 2
+    db = (x - (ib + 0.5) * width) ** 2 + (y - (jb + 0.5) * height) ** 2
+    on_b = db < da
+    i = np.where(on_b, ib, ia).astype(np.int64)
+    j = np.where(on_b, jb, ja).astype(np.int64)
+
+    if not len(i):
+        return pd.DataFrame({'latitude': [], 'longitude': [], 'count': [], 'mean_delay': []})
+    # Identifiant dense de cellule (i, j, grille) puis sommes par cellule
+    i0, j0 = i.min(), j.min()
+    n_j = int(j.max() - j0) + 1
+    cell = ((i - i0) * n_j + (j - j0)) * 2 + on_b
+    n_cells = (int(i.max() - i0) + 1) * n_j * 2
+    if n_cells <= max(4 * len(cell), 1 << 20):
+        # Grille dense: un bincount, sans tri
+        counts = np.bincount(cell, minlength=n_cells)
+        sums = np.bincount(cell, weights=delay_minutes, minlength=n_cells)
+        cells = np.flatnonzero(counts)
+        counts, sums = counts[cells], sums[cells]
+    else:
+        cells, inverse = np.unique(cell, return_inverse=True)
+        counts = np.bincount(inverse)
+        sums = np.bincount(inverse, weights=delay_minutes)
+
+    half = (cells & 1) * 0.5
+    return pd.DataFrame({
+        'latitude': ((cells >> 1) % n_j + j0 + half) * height,
+        'longitude': ((cells >> 1) // n_j + i0 + half) * width / scale,
+        'count': counts,
+        'mean_delay': sums / counts,
+    })
+
+
+def load_hourly_aggregates(snapshot_path: str):
+    """
+    Lit le snapshot d'agrégats tenu à jour par le collecteur (TP/aggregation.py)
+
+    Args:
+        snapshot_path: Chemin vers delay_aggregates.json
+
+    Returns:
+        Tuple (DataFrame au format de _hourly_agg, sketch aligné sur ses lignes,
+        nombre d'observations agrégées, jeton du CSV couvert ou None)
+    """
+    with open(snapshot_path, 'r', encoding='utf-8') as f:
+        snapshot = json.load(f)
+
+    cells = pd.DataFrame(snapshot['cells'], columns=snapshot['columns'])
+    count = cells['count'].astype(np.int64)
+    hourly_agg = pd.DataFrame({
+        'route_id': cells['route_id'].astype(str),
+        'hour': cells['hour'].astype(int),
+        'transport_type': cells['transport_type'].astype(str),
+        'count': count,
+        # Moments fusionnables, depuis la moyenne et M2 (Welford)
+        'sum_delay': cells['mean'] * count,
+        'sumsq_delay': cells['m2'] + count * cells['mean'] ** 2,
+        'median_delay': cells['median'].astype(float),
+    })
+    finish_moments(hourly_agg)
+
+    sketch = np.zeros((len(cells), SKETCH_BINS), dtype=np.int32)
+    for row, histogram in enumerate(cells['histogram']):
+        for b, n in histogram.items():
+            sketch[row, min(max(int(b) + SKETCH_OFFSET, 0), SKETCH_BINS - 1)] += n
+    return hourly_agg, sketch, snapshot['observations'], snapshot.get('source')
+
+
+class DelayDistribution:
+    """
+    Distribution exacte des retards d'une sélection, sous forme d'histogramme
+    à pas fin (comptes par valeur de retard)
+
+    Toutes les statistiques se calculent en O(nombre de classes), sans
+    revenir aux observations brutes.
+    """
+
+    def __init__(self, counts, values):
+        """
+        Args:
+            counts: Nombre d'observations par classe fine
+            values: Retard (minutes) représentant chaque classe fine
+        """
+        self.counts = np.asarray(counts, dtype=np.int64)
+        self.values = values
+        self._cumsum = np.cumsum(self.counts)
+
+    def __add__(self, other):
+        return DelayDistribution(self.counts + other.counts, self.values)
+
+    @property
+    def count(self):
+        return int(self._cumsum[-1]) if len(self._cumsum) else 0
+
+    @property
+    def mean(self):
+        if not self.count:
+            return np.nan
+        return float(np.dot(self.counts, self.values) / self.count)
+
+    @property
+    def std(self):
+        """Écart-type échantillon (ddof=1), comme pandas"""
+        if self.count < 2:
+            return np.nan
+        deviations = self.values - self.mean
+        return float(np.sqrt(np.dot(self.counts, deviations * deviations) / (self.count - 1)))
+
+    def _order_statistic(self, rank):
+        """Valeur de rang `rank` (0 = minimum) parmi les observations triées"""
+        return float(self.values[np.searchsorted(self._cumsum, rank + 1)])
+
+    def quantile(self, q):
+        """Quantile avec interpolation linéaire entre rangs (méthode par défaut de pandas)"""
+        if not self.count:
+            return np.nan
+        position = (self.count - 1) * q
+        lower = int(np.floor(position))
+        low = self._order_statistic(lower)
+        if lower == position:
+            return low
+        return low + (position - lower) * (self._order_statistic(lower + 1) - low)
+
+    def box_stats(self):
+        """
+        Statistiques d'une boîte à moustaches (moustaches à 1,5 × IQR, limitées
+        aux observations les plus extrêmes à l'intérieur)
+
+        Returns:
+            Dictionnaire q1, median, q3, lowerfence, upperfence, mean, sd, count
+        """
+        q1, median, q3 = self.quantile(0.25), self.quantile(0.5), self.quantile(0.75)
+        iqr = q3 - q1
+        present = self.values[self.counts > 0]
+        inside = present[(present >= q1 - 1.5 * iqr) & (present <= q3 + 1.5 * iqr)]
+        return {
+            'q1': q1, 'median': median, 'q3': q3,
+            'lowerfence': float(inside.min()) if len(inside) else np.nan,
+            'upperfence': float(inside.max()) if len(inside) else np.nan,
+            'mean': self.mean, 'sd': self.std, 'count': self.count,
+        }
+
+    def density(self, n_points=200, bandwidth=None):
+        """
+        Densité par noyau gaussien, calculée sur les classes fines
+
+        Même estimateur que go.Violin (bande passante de Silverman, étendue
+        jusqu'à deux bandes passantes au-delà des extrêmes), mais seule la
+        courbe échantillonnée part vers le navigateur, pas les observations.
+
+        Args:
+            n_points: Nombre de points de la courbe
+            bandwidth: Bande passante en minutes (None = règle de Silverman)
+
+        Returns:
+            Tuple (retards en minutes, densité par minute)
+        """
+        present = np.flatnonzero(self.counts)
+        if not len(present):
+            return np.zeros(0), np.zeros(0)
+        step = float(self.values[1] - self.values[0]) if len(self.values) > 1 else 1.0
+        if bandwidth is None:
+            spread = self.std
+            iqr = self.quantile(0.75) - self.quantile(0.25)
+            if iqr > 0:
+                spread = min(spread, iqr / 1.349)
+            bandwidth = 1.059 * spread * self.count ** -0.2 if spread > 0 else step
+        bandwidth = max(bandwidth, step)
+
+        # Convolution des comptes par le noyau échantillonné sur les classes fines
+        reach = min(int(np.ceil(4 * bandwidth / step)), len(self.counts))
+        offsets = np.arange(-reach, reach + 1) * step / bandwidth
+        kernel = np.exp(-0.5 * offsets ** 2) / (bandwidth * np.sqrt(2 * np.pi))
+        smoothed = np.convolve(self.counts, kernel, mode='same') / self.count
+
+        low = max(self.values[present[0]] - 2 * bandwidth, self.values[0])
+        high = min(self.values[present[-1]] + 2 * bandwidth, self.values[-1])
+        grid = np.linspace(low, high, n_points)
+        return grid, np.interp(grid, self.values, smoothed)
+
+    def histogram(self, bin_minutes=1.0):
+        """
+        Regroupe les classes fines en classes de `bin_minutes`, sur l'étendue observée
+
+        Returns:
+            Tuple (comptes, bornes des classes en minutes)
+        """
+        present = np.flatnonzero(self.counts)
+        if not len(present):
+            return np.zeros(0, dtype=np.int64), np.zeros(1)
+        start = np.floor(self.values[present[0]] / bin_minutes) * bin_minutes
+        edges = np.arange(start, self.values[present[-1]] + bin_minutes, bin_minutes)
+        if len(edges) < 2 or edges[-1] <= self.values[present[-1]]:
+            edges = np.append(edges, edges[-1] + bin_minutes)
+        # Affectation de chaque classe fine à sa classe d'affichage
+        targets = np.clip(np.searchsorted(edges, self.values, side='right') - 1, 0, len(edges) - 2)
+        hist = np.bincount(targets, weights=self.counts, minlength=len(edges) - 1).astype(np.int64)
+        return hist, edges
+
+
+class DelayCube:
+    """
+    Cube exact des retards: comptes par (type de transport, heure, classe de retard)
+
+    Le collecteur enregistre des retards entiers en secondes: avec des classes
+    d'une seconde le cube est exact (moyenne, écart-type, quantiles identiques
+    à ceux calculés sur les observations). Une sélection (types × heures)
+    se résume en sommant au plus 2 × 24 histogrammes.
+    """
+
+    def __init__(self, counts, transport_types, bin_seconds=CUBE_BIN_SECONDS,
+                 max_abs_minutes=CLEANING_PARAMS['max_abs_delay_minutes']):
+        """
+        Args:
+            counts: Tableau (types, 24 heures, classes) de comptes
+            transport_types: Libellé de chaque type (premier axe)
+            bin_seconds: Largeur d'une classe fine
+            max_abs_minutes: Retard absolu maximal couvert
+        """
+        self.counts = counts
+        self.transport_types = list(transport_types)
+        self.bin_seconds = bin_seconds
+        self.max_abs_seconds = int(max_abs_minutes * 60)
+        n_bins = counts.shape[-1]
+        # Valeur représentative de chaque classe: exacte avec des classes d'une seconde
+        self.values = (np.arange(n_bins) * bin_seconds - self.max_abs_seconds
+                       + (bin_seconds - 1) / 2) / 60
+
+    @classmethod
+    def from_frame(cls, df, bin_seconds=CUBE_BIN_SECONDS,
+                   max_abs_minutes=CLEANING_PARAMS['max_abs_delay_minutes']):
+        """Construit le cube en un seul passage vectorisé (np.bincount) sur les observations"""
+        transport_types = list(df['transport_type'].cat.categories)
+        max_abs_seconds = int(max_abs_minutes * 60)
+        n_bins = 2 * max_abs_seconds // bin_seconds + 1
+
+        seconds = np.rint(df['delay_minutes'].to_numpy(dtype=np.float64) * 60).astype(np.int64)
+        codes = df['transport_type'].cat.codes.to_numpy().astype(np.int64)
+        hours = df['hour'].to_numpy().astype(np.int64)
+        keep = (codes >= 0) & (np.abs(seconds) <= max_abs_seconds)
+        bins = (seconds[keep] + max_abs_seconds) // bin_seconds
+        flat = (codes[keep] * 24 + hours[keep]) * n_bins + bins
+
+        counts = np.bincount(flat, minlength=len(transport_types) * 24 * n_bins)
+        counts = counts.reshape(len(transport_types), 24, n_bins).astype(np.int32)
+        return cls(counts, transport_types, bin_seconds, max_abs_minutes)
+
+    @property
+    def nbytes(self):
+        return self.counts.nbytes
+
+    def select(self, transport_types=None, hours=None):
+        """
+        Distributions par type de transport pour une sélection
+
+        Args:
+            transport_types: Types à inclure (None ou vide = tous)
+            hours: Heures à inclure (None ou vide = toutes)
+
+        Returns:
+            Dictionnaire {type de transport: DelayDistribution}, types sans observation exclus
+        """
+        hour_index = np.asarray(sorted(hours), dtype=np.int64) if hours else slice(None)
+        distributions = {}
+        for i, transport_type in enumerate(self.transport_types):
+            if transport_types and transport_type not in transport_types:
+                continue
+            counts = self.counts[i, hour_index].sum(axis=0, dtype=np.int64)
+            if counts.any():
+                distributions[transport_type] = DelayDistribution(counts, self.values)
+        return distributions
+
+    def total(self, transport_types=None, hours=None):
+        """Distribution de la sélection, tous types confondus"""
+        counts = np.zeros(self.counts.shape[-1], dtype=np.int64)
+        for distribution in self.select(transport_types, hours).values():
+            counts += distribution.counts
+        return DelayDistribution(counts, self.values)
+
 
 class DataLoader:
     """Classe pour charger et préparer les données de retard des transports"""
 
-    def __init__(self, data_path: str = "../tp/data/transit_delays.csv"):
+    def __init__(self, data_path: str = "../tp/data/transit_delays.csv",
+                 aggregates_path: str = "../tp/data/delay_aggregates.json",
+                 cache_dir=DEFAULT_CACHE_DIR):
         """
         Initialise le chargeur de données
 
         Args:
             data_path: Chemin vers le fichier CSV des données
+            aggregates_path: Snapshot d'agrégats du collecteur (utilisé s'il existe
+                et couvre les mêmes observations que le CSV)
+            cache_dir: Dossier du cache Feather des données nettoyées (None = pas de cache)
         """
         self.data_path = data_path
+        self.aggregates_path = aggregates_path
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else None
         self.df = None
         self.df_clean = None
+        self._cache_entry = None
+        self._from_cache = False
+        self._raw_rows = None
+        self._source_offset = None     # octets du CSV déjà chargés (suite lue par refreshed())
+        self._csv_header = None
+        self._snapshot = None          # (agrégats, sketch, observations, offset) du snapshot du collecteur
+        self._snapshot_rows = None     # lignes brutes du CSV couvertes par ce snapshot
+        self.store_generation = None   # génération du store partagé (shared_store.py)
+        self.version = 0               # incrémenté à chaque rafraîchissement (clé des caches de figures)
+        self.loaded_at = datetime.now()
 
         # Cache des agrégations pré-calculées (perf instantanée)
         self._hourly_agg = None
+        self._hourly_sketch = None
         self._line_stats_cache = None
         self._heatmap_cache = None
-        self._histogram_cache = None
+        self._delay_cube = None
         self._geo_sample_cache = None
+        self._geo_index = None
+        self._summary_cache = None
 
     def load_data(self):
-        """Charge les données depuis le fichier CSV"""
+        """Charge les données depuis le fichier CSV (ou le cache des données nettoyées)"""
         print(f"Chargement des données depuis {self.data_path}...")
-        self.df = pd.read_csv(self.data_path)
-
-        # Conversion des timestamps
-        self.df['timestamp'] = pd.to_datetime(self.df['timestamp'])
-        self.df['hour'] = self.df['timestamp'].dt.hour
-        self.df['minute'] = self.df['timestamp'].dt.minute
-        self.df['time_str'] = self.df['timestamp'].dt.strftime('%H:%M')
-
-        # Conversion des retards en minutes
-        self.df['delay_minutes'] = self.df['delay_seconds'] / 60
-
-        # Type de transport
-        self.df['transport_type'] = self.df['route_type'].map({0: 'Tram', 3: 'Bus'})
+        if self._read_cache():
+            print(f"✅ {len(self.df_clean):,} observations nettoyées lues depuis le cache {self._cache_entry.name}")
+            return self.df
+
+        # Lignes complètes seulement: le collecteur peut être en train d'écrire
+        self._source_offset = complete_size(self.data_path)
+        self._snapshot = self._load_aggregate_snapshot()
+        if self._snapshot is None:
+            raw = read_csv_range(self.data_path, 0, self._source_offset)
+        else:
+            # Lecture en deux parties: ce que couvre le snapshot, puis la suite
+            offset = self._snapshot[3]
+            raw = read_csv_range(self.data_path, 0, offset)
+            self._snapshot_rows = len(raw)
+            if offset < self._source_offset:
+                with open(self.data_path, 'rb') as f:
+                    self._csv_header = f.readline()
+                raw = concat_frames(raw, read_csv_range(self.data_path, offset, self._source_offset,
+                                                        self._csv_header))
+        self.df = prepare_frame(raw)
 
         print(f"✅ {len(self.df):,} observations chargées")
         return self.df
@@ -56,27 +818,22 @@ class DataLoader:
         if self.df is None:
             raise ValueError("Les données doivent être chargées avant nettoyage")
 
-        print("Nettoyage des données...")
-
-        # Suppression des valeurs nulles
-        df_clean = self.df.dropna(subset=['delay_minutes', 'route_id', 'vehicle_id'])
-
-        # Suppression des retards aberrants (> ±60 minutes)
-        df_clean = df_clean[df_clean['delay_minutes'].abs() <= 60]
-
-        # Vérification des coordonnées GPS valides (Nice: ~43.7°N, 7.2°E)
-        df_clean = df_clean[
-            (df_clean['latitude'].between(43.6, 43.8)) &
-            (df_clean['longitude'].between(7.0, 7.5))
-        ]
+        if self._from_cache:
+            # Déjà nettoyées et agrégées au démarrage précédent
+            return self.df_clean
 
+        print("Nettoyage des données...")
+        df_clean = clean_frame(self.df)
         self.df_clean = df_clean
-        removed_pct = (1 - len(df_clean)/len(self.df)) * 100
+        self._raw_rows = len(self.df)
+
+        removed_pct = (1 - len(df_clean)/self._raw_rows) * 100 if self._raw_rows else 0.0
         print(f"✅ Nettoyage terminé: {removed_pct:.1f}% de données filtrées")
         print(f"   {len(df_clean):,} observations retenues")
 
         # Pré-calcul automatique des agrégations pour perf instantanée
         self._precompute_aggregates()
+        self._write_cache()
 
         return self.df_clean
 
@@ -92,11 +849,17 @@ class DataLoader:
         start_time = time.time()
 
         # 1. Agrégation horaire par ligne et type de transport
-        self._hourly_agg = self.df_clean.groupby(['route_id', 'hour', 'transport_type']).agg({
-            'delay_minutes': ['mean', 'std', 'count', 'median']
-        }).reset_index()
-        self._hourly_agg.columns = ['route_id', 'hour', 'transport_type', 'mean_delay', 'std_delay', 'count', 'median_delay']
-        self._hourly_agg['ci'] = 1.96 * self._hourly_agg['std_delay'] / np.sqrt(self._hourly_agg['count'])
+        #    Reprise du snapshot incrémental du collecteur quand son jeton
+        #    correspond au CSV (seules les lignes écrites après lui sont
+        #    agrégées), sinon recalcul complet
+        #    Chaque cellule garde des moments fusionnables (count, somme,
+        #    somme des carrés) et un sketch histogramme aligné sur ses lignes
+        #    (_hourly_sketch): tout regroupement se fait par sommes (_rollup)
+        snapshot = self._snapshot_cells()
+        if snapshot is not None:
+            self._hourly_agg, self._hourly_sketch = snapshot
+        else:
+            self._hourly_agg, self._hourly_sketch = hourly_cells(self.df_clean)
 
         # 2. Cache des stats par ligne
         self._line_stats_cache = {}
@@ -105,26 +868,273 @@ class DataLoader:
         self._heatmap_cache = {}
 
         # 4. Échantillon géographique fixe (5k points)
-        self._geo_sample_cache = self.df_clean.sample(n=min(5000, len(self.df_clean)), random_state=42)[
+        self._geo_sample_cache = self.df_clean.sample(n=min(GEO_SAMPLE_SIZE, len(self.df_clean)), random_state=42)[
             ['route_id', 'latitude', 'longitude', 'delay_minutes', 'transport_type']
         ].copy()
+        self._build_geo_index()
 
-        # 5. Pré-calcul des histogrammes par type de transport
-        self._histogram_cache = {}
-        for transport_type in self.df_clean['transport_type'].unique():
-            df_type = self.df_clean[self.df_clean['transport_type'] == transport_type]
-            hist, bins = np.histogram(df_type['delay_minutes'], bins=50, range=(-15, 15))
-            self._histogram_cache[transport_type] = {'hist': hist, 'bins': bins}
+        # 5. Cube exact type × heure × retard (panneaux de distribution)
+        self._delay_cube = DelayCube.from_frame(self.df_clean)
 
         elapsed = time.time() - start_time
         print(f"✅ Agrégations pré-calculées en {elapsed:.2f}s")
-        print(f"   • Données horaires: {len(self._hourly_agg):,} lignes")
+        print(f"   • Données horaires: {len(self._hourly_agg):,} lignes "
+              f"(sketch {self._hourly_sketch.nbytes / 1024 ** 2:.1f} Mo)")
         print(f"   • Échantillon géographique: {len(self._geo_sample_cache):,} points")
+        print(f"   • Cube des retards: {self._delay_cube.counts.shape} ({self._delay_cube.nbytes / 1024 ** 2:.1f} Mo)")
+
+    # ------------------------------------------------------------------
+    # Cache disque des données nettoyées et des agrégats
+    # ------------------------------------------------------------------
+    #
+    #   cache/<csv>-<clé>/
+    #   ├── meta.json           # jeton de la partie du CSV couverte, lignes brutes
+    #   ├── observations.arrow  # df_clean (Arrow IPC, un seul bloc: lecture sans copie)
+    #   ├── hourly_agg.arrow    # agrégats ligne × heure × type (moments)
+    #   ├── geo_sample.arrow    # échantillon de la carte
+    #   ├── hourly_sketch.npy   # sketchs des agrégats horaires
+    #   └── delay_cube.npy      # cube type × heure × retard
+    #
+    # La clé ne dépend que du chemin du CSV et des paramètres de nettoyage:
+    # le collecteur ajoute des lignes sans invalider le cache, seules les
+    # lignes écrites depuis sont relues (load_transit_data)
+
+    def _cache_path(self):
+        """Dossier de cache pour ce CSV et ces paramètres de nettoyage (None si indisponible)"""
+        if self.cache_dir is None or not Path(self.data_path).exists():
+            return None
+        key = json.dumps({
+            'source': str(Path(self.data_path).resolve()),
+            'params': CLEANING_PARAMS,
+            'version': CACHE_VERSION,
+        }, sort_keys=True)
+        digest = hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
+        return self.cache_dir / f"{Path(self.data_path).stem}-{digest}"
+
+    def _read_cache(self):
+        """
+        Attache le cache (données nettoyées et agrégats) s'il décrit le début du CSV
+
+        Les fichiers sont mappés en mémoire et lus sans copie: ni nettoyage
+        ni pré-calcul au démarrage.
+        """
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            return False
+        self._cache_entry = self._cache_path()
+        if self._cache_entry is None or not (self._cache_entry / "meta.json").exists():
+            return False
+        try:
+            with open(self._cache_entry / "meta.json", 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if not source_matches(self.data_path, meta['source']):
+                print("⚠️  CSV réécrit depuis la mise en cache, rechargement du CSV")
+                return False
+            df_clean = read_arrow_table(self._cache_entry / "observations.arrow")
+            hourly_agg = read_arrow_table(self._cache_entry / "hourly_agg.arrow")
+            geo_sample = read_arrow_table(self._cache_entry / "geo_sample.arrow")
+            sketch = np.load(self._cache_entry / "hourly_sketch.npy", mmap_mode='r')
+            cube = meta['delay_cube']
+            delay_cube = DelayCube(np.load(self._cache_entry / "delay_cube.npy", mmap_mode='r'),
+                                   cube['transport_types'], cube['bin_seconds'], cube['max_abs_minutes'])
+        except (OSError, ValueError, KeyError) as e:
+            print(f"⚠️  Cache illisible ({e}), rechargement du CSV")
+            return False
+
+        self.df_clean = df_clean
+        self.df = self.df_clean   # les lignes brutes ne sont pas gardées en cache
+        self._raw_rows = meta['raw_rows']
+        self._source_offset = meta['source']['offset']
+        self._hourly_agg, self._hourly_sketch = hourly_agg, sketch
+        self._delay_cube = delay_cube
+        self._geo_sample_cache = geo_sample
+        self._build_geo_index()
+        self._line_stats_cache = {}
+        self._heatmap_cache = {}
+        self._from_cache = True
+        return True
+
+    def _write_cache(self):
+        """Écrit données nettoyées et agrégats en Arrow/NumPy non compressés (lisibles par memory-map)"""
+        self._cache_entry = self._cache_path()
+        if self._cache_entry is None or self._delay_cube is None:
+            return
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            return
+        tmp = self._cache_entry.with_name(f".{self._cache_entry.name}-{os.getpid()}.tmp")
+        try:
+            tmp.mkdir(parents=True, exist_ok=True)
+            write_arrow_table(self.df_clean, tmp / "observations.arrow")
+            write_arrow_table(self._hourly_agg, tmp / "hourly_agg.arrow")
+            write_arrow_table(self._geo_sample_cache, tmp / "geo_sample.arrow")
+            np.save(tmp / "hourly_sketch.npy", self._hourly_sketch)
+            np.save(tmp / "delay_cube.npy", self._delay_cube.counts)
+            cube = self._delay_cube
+            meta = {'raw_rows': self._raw_rows, 'params': CLEANING_PARAMS,
+                    'source': source_token(self.data_path, self._source_offset),
+                    'delay_cube': {'transport_types': cube.transport_types, 'bin_seconds': cube.bin_seconds,
+                                   'max_abs_minutes': cube.max_abs_seconds / 60}}
+            with open(tmp / "meta.json", 'w', encoding='utf-8') as f:
+                json.dump(meta, f)
+            # Remplacement de l'ancienne version (ses fichiers encore mappés restent lisibles, POSIX)
+            old = tmp.with_suffix('.old')
+            if self._cache_entry.exists():
+                os.rename(self._cache_entry, old)
+            os.rename(tmp, self._cache_entry)
+            shutil.rmtree(old, ignore_errors=True)
+            # Un seul cache par fichier source: les versions précédentes sont supprimées
+            for stale in self.cache_dir.glob(f"{Path(self.data_path).stem}-*"):
+                if stale == self._cache_entry:
+                    continue
+                if stale.is_dir():
+                    shutil.rmtree(stale, ignore_errors=True)
+                else:
+                    stale.unlink()   # ancien cache Feather (un seul fichier)
+            print(f"💾 Données nettoyées et agrégats mis en cache: {self._cache_entry}")
+        except OSError as e:
+            shutil.rmtree(tmp, ignore_errors=True)
+            print(f"⚠️  Écriture du cache impossible ({e})")
+
+    def _load_aggregate_snapshot(self):
+        """
+        Snapshot du collecteur s'il couvre un début du CSV chargé (jeton vérifié
+        avant toute lecture du CSV), sinon None
+
+        Returns:
+            Tuple (agrégats, sketch, observations agrégées, octets du CSV couverts)
+        """
+        if not self.aggregates_path or not Path(self.aggregates_path).exists():
+            return None
+        try:
+            hourly_agg, sketch, n_observations, token = load_hourly_aggregates(self.aggregates_path)
+            if token is None or token['offset'] > self._source_offset \
+                    or not source_matches(self.data_path, token):
+                print(f"⚠️  Snapshot d'agrégats sans rapport avec {self.data_path}, recalcul complet")
+                return None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"⚠️  Snapshot d'agrégats illisible ({e}), recalcul complet")
+            return None
+        return hourly_agg, sketch, n_observations, token['offset']
+
+    def _snapshot_cells(self):
+        """Agrégats horaires du snapshot, complétés par les lignes écrites après lui (None si inutilisable)"""
+        if self._snapshot is None:
+            return None
+        hourly_agg, sketch, n_observations, offset = self._snapshot
+        covered = int((self.df_clean.index < self._snapshot_rows).sum())
+        # Même filtre que le collecteur (aggregation._cell_key): types de transport connus seulement
+        typed = int(self.df_clean['transport_type'].iloc[:covered].notna().sum())
+        if n_observations != typed:
+            print(f"⚠️  Snapshot d'agrégats désynchronisé ({n_observations:,} vs "
+                  f"{typed:,} observations), recalcul complet")
+            return None
+        print(f"   • Agrégats horaires repris du snapshot {self.aggregates_path}")
+        if covered == len(self.df_clean):
+            return hourly_agg, sketch
+        return merge_hourly(hourly_agg, sketch, *hourly_cells(self.df_clean.iloc[covered:]))
+
+    def _rollup(self, keys, mask=None):
+        """
+        Regroupe les cellules de _hourly_agg par `keys`, uniquement par sommes vectorisées
+
+        Moyenne et écart-type sont exacts (moments), la médiane vient du sketch
+        fusionné (erreur bornée par une classe de 10 s).
+
+        Args:
+            keys: Colonnes de regroupement (ex: ['hour'])
+            mask: Sélection booléenne des cellules (None = toutes)
+
+        Returns:
+            DataFrame keys + count, mean_delay, std_delay, median_delay, ci
+        """
+        agg, sketch = self._hourly_agg, self._hourly_sketch
+        if mask is not None:
+            mask = np.asarray(mask, dtype=bool)
+            agg, sketch = agg[mask], sketch[mask]
+
+        rollup, merged, _, _ = rollup_cells(agg, sketch, keys)
+        rollup['median_delay'] = sketch_quantile(merged, 0.5)
+        return rollup
+
+    def _build_geo_index(self):
+        # Grille sur l'échantillon: filtrage par zone visible de la carte
+        self._geo_index = GridIndex(self._geo_sample_cache['latitude'].to_numpy(),
+                                    self._geo_sample_cache['longitude'].to_numpy())
+
+    # ------------------------------------------------------------------
+    # Rafraîchissement incrémental (nouvelles lignes du collecteur)
+    # ------------------------------------------------------------------
+
+    def refreshed(self):
+        """
+        Nouveau DataLoader avec les lignes ajoutées au CSV depuis le dernier chargement
+
+        L'instance courante n'est pas modifiée (les callbacks peuvent la lire
+        pendant ce temps): seules les nouvelles lignes sont lues et nettoyées,
+        puis fusionnées dans des copies des agrégats, du cube et de
+        l'échantillon géographique.
+
+        Returns:
+            DataLoader mis à jour, ou None s'il n'y a rien de nouveau
+        """
+        if self._source_offset is None or not Path(self.data_path).exists():
+            return None
+        if Path(self.data_path).stat().st_size < self._source_offset:
+            # Fichier remplacé ou tronqué: rechargement complet
+            print(f"⚠️  {self.data_path} plus court que l'offset chargé, rechargement complet")
+            loader = DataLoader(self.data_path, self.aggregates_path, self.cache_dir)
+            loader.load_data()
+            loader.clean_data()
+            loader.version = self.version + 1
+            return loader
+        end = complete_size(self.data_path, self._source_offset)
+        if end <= self._source_offset:
+            return None
+
+        if self._csv_header is None:
+            with open(self.data_path, 'rb') as f:
+                self._csv_header = f.readline()
+        raw = read_csv_range(self.data_path, self._source_offset, end, self._csv_header)
+        new_clean = clean_frame(prepare_frame(raw))
+        return self._extended(new_clean, len(raw), end)
+
+    def _extended(self, new_clean, raw_rows, offset):
+        """Copie de ce DataLoader, étendue aux observations nettoyées `new_clean`"""
+        loader = DataLoader(self.data_path, self.aggregates_path, self.cache_dir)
+        loader.df_clean = concat_frames(self.df_clean, new_clean)
+        loader.df = loader.df_clean   # les lignes brutes ne sont pas gardées
+        loader._raw_rows = self._raw_rows + raw_rows
+        loader._source_offset = offset
+        loader._csv_header = self._csv_header
+        loader._from_cache = True
+        loader.version = self.version + 1
+
+        if len(new_clean):
+            loader._hourly_agg, loader._hourly_sketch = merge_hourly(
+                self._hourly_agg, self._hourly_sketch, *hourly_cells(new_clean))
+            cube = self._delay_cube
+            loader._delay_cube = DelayCube(cube.counts + DelayCube.from_frame(new_clean).counts,
+                                           cube.transport_types, cube.bin_seconds, cube.max_abs_seconds / 60)
+            loader._geo_sample_cache = reservoir_update(self._geo_sample_cache, len(self.df_clean), new_clean,
+                                                        seed=loader.version)
+        else:
+            loader._hourly_agg, loader._hourly_sketch = self._hourly_agg, self._hourly_sketch
+            loader._delay_cube = self._delay_cube
+            loader._geo_sample_cache = self._geo_sample_cache
+        loader._build_geo_index()
+        loader._line_stats_cache = {}
+        loader._heatmap_cache = {}
+        return loader
 
     def get_summary_stats(self):
         """Calcule les statistiques résumées"""
         if self.df_clean is None:
             raise ValueError("Les données doivent être nettoyées avant calcul des stats")
+        if self._summary_cache is not None:
+            return self._summary_cache
 
         stats = {
             'total_obs': len(self.df_clean),
@@ -140,6 +1150,7 @@ class DataLoader:
             'end_time': self.df_clean['timestamp'].max()
         }
 
+        self._summary_cache = stats
         return stats
 
     def get_line_stats(self, min_observations: int = 50):
@@ -160,19 +1171,15 @@ class DataLoader:
         if cache_key in self._line_stats_cache:
             return self._line_stats_cache[cache_key]
 
-        # Calculer depuis les agrégations horaires (plus rapide)
+        # Calculer depuis les agrégations horaires (moments et sketchs fusionnés)
         if self._hourly_agg is not None:
-            line_delays = self._hourly_agg.groupby('route_id').agg({
-                'mean_delay': 'mean',
-                'median_delay': 'mean',
-                'std_delay': 'mean',
-                'count': 'sum'
-            }).round(2)
+            line_delays = self._rollup(['route_id'])
+            line_delays = line_delays.set_index('route_id')[['mean_delay', 'median_delay', 'std_delay', 'count']].round(2)
             line_delays.columns = ['mean_delay', 'median_delay', 'std_delay', 'n_observations']
             line_delays = line_delays.reset_index()
         else:
             # Fallback si pas d'agrégations
-            line_delays = self.df_clean.groupby('route_id').agg({
+            line_delays = self.df_clean.groupby('route_id', observed=True).agg({
                 'delay_minutes': ['mean', 'median', 'std', 'count']
             }).round(2)
             line_delays.columns = ['mean_delay', 'median_delay', 'std_delay', 'n_observations']
@@ -202,27 +1209,19 @@ class DataLoader:
 
         # Utiliser les agrégations pré-calculées
         if self._hourly_agg is not None:
-            df_agg = self._hourly_agg.copy()
+            mask = np.ones(len(self._hourly_agg), dtype=bool)
 
             # Filtrer par type de transport
             if transport_types is not None and len(transport_types) > 0:
-                df_agg = df_agg[df_agg['transport_type'].isin(transport_types)]
+                mask &= self._hourly_agg['transport_type'].isin(transport_types).to_numpy()
 
             # Filtrer par heure
             if hours is not None and len(hours) > 0:
-                df_agg = df_agg[df_agg['hour'].isin(hours)]
-
-            # Agréger par heure (tous types de transport confondus)
-            hourly_delays = df_agg.groupby('hour').agg({
-                'mean_delay': lambda x: np.average(x, weights=df_agg.loc[x.index, 'count']),
-                'count': 'sum'
-            }).reset_index()
-
-            # Recalculer std et ci
-            hourly_delays['std_delay'] = df_agg.groupby('hour')['std_delay'].mean().values
-            hourly_delays['ci'] = 1.96 * hourly_delays['std_delay'] / np.sqrt(hourly_delays['count'])
+                mask &= self._hourly_agg['hour'].isin(hours).to_numpy()
 
-            return hourly_delays
+            # Agréger par heure (tous types de transport confondus): sommes des moments
+            hourly_delays = self._rollup(['hour'], mask)
+            return hourly_delays[['hour', 'mean_delay', 'count', 'std_delay', 'ci', 'median_delay']]
         else:
             # Fallback
             hourly_delays = self.df_clean.groupby('hour').agg({
@@ -253,15 +1252,10 @@ class DataLoader:
         if self._hourly_agg is not None:
             # Sélection des N lignes principales (par nombre d'observations)
             top_lines = self._hourly_agg.groupby('route_id')['count'].sum().nlargest(top_n_lines).index.tolist()
-            df_top = self._hourly_agg[self._hourly_agg['route_id'].isin(top_lines)]
+            df_top = self._rollup(['route_id', 'hour'], self._hourly_agg['route_id'].isin(top_lines))
 
-            # Créer une matrice ligne × heure
-            heatmap_data = df_top.pivot_table(
-                values='mean_delay',
-                index='route_id',
-                columns='hour',
-                aggfunc='mean'
-            )
+            # Créer une matrice ligne × heure (moyenne pondérée par les observations)
+            heatmap_data = df_top.pivot(index='route_id', columns='hour', values='mean_delay')
         else:
             # Fallback
             top_lines = self.df_clean['route_id'].value_counts().head(top_n_lines).index.tolist()
@@ -270,7 +1264,8 @@ class DataLoader:
                 values='delay_minutes',
                 index='route_id',
                 columns='hour',
-                aggfunc='mean'
+                aggfunc='mean',
+                observed=True
             )
 
         # Trier les lignes par retard moyen décroissant
@@ -287,35 +1282,92 @@ class DataLoader:
         if self.df_clean is None:
             raise ValueError("Les données doivent être nettoyées avant calcul")
 
-        comparison = self.df_clean.groupby('transport_type')['delay_minutes'].agg([
+        comparison = self.df_clean.groupby('transport_type', observed=True)['delay_minutes'].agg([
             'mean', 'median', 'std', 'count'
         ]).round(2)
 
         return comparison
 
-    def get_geo_sample(self, transport_types=None, hours=None):
+    def get_delay_distribution(self, transport_types=None, hours=None, by_type=False):
+        """
+        🚀 OPTIMISÉ: Distribution exacte des retards depuis le cube pré-calculé
+
+        Args:
+            transport_types: Liste des types de transport à inclure (None = tous)
+            hours: Liste des heures à inclure (None = toutes)
+            by_type: True pour une distribution par type de transport
+
+        Returns:
+            DelayDistribution, ou dictionnaire {type: DelayDistribution} si by_type
+        """
+        if self._delay_cube is None:
+            raise ValueError("Les données doivent être nettoyées avant calcul")
+        if by_type:
+            return self._delay_cube.select(transport_types, hours)
+        return self._delay_cube.total(transport_types, hours)
+
+    def get_geo_sample(self, transport_types=None, hours=None, bounds=None):
         """
         🚀 OPTIMISÉ: Retourne l'échantillon géographique pré-calculé (5k points)
 
         Args:
             transport_types: Liste des types de transport à inclure (None = tous)
             hours: Liste des heures à inclure (None = toutes)
+            bounds: Zone visible (lat_min, lat_max, lon_min, lon_max) de la carte (None = tout)
 
         Returns:
             DataFrame échantillonné et filtré
         """
         if self._geo_sample_cache is None:
             # Fallback: créer un échantillon à la volée
-            df_sample = self.df_clean.sample(n=min(5000, len(self.df_clean)), random_state=42)
+            df_sample = self.df_clean.sample(n=min(GEO_SAMPLE_SIZE, len(self.df_clean)), random_state=42)
+        elif bounds is not None and self._geo_index is not None:
+            # Seules les cellules de la grille qui touchent la zone sont parcourues
+            df_sample = self._geo_sample_cache.iloc[self._geo_index.query_bbox(*bounds)].copy()
         else:
             df_sample = self._geo_sample_cache.copy()
 
+        if bounds is not None and (self._geo_sample_cache is None or self._geo_index is None):
+            lat_min, lat_max, lon_min, lon_max = bounds
+            df_sample = df_sample[df_sample['latitude'].between(lat_min, lat_max)
+                                  & df_sample['longitude'].between(lon_min, lon_max)]
+
         # Filtrer
         if transport_types is not None and len(transport_types) > 0:
             df_sample = df_sample[df_sample['transport_type'].isin(transport_types)]
 
         return df_sample
 
+    def get_geo_bins(self, transport_types=None, bounds=None, zoom=MAP_DEFAULT_ZOOM):
+        """
+        Agrégats hexagonaux des retards pour la carte, sur toutes les observations
+
+        La taille des hexagones suit le zoom (HEX_RADIUS_PIXELS à l'écran): la
+        carte reçoit quelques centaines de cellules au lieu de milliers de points.
+
+        Args:
+            transport_types: Liste des types de transport à inclure (None = tous)
+            bounds: Zone à couvrir (lat_min, lat_max, lon_min, lon_max) (None = tout)
+            zoom: Niveau de zoom de la carte
+
+        Returns:
+            DataFrame latitude, longitude, count, mean_delay (un hexagone non vide par ligne)
+        """
+        df = self.df_clean
+        latitude = df['latitude'].to_numpy()
+        longitude = df['longitude'].to_numpy()
+        mask = np.ones(len(df), dtype=bool)
+        if transport_types is not None and len(transport_types) > 0:
+            mask &= df['transport_type'].isin(transport_types).to_numpy()
+        if bounds is not None:
+            lat_min, lat_max, lon_min, lon_max = bounds
+            mask &= (latitude >= lat_min) & (latitude <= lat_max) & (longitude >= lon_min) & (longitude <= lon_max)
+
+        # Latitude de référence fixe (centre de la zone de nettoyage): grille stable
+        ref_latitude = np.mean(CLEANING_PARAMS['latitude_range'])
+        return hex_bins(latitude[mask], longitude[mask], df['delay_minutes'].to_numpy()[mask],
+                        hex_radius(zoom, ref_latitude), ref_latitude)
+
     def get_filtered_data(self, route_ids=None, hours=None, transport_types=None, sample_size=None):
         """
         ⚠️ LEGACY: Filtre les données brutes (éviter si possible, utiliser les agrégations)
@@ -354,23 +1406,58 @@ class DataLoader:
 
 
 # Fonction utilitaire pour instancier et charger
-def load_transit_data(data_path: str = "../tp/data/transit_delays.csv"):
+def load_transit_data(data_path: str = "../tp/data/transit_delays.csv",
+                      aggregates_path: str = "../tp/data/delay_aggregates.json",
+                      cache_dir=DEFAULT_CACHE_DIR):
     """
     Charge et nettoie les données de transit
 
     Args:
         data_path: Chemin vers le fichier CSV
+        aggregates_path: Snapshot d'agrégats tenu à jour par le collecteur
+        cache_dir: Dossier du cache des données nettoyées (None = toujours relire le CSV)
 
     Returns:
         Tuple (DataLoader, DataFrame nettoyé)
     """
-    loader = DataLoader(data_path)
+    loader = DataLoader(data_path, aggregates_path, cache_dir)
     loader.load_data()
-    df_clean = loader.clean_data()
-    return loader, df_clean
+    loader.clean_data()
+    if loader._from_cache:
+        # Seules les lignes écrites par le collecteur depuis la mise en cache sont lues
+        grown = loader.refreshed()
+        if grown is not None:
+            print(f"✅ {len(grown.df_clean) - len(loader.df_clean):,} nouvelles observations depuis le cache")
+            grown.version = loader.version
+            loader = grown
+            loader._write_cache()
+    return loader, loader.df_clean
+
+
+def _legacy_frame(data_path):
+    """DataFrame tel que chargé avant le schéma compact (référence du rapport mémoire)"""
+    df = pd.read_csv(data_path, dtype={'route_id': object, 'vehicle_id': object,
+                                       'trip_id': object, 'stop_id': object})
+    df['timestamp'] = pd.to_datetime(df['timestamp'])
+    df['hour'] = df['timestamp'].dt.hour.astype('int64')
+    df['minute'] = df['timestamp'].dt.minute.astype('int64')
+    df['time_str'] = df['timestamp'].dt.strftime('%H:%M').astype(object)
+    df['delay_minutes'] = df['delay_seconds'] / 60
+    df['transport_type'] = df['route_type'].map(TRANSPORT_TYPES).astype(object)
+    return df
 
 
 if __name__ == "__main__":
+    if "--memory-report" in sys.argv:
+        # Empreinte mémoire: chargement historique vs schéma compact
+        path = next((a for a in sys.argv[1:] if not a.startswith("--")), "../tp/data/transit_delays.csv")
+        compact = DataLoader(path, None, cache_dir=None).load_data()
+        report = memory_report(_legacy_frame(path), compact)
+        print(f"\n🧠 MÉMOIRE ({len(compact):,} lignes)")
+        print("=" * 60)
+        print(report.to_string())
+        sys.exit(0)
+
     # Test du module
     loader, df = load_transit_data()
     stats = loader.get_summary_stats()
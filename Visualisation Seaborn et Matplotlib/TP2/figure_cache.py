@@ -0,0 +1,97 @@
+"""
+Cache LRU des figures Plotly du dashboard, côté serveur
+
+Chaque figure est mémorisée sous son nom et les seules valeurs de filtres
+dont elle dépend: changer le nombre de lignes du hit-parade ne reconstruit
+ni la heatmap ni la carte. Le cache est borné en nombre d'entrées et en
+taille (JSON de la figure, soit à peu près ce qui part vers le navigateur).
+"""
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_MAX_BYTES = 64 * 1024 ** 2
+
+
+def figure_size(fig):
+    """Taille (octets) de la figure sérialisée en JSON"""
+    return len(fig.to_json())
+
+
+class FigureCache:
+    """Figures mémorisées par (nom, clé de filtres), éviction LRU"""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, max_bytes: int = DEFAULT_MAX_BYTES):
+        """
+        Args:
+            max_entries: Nombre maximal de figures gardées
+            max_bytes: Taille cumulée maximale (JSON) des figures gardées
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()   # (nom, clé) -> (figure, taille)
+        self._bytes = 0
+        self._lock = threading.Lock()   # callbacks servis par plusieurs threads
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'build_s': 0.0}
+
+    def get_or_build(self, name, key, build, refresh=False):
+        """
+        Figure en cache, ou construite par build() puis mémorisée
+
+        Args:
+            name: Nom du graphique
+            key: Tuple hachable des valeurs de filtres dont la figure dépend
+            build: Fonction sans argument qui construit la figure
+            refresh: True pour reconstruire même si la figure est en cache
+
+        Returns:
+            Figure Plotly
+        """
+        cache_key = (name, key)
+        with self._lock:
+            if not refresh and cache_key in self._entries:
+                self._entries.move_to_end(cache_key)
+                self._stats['hits'] += 1
+                return self._entries[cache_key][0]
+            self._stats['misses'] += 1
+
+        # Construction hors du verrou: les autres graphiques ne l'attendent pas
+        start = time.perf_counter()
+        fig = build()
+        size = figure_size(fig)
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            self._stats['build_s'] += elapsed
+            previous = self._entries.pop(cache_key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            if size <= self.max_bytes:
+                self._entries[cache_key] = (fig, size)
+                self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self._stats['evictions'] += 1
+        return fig
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Compteurs (hits, misses, évictions, temps de construction) et occupation"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._bytes
+            by_name = {}
+            for (name, _), (_, size) in self._entries.items():
+                count, total = by_name.get(name, (0, 0))
+                by_name[name] = (count + 1, total + size)
+        stats['by_figure'] = by_name
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
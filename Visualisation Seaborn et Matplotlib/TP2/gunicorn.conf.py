@@ -0,0 +1,34 @@
+"""
+Configuration gunicorn du dashboard (déploiement multi-workers)
+
+Le processus maître construit le store partagé une seule fois (dans un
+sous-processus, pour ne pas garder le DataFrame en mémoire), puis chaque
+worker s'y attache en lecture seule via TRANSIT_STORE.
+
+Usage:
+    gunicorn -c gunicorn.conf.py app:server
+    WEB_CONCURRENCY=8 TRANSIT_DATA=/data/transit_delays.csv gunicorn -c gunicorn.conf.py app:server
+"""
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+
+bind = os.environ.get("BIND", "127.0.0.1:8050")
+workers = int(os.environ.get("WEB_CONCURRENCY", 4))
+threads = int(os.environ.get("GUNICORN_THREADS", 2))
+timeout = 120
+
+STORE_DIR = os.environ.setdefault("TRANSIT_STORE", str(HERE / "store"))
+DATA_PATH = os.environ.get("TRANSIT_DATA", "../tp/data/transit_delays.csv")
+AGGREGATES_PATH = os.environ.get("TRANSIT_AGGREGATES", "../tp/data/delay_aggregates.json")
+
+
+def on_starting(server):
+    """Store à jour avant le démarrage des workers (reconstruit si le CSV a changé)"""
+    server.log.info(f"Préparation du store partagé {STORE_DIR}")
+    subprocess.run([sys.executable, str(HERE / "shared_store.py"), "build", "--store", STORE_DIR,
+                    "--data", DATA_PATH, "--aggregates", AGGREGATES_PATH],
+                   cwd=os.getcwd(), check=True)
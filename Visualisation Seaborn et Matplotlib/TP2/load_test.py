@@ -0,0 +1,151 @@
+"""
+Test de charge du dashboard: utilisateurs simultanés qui changent les filtres
+
+Chaque utilisateur virtuel charge la page, puis enchaîne des changements de
+filtre tirés au hasard; pour chacun il déclenche, comme le navigateur, tous
+les callbacks qui écoutent le filtre modifié. Le rapport donne latences
+(médiane, p95, max) par graphique et débit global, et, avec --server-pid,
+la mémoire (PSS) du serveur et de ses workers.
+
+Usage:
+    TRANSIT_STORE=store gunicorn -c gunicorn.conf.py app:server &
+    python load_test.py --users 20 --duration 60 --server-pid $(pgrep -f 'gunicorn: master' | head -1)
+"""
+import argparse
+import random
+import statistics
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+
+TRANSPORT_CHOICES = [['Bus', 'Tram'], ['Bus'], ['Tram']]
+TOP_LINES_CHOICES = [5, 10, 15, 20, 25, 30]
+MAP_MODE_CHOICES = ['hexbin', 'points']
+
+
+def random_change(rng, state):
+    """Modifie un filtre au hasard; retourne l'identifiant du composant changé"""
+    component = rng.choice(['transport-filter', 'hour-filter', 'top-lines-filter', 'map-render-mode'])
+    if component == 'transport-filter':
+        state[component] = rng.choice(TRANSPORT_CHOICES)
+    elif component == 'hour-filter':
+        start = rng.randrange(0, 23)
+        state[component] = [start, rng.randrange(start + 1, 24)]
+    elif component == 'top-lines-filter':
+        state[component] = rng.choice(TOP_LINES_CHOICES)
+    else:
+        state[component] = rng.choice(MAP_MODE_CHOICES)
+    return component
+
+
+def callback_payload(callback, state):
+    """Requête /_dash-update-component d'un callback (une seule sortie)"""
+    component, prop = callback['output'].rsplit('.', 1)
+    return {
+        'output': callback['output'],
+        'outputs': {'id': component, 'property': prop},
+        'inputs': [dict(i, value=state[i['id']]) for i in callback['inputs']],
+        'changedPropIds': [],
+        'state': [dict(s, value=state[s['id']]) for s in callback.get('state', [])],
+    }
+
+
+def virtual_user(base_url, callbacks, deadline, seed, latencies, errors, lock):
+    rng = random.Random(seed)
+    state = {'transport-filter': ['Bus', 'Tram'], 'hour-filter': [0, 23],
+             'top-lines-filter': 15, 'map-render-mode': 'hexbin', 'graph-map': None,
+             'refresh-button': 0, 'data-poll': 0, 'data-version': None}
+    with requests.Session() as session:
+        session.get(base_url + '/', timeout=30)
+        changed = None   # premier passage: tous les graphiques, comme au chargement de la page
+        while time.perf_counter() < deadline:
+            for callback in callbacks:
+                if changed is not None and changed not in {i['id'] for i in callback['inputs']}:
+                    continue
+                payload = callback_payload(callback, state)
+                if changed is not None:
+                    payload['changedPropIds'] = [f"{changed}.value"]
+                start = time.perf_counter()
+                try:
+                    response = session.post(base_url + '/_dash-update-component', json=payload, timeout=60)
+                    ok = response.status_code == 200
+                except requests.RequestException:
+                    ok = False
+                elapsed = time.perf_counter() - start
+                with lock:
+                    if ok:
+                        latencies[callback['output'].split('.')[0]].append(elapsed)
+                    else:
+                        errors[callback['output'].split('.')[0]] += 1
+            changed = random_change(rng, state)
+
+
+def process_memory(pid):
+    """PSS (Mo) d'un processus et de ses enfants directs, depuis /proc (Linux)"""
+    def pss(p):
+        try:
+            with open(f'/proc/{p}/smaps_rollup') as f:
+                return next(int(line.split()[1]) for line in f if line.startswith('Pss:')) / 1024
+        except (OSError, StopIteration):
+            return 0.0
+
+    children = []
+    for task in Path(f'/proc/{pid}/task').glob('*'):
+        try:
+            children += [int(c) for c in (task / 'children').read_text().split()]
+        except OSError:
+            pass
+    return pss(pid), {child: pss(child) for child in children}
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Test de charge du dashboard Dash")
+    parser.add_argument('--url', default='http://127.0.0.1:8050')
+    parser.add_argument('--users', type=int, default=10, help="Utilisateurs simultanés")
+    parser.add_argument('--duration', type=float, default=30, help="Durée du test (secondes)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--server-pid', type=int, help="PID du serveur (maître gunicorn) pour le rapport mémoire")
+    args = parser.parse_args(argv)
+
+    base_url = args.url.rstrip('/')
+    callbacks = [c for c in requests.get(base_url + '/_dash-dependencies', timeout=30).json()
+                 if not c['output'].startswith('..')]   # une sortie par callback
+
+    print(f"🚦 {args.users} utilisateurs pendant {args.duration:g}s sur {base_url} ({len(callbacks)} callbacks)")
+    latencies, errors, lock = defaultdict(list), defaultdict(int), threading.Lock()
+    start = time.perf_counter()
+    deadline = start + args.duration
+    with ThreadPoolExecutor(max_workers=args.users) as pool:
+        futures = [pool.submit(virtual_user, base_url, callbacks, deadline, args.seed + i, latencies, errors, lock)
+                   for i in range(args.users)]
+        for future in futures:
+            future.result()
+    elapsed = time.perf_counter() - start
+
+    total = sum(len(v) for v in latencies.values())
+    print(f"\n{'graphique':22} {'requêtes':>9} {'médiane':>9} {'p95':>9} {'max':>9} {'erreurs':>8}")
+    for name in sorted(set(latencies) | set(errors)):
+        values = latencies.get(name) or [float('nan')]
+        print(f"{name:22} {len(latencies.get(name, [])):9,} {statistics.median(values) * 1000:7.0f}ms "
+              f"{percentile(values, 0.95) * 1000:7.0f}ms {max(values) * 1000:7.0f}ms {errors.get(name, 0):8}")
+    all_values = [v for values in latencies.values() for v in values] or [float('nan')]
+    print(f"\n⚡ {total:,} requêtes en {elapsed:.1f}s: {total / elapsed:.1f} req/s, "
+          f"p95 {percentile(all_values, 0.95) * 1000:.0f}ms, {sum(errors.values())} erreurs")
+
+    if args.server_pid:
+        master, workers = process_memory(args.server_pid)
+        print(f"🧠 Mémoire (PSS): serveur {master:.0f} Mo, {len(workers)} workers "
+              f"{sum(workers.values()):.0f} Mo ({', '.join(f'{m:.0f}' for m in workers.values())})")
+
+
+if __name__ == '__main__':
+    main()
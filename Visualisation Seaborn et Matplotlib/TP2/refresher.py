@@ -0,0 +1,128 @@
+"""
+Rafraîchissement des données du dashboard en arrière-plan
+
+Un thread suit la sortie du collecteur et remplace le DataLoader servi par
+les callbacks, sans redémarrer l'application:
+- mode CSV: seules les lignes ajoutées depuis le dernier offset sont lues,
+  nettoyées et fusionnées dans des copies des agrégats (DataLoader.refreshed)
+- mode store (shared_store.py, multi-workers): le worker se rattache à la
+  nouvelle génération dès que CURRENT change
+
+Le nouveau DataLoader est construit à côté de l'ancien puis échangé d'une
+seule affectation: un callback en cours garde l'instance qu'il a lue, aucun
+n'attend le rechargement.
+
+Usage (store multi-workers tenu à jour par un seul processus):
+    python refresher.py --store store/ --interval 30
+"""
+import argparse
+import threading
+import time
+from pathlib import Path
+
+from data_loader import load_transit_data
+from shared_store import current_generation, open_store, read_manifest, write_store
+
+DEFAULT_INTERVAL = 30   # secondes entre deux vérifications
+
+
+class LiveData:
+    """Référence vers le DataLoader courant, remplacée atomiquement à chaque rafraîchissement"""
+
+    def __init__(self, loader):
+        self._loader = loader
+
+    @property
+    def loader(self):
+        return self._loader
+
+    def swap(self, loader):
+        self._loader = loader   # une affectation: les lecteurs voient l'ancien ou le nouveau, jamais un mélange
+
+
+class DataRefresher(threading.Thread):
+    """Thread qui vérifie périodiquement la présence de nouvelles données"""
+
+    def __init__(self, live, interval=DEFAULT_INTERVAL, store_dir=None):
+        """
+        Args:
+            live: LiveData partagé avec les callbacks
+            interval: Secondes entre deux vérifications
+            store_dir: Store partagé à suivre (None = suivre le CSV du DataLoader)
+        """
+        super().__init__(name="data-refresher", daemon=True)
+        self.live = live
+        self.interval = interval
+        self.store_dir = Path(store_dir) if store_dir else None
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self.last_error = None
+
+    def request_refresh(self):
+        """Vérification immédiate (bouton Rafraîchir), sans attendre le résultat"""
+        self._wake.set()
+
+    def stop(self):
+        self._stopping.set()
+        self._wake.set()
+
+    def run(self):
+        while not self._stopping.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stopping.is_set():
+                break
+            try:
+                self.refresh_once()
+                self.last_error = None
+            except Exception as e:   # le thread ne doit pas mourir sur un CSV en cours d'écriture
+                self.last_error = e
+                print(f"⚠️  Rafraîchissement impossible: {e}")
+
+    def refresh_once(self):
+        """Construit puis installe le nouveau DataLoader; retourne True s'il y en avait un"""
+        start = time.time()
+        current = self.live.loader
+        if self.store_dir is not None:
+            generation = current_generation(self.store_dir)
+            loader = open_store(self.store_dir, generation) if generation not in (None, current.store_generation) else None
+        else:
+            loader = current.refreshed()
+        if loader is None:
+            return False
+
+        # Caches réchauffés avant l'échange: le premier callback n'attend pas
+        loader.get_summary_stats()
+        loader.get_line_stats(min_observations=50)
+        self.live.swap(loader)
+        added = len(loader.df_clean) - len(current.df_clean)
+        print(f"🔄 Données rafraîchies en {time.time() - start:.2f}s: {added:+,} observations "
+              f"({len(loader.df_clean):,} au total, version {loader.version})")
+        return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tient le store partagé à jour depuis le CSV du collecteur")
+    parser.add_argument("--data", default="../tp/data/transit_delays.csv")
+    parser.add_argument("--aggregates", default="../tp/data/delay_aggregates.json")
+    parser.add_argument("--store", default="store")
+    parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL)
+    args = parser.parse_args(argv)
+
+    live = LiveData(load_transit_data(args.data, args.aggregates)[0])
+    manifest = read_manifest(args.store)
+    if manifest is None or manifest['rows'] != len(live.loader.df_clean):
+        write_store(live.loader, args.store)
+    refresher = DataRefresher(live, args.interval)
+    try:
+        while True:
+            time.sleep(args.interval)
+            # Une nouvelle génération seulement s'il y a eu des lignes nouvelles
+            if refresher.refresh_once():
+                write_store(live.loader, args.store)
+    except KeyboardInterrupt:
+        print("⛔ Arrêt demandé")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Coût de chaque graphique du dashboard, côté serveur et côté navigateur
+
+Pour chaque graphique (et chaque mode de rendu de la carte): temps de
+construction de la figure, taille de la réponse envoyée au navigateur (JSON
+et gzip), nombre de valeurs tracées et, si kaleido est installé, temps de
+rendu par plotly.js dans un navigateur headless (carte sans fond de tuiles,
+pour ne pas mesurer le réseau).
+
+Les variantes "brut 10k" reprennent l'ancien rendu (violon et boîtes
+calculés par plotly.js sur 10k observations tirées au hasard) comme référence.
+
+Usage:
+    python render_report.py
+    TRANSIT_STORE=store python render_report.py --repeat 5
+"""
+import argparse
+import base64
+import gzip
+import os
+import statistics
+import time
+
+import numpy as np
+import plotly.express as px
+import plotly.graph_objects as go
+
+os.environ.setdefault('TRANSIT_REFRESH_SECONDS', '0')   # pas de thread de rafraîchissement pour une mesure
+import app  # noqa: E402  (charge les données comme le dashboard)
+
+ALL_TYPES = ['Bus', 'Tram']
+ALL_HOURS = [0, 23]
+
+
+def plotted_values(node):
+    """Nombre de valeurs des tableaux des traces (points, classes, coordonnées)"""
+    if isinstance(node, dict):
+        if 'bdata' in node:   # tableau numpy encodé en base64 (plotly >= 6)
+            return len(base64.b64decode(node['bdata'])) // np.dtype(node['dtype']).itemsize
+        return sum(plotted_values(v) for v in node.values())
+    if isinstance(node, np.ndarray):
+        return node.size
+    if isinstance(node, (list, tuple)):
+        return len(node) if node and not isinstance(node[0], (dict, list, tuple)) else \
+            sum(plotted_values(v) for v in node)
+    return 0
+
+
+def raw_violin(loader):
+    """Ancien violon: densité calculée par plotly.js sur un échantillon de 10k observations"""
+    df_sample = loader.get_filtered_data(transport_types=ALL_TYPES, sample_size=10000)
+    fig = go.Figure(go.Violin(y=df_sample['delay_minutes'], name='Retards', box_visible=True,
+                              meanline_visible=True, fillcolor='lightblue', opacity=0.6, line_color='black'))
+    return fig.update_layout(template='plotly_white', showlegend=False)
+
+
+def raw_box(loader):
+    """Ancienne boîte à moustaches: quartiles et points extrêmes calculés dans le navigateur"""
+    df_sample = loader.get_filtered_data(transport_types=ALL_TYPES, sample_size=10000)
+    fig = px.box(df_sample, x='transport_type', y='delay_minutes', color='transport_type',
+                 color_discrete_map=app.TRANSPORT_COLORS)
+    return fig.update_layout(template='plotly_white', showlegend=False)
+
+
+def panels(loader):
+    """(graphique, mode, fonction de construction) de chaque figure mesurée"""
+    geo = loader.get_geo_sample()
+    center = {'lat': float(geo['latitude'].mean()), 'lon': float(geo['longitude'].mean())}
+    street = app.map_view({'map.zoom': 14, 'map.center': center})
+    return [
+        ('distribution', 'cube', lambda: app.build_distribution(loader, ALL_TYPES, ALL_HOURS)),
+        ('violin', 'kde', lambda: app.build_violin(loader, ALL_TYPES, ALL_HOURS)),
+        ('violin', 'brut 10k', lambda: raw_violin(loader)),
+        ('hit_parade', 'agrégats', lambda: app.build_hit_parade(loader, 15)),
+        ('hourly', 'agrégats', lambda: app.build_hourly(loader, ALL_TYPES, ALL_HOURS)),
+        ('heatmap', 'agrégats', lambda: app.build_heatmap(loader)),
+        ('boxplot', 'stats', lambda: app.build_type_comparison(loader, 'box', ALL_TYPES, ALL_HOURS)),
+        ('boxplot', 'brut 10k', lambda: raw_box(loader)),
+        ('violin_compare', 'kde', lambda: app.build_type_comparison(loader, 'violin', ALL_TYPES, ALL_HOURS)),
+        ('map', 'hexbin z11', lambda: app.build_map(loader, ALL_TYPES, 'hexbin')),
+        ('map', 'points z11', lambda: app.build_map(loader, ALL_TYPES, 'points')),
+        ('map', 'hexbin z14', lambda: app.build_map(loader, ALL_TYPES, 'hexbin', street)),
+        ('map', 'points z14', lambda: app.build_map(loader, ALL_TYPES, 'points', street)),
+    ]
+
+
+def renderer_error():
+    """None si kaleido peut rendre une figure, sinon la raison (paquet ou navigateur absent)"""
+    try:
+        import kaleido  # noqa: F401
+    except ImportError:
+        return 'pip install "kaleido>=1.0" (voir README, « Coût de rendu des graphiques »)'
+    try:
+        go.Figure().to_image(format='png')   # démarre le navigateur headless
+    except Exception as e:
+        return (f"kaleido ne peut pas démarrer de navigateur ({type(e).__name__}) : "
+                f"lancer plotly_get_chrome ou indiquer Chrome dans BROWSER_PATH (voir README)")
+    return None
+
+
+def render_time(fig, repeat):
+    """Temps médian (s) de rendu de la figure par plotly.js (kaleido)"""
+    fig = go.Figure(fig)
+    if any(trace.type == 'scattermap' for trace in fig.data):
+        fig.update_layout(map_style='white-bg')   # pas de tuiles: on mesure le tracé, pas le réseau
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fig.to_image(format='png', width=1000, height=600)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Taille et temps de rendu de chaque graphique du dashboard")
+    parser.add_argument('--repeat', type=int, default=3, help="Mesures par figure (médiane)")
+    args = parser.parse_args(argv)
+
+    loader = app.live.loader
+    render_error = renderer_error()
+    print(f"\n{'graphique':16} {'mode':11} {'construction':>12} {'JSON':>9} {'gzip':>9} "
+          f"{'valeurs':>9} {'rendu':>9}")
+    for name, mode, build in panels(loader):
+        build_times = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            fig = build()
+            build_times.append(time.perf_counter() - start)
+        payload = fig.to_json().encode('utf-8')
+        render = render_time(fig, args.repeat) if render_error is None else None
+        print(f"{name:16} {mode:11} {statistics.median(build_times) * 1000:10.0f}ms "
+              f"{len(payload) / 1024:7.0f}Ko {len(gzip.compress(payload)) / 1024:7.0f}Ko "
+              f"{plotted_values(fig.to_plotly_json()['data']):9,} "
+              + (f"{render * 1000:7.0f}ms" if render is not None else f"{'n/a':>9}"))
+    if render_error is not None:
+        print(f"\n💡 Temps de rendu navigateur non mesuré: {render_error}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+"""
+Store partagé du dashboard pour un déploiement multi-workers
+
+Le jeu de données nettoyé et ses agrégats sont écrits une seule fois sur
+disque, puis chaque worker (gunicorn) s'y attache en lecture seule par
+memory-map: les pages sont partagées par le cache du système, au lieu
+d'une copie complète du DataFrame et d'un pré-calcul par worker.
+
+    store/
+    ├── CURRENT                 # nom de la génération active
+    └── <génération>/
+        ├── manifest.json       # source, empreinte du CSV, paramètres, tailles
+        ├── observations.arrow  # df_clean (Arrow IPC, un seul bloc: lecture sans copie)
+        ├── hourly_agg.arrow    # agrégats ligne × heure × type (moments)
+        ├── geo_sample.arrow    # échantillon de la carte
+        ├── hourly_sketch.npy   # sketchs des agrégats horaires
+        └── delay_cube.npy      # cube type × heure × retard
+
+Usage:
+    python shared_store.py build --store store/      # une fois (ou via gunicorn.conf.py)
+    TRANSIT_STORE=store/ gunicorn -c gunicorn.conf.py app:server
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from data_loader import (CLEANING_PARAMS, DelayCube, DataLoader, file_digest,
+                         load_transit_data, read_arrow_table, write_arrow_table)
+from spatial_index import GridIndex
+
+STORE_VERSION = 2
+CURRENT_FILE = "CURRENT"
+KEEP_GENERATIONS = 2   # la génération précédente reste lisible pour les workers pas encore rattachés
+
+
+def current_generation(store_dir):
+    """Nom de la génération active du store, ou None s'il n'y en a pas"""
+    try:
+        generation = (Path(store_dir) / CURRENT_FILE).read_text(encoding='utf-8').strip()
+    except OSError:
+        return None
+    return generation if (Path(store_dir) / generation / "manifest.json").exists() else None
+
+
+def read_manifest(store_dir, generation=None):
+    generation = generation or current_generation(store_dir)
+    if generation is None:
+        return None
+    with open(Path(store_dir) / generation / "manifest.json", 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_store(loader, store_dir, keep=KEEP_GENERATIONS):
+    """
+    Écrit une nouvelle génération du store depuis un DataLoader nettoyé, puis l'active
+
+    La génération est écrite dans un dossier temporaire, renommée, puis
+    CURRENT est remplacé atomiquement: un worker ne voit jamais de store partiel.
+
+    Returns:
+        Nom de la génération écrite
+    """
+    if loader.df_clean is None or loader._delay_cube is None:
+        raise ValueError("Les données doivent être nettoyées avant écriture du store")
+
+    store_dir = Path(store_dir)
+    store_dir.mkdir(parents=True, exist_ok=True)
+    generation = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+    tmp = store_dir / f".tmp-{generation}"
+    tmp.mkdir()
+
+    start = time.time()
+    write_arrow_table(loader.df_clean, tmp / "observations.arrow")
+    write_arrow_table(loader._hourly_agg, tmp / "hourly_agg.arrow")
+    write_arrow_table(loader._geo_sample_cache, tmp / "geo_sample.arrow")
+    np.save(tmp / "hourly_sketch.npy", loader._hourly_sketch)
+    np.save(tmp / "delay_cube.npy", loader._delay_cube.counts)
+
+    cube = loader._delay_cube
+    source = Path(loader.data_path)
+    manifest = {
+        'version': STORE_VERSION,
+        'generation': generation,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'source': str(source.resolve()) if source.exists() else str(source),
+        'source_digest': file_digest(source) if source.exists() else None,
+        'params': CLEANING_PARAMS,
+        'rows': len(loader.df_clean),
+        'raw_rows': loader._raw_rows,
+        'delay_cube': {'transport_types': cube.transport_types, 'bin_seconds': cube.bin_seconds,
+                       'max_abs_minutes': cube.max_abs_seconds / 60},
+    }
+    with open(tmp / "manifest.json", 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.rename(tmp, store_dir / generation)
+
+    current_tmp = store_dir / f".{CURRENT_FILE}.tmp"
+    current_tmp.write_text(generation, encoding='utf-8')
+    os.replace(current_tmp, store_dir / CURRENT_FILE)
+
+    # Les fichiers encore mappés par un worker restent lisibles après suppression (POSIX)
+    generations = sorted(p for p in store_dir.iterdir() if p.is_dir() and not p.name.startswith('.'))
+    for old in generations[:-keep] if keep else []:
+        shutil.rmtree(old, ignore_errors=True)
+
+    size = sum(f.stat().st_size for f in (store_dir / generation).iterdir())
+    print(f"💾 Store {generation} écrit en {time.time() - start:.2f}s ({size / 1024 ** 2:.0f} Mo)")
+    return generation
+
+
+def open_store(store_dir, generation=None):
+    """
+    DataLoader attaché en lecture seule à une génération du store (la courante par défaut)
+
+    Aucun nettoyage ni pré-calcul: les agrégats sont lus tels quels, et les
+    grandes tables restent dans les pages partagées du fichier mappé.
+    """
+    store_dir = Path(store_dir)
+    generation = generation or current_generation(store_dir)
+    if generation is None:
+        raise FileNotFoundError(f"Aucun store dans {store_dir} (python shared_store.py build --store {store_dir})")
+    path = store_dir / generation
+    manifest = read_manifest(store_dir, generation)
+    if manifest['version'] != STORE_VERSION:
+        raise ValueError(f"Version de store non supportée: {manifest['version']}")
+
+    start = time.time()
+    loader = DataLoader(manifest['source'], None, cache_dir=None)
+    loader.df_clean = read_arrow_table(path / "observations.arrow")
+    loader.df = loader.df_clean
+    loader._raw_rows = manifest['raw_rows']
+    loader._from_cache = True
+
+    # Mêmes attributs que _precompute_aggregates
+    loader._hourly_agg = read_arrow_table(path / "hourly_agg.arrow")
+    loader._hourly_sketch = np.load(path / "hourly_sketch.npy", mmap_mode='r')
+    cube = manifest['delay_cube']
+    loader._delay_cube = DelayCube(np.load(path / "delay_cube.npy", mmap_mode='r'), cube['transport_types'],
+                                   cube['bin_seconds'], cube['max_abs_minutes'])
+    loader._geo_sample_cache = read_arrow_table(path / "geo_sample.arrow")
+    loader._geo_index = GridIndex(loader._geo_sample_cache['latitude'].to_numpy(),
+                                  loader._geo_sample_cache['longitude'].to_numpy())
+    loader._line_stats_cache = {}
+    loader._heatmap_cache = {}
+    loader.store_generation = generation
+    loader.version = generation
+
+    print(f"🔗 Store {generation} attaché en {time.time() - start:.2f}s "
+          f"({len(loader.df_clean):,} observations, pid {os.getpid()})")
+    return loader
+
+
+def ensure_store(store_dir, data_path, aggregates_path=None):
+    """
+    Construit le store s'il n'existe pas ou si le CSV a changé depuis
+
+    Returns:
+        Nom de la génération active
+    """
+    manifest = read_manifest(store_dir)
+    if manifest is not None and manifest['version'] == STORE_VERSION and manifest['params'] == CLEANING_PARAMS:
+        if Path(data_path).exists() and manifest['source_digest'] == file_digest(data_path):
+            print(f"✅ Store {manifest['generation']} à jour ({manifest['rows']:,} observations)")
+            return manifest['generation']
+    loader, _ = load_transit_data(data_path, aggregates_path)
+    return write_store(loader, store_dir)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Store partagé (Arrow mappé en mémoire) du dashboard")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="Construire le store s'il est absent ou périmé")
+    build.add_argument("--data", default="../tp/data/transit_delays.csv")
+    build.add_argument("--aggregates", default="../tp/data/delay_aggregates.json")
+    build.add_argument("--store", default="store")
+    build.add_argument("--force", action="store_true", help="Reconstruire même si le store est à jour")
+    info = sub.add_parser("info", help="Afficher le manifeste de la génération active")
+    info.add_argument("--store", default="store")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        if args.force:
+            loader, _ = load_transit_data(args.data, args.aggregates)
+            write_store(loader, args.store)
+        else:
+            ensure_store(args.store, args.data, args.aggregates)
+    else:
+        manifest = read_manifest(args.store)
+        if manifest is None:
+            print(f"❌ Aucun store dans {args.store}")
+            sys.exit(1)
+        print(json.dumps(manifest, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+../TP/spatial_index.py
\ No newline at end of file
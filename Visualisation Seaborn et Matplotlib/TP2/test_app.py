@@ -44,10 +44,52 @@ try:
     )
     print(f"   ✅ {len(df_filtered):,} observations après filtrage")
 
+    distribution = loader.get_delay_distribution(hours=[8, 9, 10], transport_types=['Bus'])
+    assert distribution.count == len(df_filtered), "Le cube des retards doit couvrir toutes les observations"
+    print(f"   ✅ Cube des retards: médiane exacte {distribution.quantile(0.5):.2f} min")
+
     print("\n🧪 Test 7: Création d'un graphique Plotly...")
     fig = px.histogram(df_clean.sample(1000), x='delay_minutes', nbins=50)
     print("   ✅ Graphique Plotly créé avec succès")
 
+    print("\n🧪 Test 8: Type de transport inconnu (route_type 715, transport à la demande)...")
+    import tempfile
+    from pathlib import Path
+    from data_loader import DataLoader
+    with tempfile.TemporaryDirectory() as tmp:
+        df_raw = pd.read_csv(loader.data_path, nrows=1000)
+        df_raw.loc[df_raw.index[::10], 'route_type'] = 715
+        df_raw['delay_seconds'] = df_raw['delay_seconds'].astype(float)
+        df_raw.loc[df_raw.index[5], 'delay_seconds'] = np.nan   # cellule vide: ligne supprimée au nettoyage
+        csv_path = Path(tmp) / "transit_delays.csv"
+        df_raw.to_csv(csv_path, index=False)
+        for run in ("CSV", "cache"):   # 2e chargement: relu depuis le cache Arrow
+            unknown = DataLoader(str(csv_path), None, cache_dir=Path(tmp) / "cache")
+            unknown.load_data()
+            unknown.clean_data()
+            assert unknown._from_cache == (run == "cache"), f"Chargement {run} attendu"
+            typed = int(unknown.df_clean['transport_type'].notna().sum())
+            assert (unknown.df_clean['route_type'] == 715).sum() == 100, "route_type 715 doit être lu sans débordement"
+            assert len(unknown.df_clean) - typed == 100, f"Type inconnu perdu ({run}): lu comme un autre type"
+            assert int(unknown._hourly_sketch.sum()) == typed == int(unknown._hourly_agg['count'].sum()), \
+                "Les lignes de type inconnu ne doivent pas entrer dans les agrégats horaires"
+            buses = unknown.get_filtered_data(transport_types=['Bus'])
+            assert unknown.get_delay_distribution(transport_types=['Bus']).count == len(buses), \
+                f"Filtre 'Bus' et cube des retards doivent compter les mêmes lignes ({run})"
+        print(f"   ✅ {len(unknown.df_clean) - typed} observations de type inconnu ignorées par les agrégats (CSV et cache)")
+
+        print("\n🧪 Test 9: Store partagé (write_store puis open_store, comme un worker gunicorn)...")
+        from shared_store import open_store, write_store
+        write_store(unknown, Path(tmp) / "store")
+        worker = open_store(Path(tmp) / "store")
+        assert worker.df_clean['transport_type'].isna().sum() == 100, "Type inconnu perdu dans le store partagé"
+        for name in ('get_geo_bins', 'get_geo_sample', 'get_filtered_data'):
+            fresh = getattr(unknown, name)(transport_types=['Bus'])
+            stored = getattr(worker, name)(transport_types=['Bus'])
+            count = (lambda df: int(df['count'].sum())) if name == 'get_geo_bins' else len
+            assert count(stored) == count(fresh), f"{name}(['Bus']) diffère entre le store et un chargement direct"
+        print(f"   ✅ {len(worker.df_clean):,} observations relues par le worker, filtres identiques")
+
     print("\n" + "=" * 60)
     print("✅ TOUS LES TESTS SONT PASSÉS!")
     print("=" * 60)